@@ -1,22 +1,48 @@
 import logging
 import os
 import json
+import csv
 import base64
 import re
 import asyncio
 import hashlib
 import socket
+import sqlite3
+import threading
+import multiprocessing
+import signal
 import contextlib
-from typing import Optional
-from collections import defaultdict
-from time import time
-from enum import Enum
+import importlib.util
+import inspect
+import random
+import heapq
+import itertools
+import struct
+import html
+import hmac
+import secrets
+from html.parser import HTMLParser
+from typing import NamedTuple, Optional, Protocol
+from urllib.parse import quote
+from collections import OrderedDict, defaultdict, deque
+from queue import Empty
+from types import MappingProxyType
+from time import time, monotonic
+from enum import Enum, IntEnum
 from dotenv import load_dotenv
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler
+from telegram.constants import ParseMode
+from telegram.error import Forbidden, RetryAfter
+from telegram.ext import (
+    Application, BasePersistence, BaseRateLimiter, BaseUpdateProcessor, CommandHandler, MessageHandler,
+    ApplicationHandlerStop, PersistenceInput, TypeHandler, filters, ContextTypes, ConversationHandler
+)
 import gspread
+import httpx
+import requests
+import google.auth.transport.requests
 from google.oauth2.service_account import Credentials
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 # Load environment variables
 load_dotenv()
@@ -38,17 +64,29 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("telegram").setLevel(logging.INFO)
 logging.getLogger("telegram.ext").setLevel(logging.INFO)
 
+# Storage backend: 'sheets' (default), or 'sqlite'/'csv'/'jsonl' for local storage
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sheets").strip().lower()
+# Local backends also mirror rows to Google Sheets in the background unless disabled
+STORAGE_SYNC_TO_SHEETS = os.getenv("STORAGE_SYNC_TO_SHEETS", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+def uses_google_sheets() -> bool:
+    """Whether submissions end up in Google Sheets with the configured storage backend."""
+    return STORAGE_BACKEND == "sheets" or STORAGE_SYNC_TO_SHEETS
+
 # Validate required environment variables
 REQUIRED_ENV_VARS = [
     "TELEGRAM_BOT_TOKEN",
     "GOOGLE_SHEET_ID", 
     "GOOGLE_CREDENTIALS_BASE64"
 ]
+GOOGLE_ENV_VARS = {"GOOGLE_SHEET_ID", "GOOGLE_CREDENTIALS_BASE64"}
 
 def validate_environment():
     """Validate that all required environment variables are present."""
     missing_vars = []
     for var in REQUIRED_ENV_VARS:
+        if var in GOOGLE_ENV_VARS and not uses_google_sheets():
+            continue
         if not os.getenv(var):
             missing_vars.append(var)
     
@@ -67,8 +105,147 @@ SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
 APPLICATIONS_SHEET_NAME = os.getenv("APPLICATIONS_SHEET_NAME", "Applications")
 CONTACTS_SHEET_NAME = os.getenv("CONTACTS_SHEET_NAME", "Contacts")
 
+# Write-behind queue for Google Sheets submissions
+SHEETS_BATCH_SIZE = int(os.getenv("SHEETS_BATCH_SIZE", "20"))
+SHEETS_FLUSH_INTERVAL = float(os.getenv("SHEETS_FLUSH_INTERVAL", "5"))
+SHEETS_QUEUE_MAX_SIZE = int(os.getenv("SHEETS_QUEUE_MAX_SIZE", "500"))
+SHEETS_ENQUEUE_TIMEOUT = float(os.getenv("SHEETS_ENQUEUE_TIMEOUT", "10"))
+
+# Google Sheets client: 'gspread' (default, blocking calls in threads) or 'async' (native HTTP client)
+GOOGLE_SHEETS_CLIENT = os.getenv("GOOGLE_SHEETS_CLIENT", "gspread").strip().lower()
+SHEETS_API_BASE_URL = os.getenv("SHEETS_API_BASE_URL", "https://sheets.googleapis.com/v4")
+SHEETS_MAX_CONNECTIONS = int(os.getenv("SHEETS_MAX_CONNECTIONS", "10"))
+SHEETS_MAX_CONCURRENCY = int(os.getenv("SHEETS_MAX_CONCURRENCY", "4"))
+SHEETS_HTTP_TIMEOUT = float(os.getenv("SHEETS_HTTP_TIMEOUT", "30"))
+
+# Refresh the Google access token this many seconds before it expires
+GOOGLE_TOKEN_REFRESH_MARGIN = float(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300"))
+
+# Sheets quota scheduling (Google's default is 60 reads and 60 writes per minute per user)
+SHEETS_READ_QUOTA_PER_MINUTE = int(os.getenv("SHEETS_READ_QUOTA_PER_MINUTE", "60"))
+SHEETS_WRITE_QUOTA_PER_MINUTE = int(os.getenv("SHEETS_WRITE_QUOTA_PER_MINUTE", "60"))
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "4"))
+SHEETS_BACKOFF_BASE = float(os.getenv("SHEETS_BACKOFF_BASE", "1"))
+SHEETS_BACKOFF_MAX = float(os.getenv("SHEETS_BACKOFF_MAX", "64"))
+SHEETS_BREAKER_FAILURE_THRESHOLD = int(os.getenv("SHEETS_BREAKER_FAILURE_THRESHOLD", "5"))
+SHEETS_BREAKER_RESET_SECONDS = float(os.getenv("SHEETS_BREAKER_RESET_SECONDS", "60"))
+
+# Multi-process mode: BOT_WORKERS > 1 runs a dispatcher plus N worker processes sharded by user ID
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+BOT_WORKER_INDEX = os.getenv("BOT_WORKER_INDEX")  # set by the dispatcher for each worker
+
+def worker_local_path(path: str) -> str:
+    """Give each worker process its own local data files (data/x.sqlite3 -> data/x.worker2.sqlite3)."""
+    if BOT_WORKER_INDEX is None:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.worker{BOT_WORKER_INDEX}{extension}"
+
+def stranded_worker_paths(path: str) -> list:
+    """
+    Worker-local copies of `path` that no current process owns, i.e. files left behind by a
+    run with a different BOT_WORKERS. Only the single process or worker 0 adopts them; the
+    dispatcher and the other workers get an empty list.
+    """
+    if BOT_WORKER_INDEX not in (None, "0") or (BOT_WORKER_INDEX is None and BOT_WORKERS > 1):
+        return []
+    root, extension = os.path.splitext(path)
+    pattern = re.compile(re.escape(os.path.basename(root)) + r"(?:\.worker(\d+))?" + re.escape(extension))
+    directory = os.path.dirname(path) or "."
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return []
+    stranded = []
+    for name in names:
+        match = pattern.fullmatch(name)
+        if not match:
+            continue
+        index = match.group(1)
+        if BOT_WORKER_INDEX is None:
+            owned = index is None
+        else:
+            owned = index is not None and int(index) < BOT_WORKERS
+        if not owned:
+            stranded.append(os.path.join(directory, name))
+    return stranded
+
+# Local data directory and durable submission journal
+BOT_DATA_DIR = os.getenv("BOT_DATA_DIR", "data")
+SUBMISSION_JOURNAL_BASE_PATH = os.getenv("SUBMISSION_JOURNAL_PATH", os.path.join(BOT_DATA_DIR, "submissions.sqlite3"))
+SUBMISSION_JOURNAL_PATH = worker_local_path(SUBMISSION_JOURNAL_BASE_PATH)
+SUBMISSION_JOURNAL_RETENTION_DAYS = float(os.getenv("SUBMISSION_JOURNAL_RETENTION_DAYS", "7"))
+
+# Worksheet partitioning: 'none' (default) or 'monthly' (rows go to e.g. Applications_2026_10)
+SHEETS_PARTITIONING = os.getenv("SHEETS_PARTITIONING", "none").strip().lower()
+# With partitioning, keep the base worksheet as a read-only view over all partitions
+SHEETS_SUMMARY_VIEW = os.getenv("SHEETS_SUMMARY_VIEW", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+# Job descriptions are rendered once at startup and re-rendered when a file changes
+JOB_DESCRIPTIONS_DIR = os.getenv(
+    "JOB_DESCRIPTIONS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "JobDescriptions")
+)
+# Job catalog: ids, titles per language, emoji and description sections
+JOB_CATALOG_PATH = os.getenv("JOB_CATALOG_PATH", os.path.join(JOB_DESCRIPTIONS_DIR, "jobs.json"))
+JOB_DESCRIPTIONS_RELOAD_INTERVAL = float(os.getenv("JOB_DESCRIPTIONS_RELOAD_INTERVAL", "30"))  # 0 disables
+
+# Repeated applications for the same job from the same phone within this window are ignored (0 disables)
+DUPLICATE_WINDOW_HOURS = float(os.getenv("DUPLICATE_WINDOW_HOURS", "24"))
+
+# Local storage backends (STORAGE_BACKEND=sqlite/csv/jsonl)
+STORAGE_SQLITE_PATH = worker_local_path(
+    os.getenv("STORAGE_SQLITE_PATH", os.path.join(BOT_DATA_DIR, "submissions_store.sqlite3"))
+)
+STORAGE_FILES_DIR = worker_local_path(os.getenv("STORAGE_FILES_DIR", os.path.join(BOT_DATA_DIR, "submissions")))
+
+# Update delivery: 'polling' (default) or 'webhook' (Telegram pushes updates to an embedded HTTP server)
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip().rstrip("/")  # public HTTPS base URL of this bot
+WEBHOOK_PATH = "/" + os.getenv("WEBHOOK_PATH", "telegram").strip().strip("/")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Random per start unless set; Telegram sends it back in X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN") or secrets.token_urlsafe(32)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Concurrent update handling; updates from the same user are still handled one at a time, in order
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "16"))     # handlers running at once
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "1000"))   # updates accepted but not yet finished
+
+# Outgoing messages: Telegram allows about 30 messages/s overall and 1 message/s per chat
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))      # per second, shared by all workers
+SEND_PER_CHAT_RATE = float(os.getenv("SEND_PER_CHAT_RATE", "1"))   # per second, per chat
+SEND_PER_CHAT_BURST = int(os.getenv("SEND_PER_CHAT_BURST", "3"))   # messages a chat may get back-to-back
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))         # retries after a 429 RetryAfter
+
+# Job alerts: opt-in subscriptions and broadcasts of new offers (shared by all worker processes)
+SUBSCRIPTIONS_DB_PATH = os.getenv("SUBSCRIPTIONS_DB_PATH", os.path.join(BOT_DATA_DIR, "subscriptions.sqlite3"))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "100"))  # messages sent before the cursor is saved
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").replace(" ", "").split(",") if user_id}
+
+# Conversation state and user_data survive restarts in SQLite (shared by all worker processes)
+BOT_PERSISTENCE = os.getenv("BOT_PERSISTENCE", "1").strip().lower() not in {"0", "false", "no", "off"}
+PERSISTENCE_DB_PATH = os.getenv("PERSISTENCE_DB_PATH", os.path.join(BOT_DATA_DIR, "conversations.sqlite3"))
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "5"))  # seconds between batched writes
+
+# Per-user state kept in memory is bounded; evicted users are reloaded from persistence on their next message
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))  # idle time before a user is evicted
+SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "50000"))       # least recently active evicted beyond this
+STATE_SWEEP_INTERVAL = float(os.getenv("STATE_SWEEP_INTERVAL", "60"))  # seconds between expiry sweeps
+
+# State shared by several bot instances: 'local' (default, per process), 'redis', or 'memory'
+# (the in-process Redis stand-in, for tests). Sessions, conversation state, rate limits and
+# the duplicate index then live in the shared store.
+STATE_BACKEND = os.getenv("STATE_BACKEND", "local").strip().lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "robotabot")
+SHARED_SESSION_TTL_DAYS = float(os.getenv("SHARED_SESSION_TTL_DAYS", "30"))  # idle sessions expire from the store
+SHARED_LOCK_SECONDS = float(os.getenv("SHARED_LOCK_SECONDS", "30"))  # longest an update may hold its user's lock
+
 # Conversation states for the bot flow
-LANGUAGE_SELECTION, MAIN_MENU, JOB_SELECTION, JOB_DESCRIPTION, JOB_APPLICATION, CONTACT_OPTION, CONTACT_FORM = range(7)
+(LANGUAGE_SELECTION, MAIN_MENU, JOB_SELECTION, JOB_DESCRIPTION, JOB_APPLICATION, CONTACT_OPTION, CONTACT_FORM,
+ NEARBY_JOBS) = range(8)
 
 # Input validation patterns
 PHONE_PATTERN = re.compile(r'^[\+]?[1-9][\d\s\-\(\)]{7,15}$')
@@ -78,9 +255,80 @@ NAME_PATTERN = re.compile(r'^[a-zA-ZąćęłńóśźżĄĆĘŁŃÓŚŹŻіїєІ
 google_client = None
 _google_client_lock = asyncio.Lock()
 
+# Parsed service account credentials, shared by every client and refreshed in the background
+_google_credentials = None
+_google_token_lock = asyncio.Lock()
+
+class TTLCache:
+    """
+    Bounded mapping whose entries expire `ttl` seconds after they were last set.
+
+    Entries are kept in an OrderedDict in the order they were set, so the oldest one is always
+    first: sweep() pops expired entries from the front and set() evicts the least recently set
+    entry once `maxsize` is reached, both in O(1) per entry removed. `on_evict(key, value)` is
+    called for every entry that leaves because it expired or the cache was full.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, on_evict=None):
+        self.maxsize = max(maxsize, 1)
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= monotonic():
+            return default
+        return entry[1]
+
+    def set(self, key, value) -> None:
+        self._entries[key] = (monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            old_key, (_, old_value) = self._entries.popitem(last=False)
+            self.evicted += 1
+            self._notify(old_key, old_value)
+
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def sweep(self) -> int:
+        """Remove expired entries; returns how many."""
+        now = monotonic()
+        removed = 0
+        while self._entries:
+            key, (expires_at, value) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[key]
+            removed += 1
+            self._notify(key, value)
+        self.expired += removed
+        return removed
+
+    def _notify(self, key, value) -> None:
+        if self.on_evict is None:
+            return
+        try:
+            self.on_evict(key, value)
+        except Exception as e:
+            logger.error(f"Error evicting {key!r}: {e}")
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "max_entries": self.maxsize, "expired": self.expired, "evicted": self.evicted}
+
 # Rate limiting
-_user_last_action = defaultdict(float)
 RATE_LIMIT_SECONDS = 1
+_user_last_action = TTLCache(SESSION_MAX_USERS, RATE_LIMIT_SECONDS)
 
 def anonymize_user_id(user_id) -> str:
     """Hash user ID for GDPR-compliant logging."""
@@ -136,21 +384,150 @@ def single_instance_lock():
 
 async def check_rate_limit(user_id: int) -> bool:
     """Check if user is within rate limit. Returns True if allowed, False if rate limited."""
-    now = time()
-    if now - _user_last_action[user_id] < RATE_LIMIT_SECONDS:
+    if shared_state:
+        return await shared_state.claim("ratelimit", user_id, RATE_LIMIT_SECONDS)
+    if _user_last_action.get(user_id) is not None:
         return False
-    _user_last_action[user_id] = now
+    _user_last_action.set(user_id, True)
     return True
 
-# Form step enum to replace magic strings
-class FormStep(Enum):
-    NAME = 'name'
-    COUNTRY = 'country'
-    PHONE = 'phone'
-    TELEGRAM_PHONE = 'telegram_phone'
-    ACCOMMODATION = 'accommodation'
-    CITY = 'city'
-    AVAILABILITY = 'availability'
+# Form step enum to replace magic strings (small ints, so sessions stay compact)
+class FormStep(IntEnum):
+    NAME = 1
+    COUNTRY = 2
+    PHONE = 3
+    TELEGRAM_PHONE = 4
+    ACCOMMODATION = 5
+    CITY = 6
+    AVAILABILITY = 7
+
+class Language(IntEnum):
+    """Interface languages; the lower-case names are the TRANSLATIONS keys."""
+    PL = 0
+    UA = 1
+    RU = 2
+
+    @property
+    def code(self) -> str:
+        return self.name.lower()
+
+    @classmethod
+    def from_code(cls, code: str) -> "Language":
+        return cls[code.upper()]
+
+class FormData:
+    """Answers given so far in the job application or contact form (None until answered)."""
+
+    __slots__ = ('name', 'country', 'phone', 'telegram_phone', 'accommodation', 'city', 'availability')
+
+    def __init__(self, **answers):
+        for field in self.__slots__:
+            setattr(self, field, answers.get(field))
+
+class UserSession:
+    """
+    Conversation data of one user, used as context.user_data.
+
+    A slotted record instead of a dict of dicts: the language and form step are small ints
+    (Language, FormStep) and the form answers live in a FormData. to_bytes() packs a session
+    into a compact binary record for persistence; from_dict() reads the JSON user_data
+    dicts saved by earlier versions.
+    """
+
+    __slots__ = ('user_id', 'language', 'selected_job', 'city', 'form_step', 'form')
+
+    VERSION = 1
+    # version, flags (1: user_id set, 2: form started), language (255: not chosen), form step (0: none), user_id
+    _HEADER = struct.Struct('<BBBBq')
+    # Then the lengths of the text fields (NO_TEXT stands for None), then their UTF-8 bytes
+    _TEXT_LENGTHS = {count: struct.Struct(f'<{count}H') for count in (2, 2 + len(FormData.__slots__))}
+    NO_TEXT = 0xFFFF
+    NO_LANGUAGE = 0xFF
+
+    def __init__(self):
+        self.user_id: Optional[int] = None
+        self.language: Optional[Language] = None
+        self.selected_job: Optional[str] = None
+        self.city: Optional[str] = None    # remembered for "jobs near me"
+        self.form_step: Optional[FormStep] = None
+        self.form: Optional[FormData] = None
+
+    @property
+    def lang(self) -> str:
+        """TRANSLATIONS key of the user's language; Polish until they choose one."""
+        return self.language.code if self.language is not None else 'pl'
+
+    def start_form(self, user_id: int) -> None:
+        self.form = FormData()
+        self.form_step = FormStep.NAME
+        self.user_id = user_id
+
+    def clear_form(self) -> None:
+        self.form = None
+        self.form_step = None
+        self.selected_job = None
+
+    def is_empty(self) -> bool:
+        return all(getattr(self, field) is None for field in self.__slots__)
+
+    def update_missing(self, other: "UserSession") -> None:
+        """Take other's values for the fields this session has not set."""
+        for field in self.__slots__:
+            if getattr(self, field) is None:
+                setattr(self, field, getattr(other, field))
+
+    def to_bytes(self) -> bytes:
+        flags = (self.user_id is not None) | (self.form is not None) << 1
+        language = self.NO_LANGUAGE if self.language is None else self.language
+        parts = [self._HEADER.pack(self.VERSION, flags, language, self.form_step or 0, self.user_id or 0)]
+        texts = [self.selected_job, self.city]
+        if self.form is not None:
+            texts.extend(getattr(self.form, field) for field in FormData.__slots__)
+        encoded = [text.encode('utf-8') if text is not None else None for text in texts]
+        parts.append(self._TEXT_LENGTHS[len(texts)].pack(*(self.NO_TEXT if e is None else len(e) for e in encoded)))
+        parts.extend(e for e in encoded if e)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "UserSession":
+        version, flags, language, form_step, user_id = cls._HEADER.unpack_from(data)
+        if version != cls.VERSION:
+            raise ValueError(f"Unknown session format version {version}")
+        lengths = cls._TEXT_LENGTHS[2 + len(FormData.__slots__) if flags & 2 else 2]
+        texts = []
+        offset = cls._HEADER.size + lengths.size
+        for length in lengths.unpack_from(data, cls._HEADER.size):
+            if length == cls.NO_TEXT:
+                texts.append(None)
+            else:
+                texts.append(data[offset:offset + length].decode('utf-8'))
+                offset += length
+
+        session = cls()
+        session.user_id = user_id if flags & 1 else None
+        session.language = Language(language) if language != cls.NO_LANGUAGE else None
+        session.form_step = FormStep(form_step) if form_step else None
+        session.selected_job, session.city = texts[0], texts[1]
+        if flags & 2:
+            session.form = form = FormData.__new__(FormData)
+            for field, text in zip(FormData.__slots__, texts[2:]):
+                setattr(form, field, text)
+        return session
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UserSession":
+        """A session saved as a JSON user_data dict (before sessions were stored in binary)."""
+        session = cls()
+        session.user_id = data.get('user_id')
+        if (data.get('language') or '').upper() in Language.__members__:
+            session.language = Language.from_code(data['language'])
+        session.selected_job = data.get('selected_job')
+        session.city = data.get('city')
+        if (data.get('form_step') or '').upper() in FormStep.__members__:
+            session.form_step = FormStep[data['form_step'].upper()]
+        if 'form_data' in data or session.form_step is not None:
+            session.form = FormData(**(data.get('form_data') or {}))
+        return session
 
 # Translation dictionary
 TRANSLATIONS = {
@@ -159,6 +536,14 @@ TRANSLATIONS = {
         'choose_language': 'Wybierz język',
         'main_menu': 'Menu główne',
         'check_jobs': 'Sprawdź oferty pracy',
+        'jobs_near_me': '📍 Oferty w pobliżu',
+        'enter_city_nearby': 'Podaj miasto, w którym chcesz pracować:',
+        'jobs_near_city': '📍 Oferty w pobliżu: {city}',
+        'no_jobs_near_city': 'Nie mamy ofert w pobliżu: {city}. Zobacz wszystkie oferty:',
+        'job_alerts': '🔔 Powiadomienia o ofertach',
+        'alerts_on': '✅ Będziemy informować Cię o nowych ofertach pracy. Wyłączysz to tym samym przyciskiem lub komendą /alerts.',
+        'alerts_off': '🔕 Nie będziesz już otrzymywać powiadomień o nowych ofertach.',
+        'new_job_alert': '🆕 Nowa oferta pracy: {title}\n\nWyślij /menu, aby zobaczyć szczegóły.',
         'contact_us': 'Skontaktuj się z nami',
         'fill_form': 'Wypełnij formularz',
         'contact_info': 'Kontakt',
@@ -182,13 +567,6 @@ TRANSLATIONS = {
 🌐 Strona internetowa: folga.com.pl
 
 Jesteśmy dostępni od poniedziałku do piątku, 8:00-17:00''',
-        'jobs': [
-            'Pracownik działu mięsnego w supermarkecie',
-            'Pracownik w supermarkecie',
-            'Kasjer do supermarketu',
-            'Pracownik produkcji',
-            'Brygadzista na produkcję mięsną'
-        ],
         'apply_for_job': 'Aplikuj na to stanowisko',
         'back': 'Powrót',
         'cancel': 'Anuluj',
@@ -207,6 +585,14 @@ Jesteśmy dostępni od poniedziałku do piątku, 8:00-17:00''',
         'choose_language': 'Виберіть мову',
         'main_menu': 'Головне меню',
         'check_jobs': 'Перевір вакансії',
+        'jobs_near_me': '📍 Вакансії поруч',
+        'enter_city_nearby': 'Вкажи місто, де хочеш працювати:',
+        'jobs_near_city': '📍 Вакансії поруч: {city}',
+        'no_jobs_near_city': 'Немає вакансій поруч: {city}. Переглянь усі вакансії:',
+        'job_alerts': '🔔 Сповіщення про вакансії',
+        'alerts_on': '✅ Ми повідомлятимемо тебе про нові вакансії. Вимкнути можна цією ж кнопкою або командою /alerts.',
+        'alerts_off': '🔕 Ти більше не отримуватимеш сповіщень про нові вакансії.',
+        'new_job_alert': '🆕 Нова вакансія: {title}\n\nНадішли /menu, щоб переглянути деталі.',
         'contact_us': 'Зв\'яжись з нами',
         'fill_form': 'Заповнити анкету',
         'contact_info': 'Контакт',
@@ -230,13 +616,6 @@ Jesteśmy dostępni od poniedziałku do piątku, 8:00-17:00''',
 🌐 Вебсайт: folga.com.pl
 
 Ми доступні з понеділка по п\'ятницю, 8:00-17:00''',
-        'jobs': [
-            'Працівник м\'ясного відділу в супермаркеті',
-            'Працівник супермаркету',
-            'Касир до супермаркету',
-            'Працівник виробництва',
-            'Бригадир на м\'ясному виробництві'
-        ],
         'apply_for_job': 'Подати заяву на цю посаду',
         'back': 'Назад',
         'cancel': 'Скасувати',
@@ -255,6 +634,14 @@ Jesteśmy dostępni od poniedziałku do piątku, 8:00-17:00''',
         'choose_language': 'Выберите язык',
         'main_menu': 'Главное меню',
         'check_jobs': 'Проверь вакансии',
+        'jobs_near_me': '📍 Вакансии рядом',
+        'enter_city_nearby': 'Укажите город, в котором хотите работать:',
+        'jobs_near_city': '📍 Вакансии рядом: {city}',
+        'no_jobs_near_city': 'Нет вакансий рядом: {city}. Посмотрите все вакансии:',
+        'job_alerts': '🔔 Уведомления о вакансиях',
+        'alerts_on': '✅ Мы будем сообщать вам о новых вакансиях. Отключить можно той же кнопкой или командой /alerts.',
+        'alerts_off': '🔕 Вы больше не будете получать уведомления о новых вакансиях.',
+        'new_job_alert': '🆕 Новая вакансия: {title}\n\nОтправьте /menu, чтобы посмотреть подробности.',
         'contact_us': 'Свяжись с нами',
         'fill_form': 'Заполнить анкету',
         'contact_info': 'Контакты',
@@ -278,13 +665,6 @@ Jesteśmy dostępni od poniedziałku do piątku, 8:00-17:00''',
 🌐 Сайт: folga.com.pl
 
 Мы доступны с понедельника по пятницу, 8:00-17:00''',
-        'jobs': [
-            'Работник мясного отдела в супермаркете',
-            'Работник супермаркета',
-            'Кассир в супермаркет',
-            'Работник производства',
-            'Бригадир на мясном производстве'
-        ],
         'apply_for_job': 'Подать заявку на эту должность',
         'back': 'Назад',
         'cancel': 'Отмена',
@@ -337,7 +717,11 @@ def sanitize_input(value: str) -> str:
 
 # Google Sheets integration with connection pooling
 async def get_google_credentials():
-    """Load Google service account credentials from base64 environment variable."""
+    """Load Google service account credentials from base64 environment variable (parsed once)."""
+    global _google_credentials
+
+    if _google_credentials is not None:
+        return _google_credentials
     try:
         google_creds_base64 = os.getenv("GOOGLE_CREDENTIALS_BASE64")
         if not google_creds_base64:
@@ -348,301 +732,1884 @@ async def get_google_credentials():
         creds_info = json.loads(creds_json)
         scope = ['https://spreadsheets.google.com/feeds',
                  'https://www.googleapis.com/auth/drive']
-        return Credentials.from_service_account_info(creds_info, scopes=scope)
+        _google_credentials = Credentials.from_service_account_info(creds_info, scopes=scope)
+        return _google_credentials
     except Exception as e:
         logger.error(f"Failed to load Google credentials: {e}")
         raise
 
+def _token_expires_in() -> Optional[float]:
+    """Seconds until the cached access token expires (None if there is no token yet)."""
+    if _google_credentials is None or _google_credentials.expiry is None:
+        return None
+    # google-auth stores expiry as a naive UTC datetime
+    return (_google_credentials.expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+
+async def refresh_google_token(force: bool = False) -> bool:
+    """Refresh the OAuth access token if it is missing or about to expire."""
+    creds = await get_google_credentials()
+    async with _google_token_lock:
+        expires_in = _token_expires_in()
+        if not force and creds.token and expires_in is not None and expires_in > GOOGLE_TOKEN_REFRESH_MARGIN:
+            return False
+        await asyncio.to_thread(creds.refresh, google.auth.transport.requests.Request())
+        logger.info(f"Google access token refreshed (valid for {int(_token_expires_in() or 0)}s)")
+        return True
+
+async def google_token_refresher() -> None:
+    """Background task: refresh the access token before it expires so user requests never wait on OAuth."""
+    while True:
+        try:
+            await refresh_google_token()
+            expires_in = _token_expires_in() or 0
+            delay = min(max(expires_in - GOOGLE_TOKEN_REFRESH_MARGIN, 30), 3000)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Background Google token refresh failed: {e}")
+            delay = 30
+        await asyncio.sleep(delay)
+
+class SheetsAPIError(Exception):
+    """Error response from the Sheets v4 API (mirrors gspread's APIError.code)."""
+
+    def __init__(self, code: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"[{code}]: {message}")
+        self.code = code
+        self.message = message
+        self.retry_after = retry_after
+
+def _a1_range(worksheet_title: str, cells: str = "") -> str:
+    """Build an A1 range such as 'Applications'!A1:J for a worksheet title."""
+    quoted = "'" + worksheet_title.replace("'", "''") + "'"
+    return f"{quoted}!{cells}" if cells else quoted
+
+class AsyncSheetsClient:
+    """
+    Asyncio-native client for the Google Sheets v4 REST API.
+
+    All requests share one httpx connection pool (keep-alive, HTTP/2 when the `h2`
+    package is installed), and a semaphore caps how many requests are in flight, so
+    Sheets traffic no longer occupies default-executor threads or opens a new TLS
+    session per call. `credentials=None` skips authentication, which is how the client
+    is pointed at a local stand-in server (see scripts/fake_sheets_server.py).
+    """
+
+    def __init__(
+        self,
+        credentials,
+        base_url: str = SHEETS_API_BASE_URL,
+        max_connections: int = SHEETS_MAX_CONNECTIONS,
+        max_concurrency: int = SHEETS_MAX_CONCURRENCY,
+        timeout: float = SHEETS_HTTP_TIMEOUT,
+    ):
+        self.credentials = credentials
+        self.base_url = base_url.rstrip('/')
+        self.http2 = importlib.util.find_spec("h2") is not None
+        self._http = httpx.AsyncClient(
+            http2=self.http2,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self.requests_sent = 0
+
+    async def _auth_headers(self) -> dict:
+        if self.credentials is None:
+            return {}
+        if not self.credentials.valid:
+            # Normally the background refresher got here first; this is the fallback
+            await refresh_google_token(force=True)
+        return {"Authorization": f"Bearer {self.credentials.token}"}
+
+    async def request(self, method: str, path: str, **kwargs) -> dict:
+        headers = await self._auth_headers()
+        async with self._semaphore:
+            response = await self._http.request(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+            self.requests_sent += 1
+        if response.status_code >= 400:
+            try:
+                message = response.json()["error"]["message"]
+            except Exception:
+                message = response.text
+            try:
+                retry_after = float(response.headers.get("Retry-After", ""))
+            except ValueError:
+                retry_after = None
+            raise SheetsAPIError(response.status_code, message, retry_after)
+        return response.json() if response.content else {}
+
+    async def open_by_key(self, spreadsheet_id: str) -> "AsyncSpreadsheet":
+        spreadsheet = AsyncSpreadsheet(self, spreadsheet_id)
+        await spreadsheet.fetch_metadata()
+        return spreadsheet
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+class AsyncSpreadsheet:
+    """Spreadsheet handle for AsyncSheetsClient with the subset of gspread's API the bot uses."""
+
+    def __init__(self, client: AsyncSheetsClient, spreadsheet_id: str):
+        self.client = client
+        self.id = spreadsheet_id
+        self.title = ""
+        self._sheets: dict[str, dict] = {}
+
+    async def fetch_metadata(self) -> None:
+        try:
+            metadata = await self.client.request(
+                "GET",
+                f"/spreadsheets/{self.id}",
+                params={"fields": "spreadsheetId,properties.title,sheets.properties"},
+            )
+        except SheetsAPIError as e:
+            if e.code == 404:
+                raise gspread.exceptions.SpreadsheetNotFound(e.message) from e
+            raise
+        self.title = metadata.get("properties", {}).get("title", "")
+        self._sheets = {
+            sheet["properties"]["title"]: sheet["properties"] for sheet in metadata.get("sheets", [])
+        }
+
+    async def worksheet(self, title: str) -> "AsyncWorksheet":
+        if title not in self._sheets:
+            await self.fetch_metadata()
+        if title not in self._sheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return AsyncWorksheet(self, self._sheets[title])
+
+    async def worksheets(self) -> list:
+        await self.fetch_metadata()
+        return [AsyncWorksheet(self, properties) for properties in self._sheets.values()]
+
+    async def add_worksheet(self, title: str, rows: int, cols: int) -> "AsyncWorksheet":
+        result = await self.client.request(
+            "POST",
+            f"/spreadsheets/{self.id}:batchUpdate",
+            json={"requests": [{"addSheet": {"properties": {
+                "title": title, "gridProperties": {"rowCount": rows, "columnCount": cols}
+            }}}]},
+        )
+        properties = result["replies"][0]["addSheet"]["properties"]
+        self._sheets[properties["title"]] = properties
+        return AsyncWorksheet(self, properties)
+
+    async def values_batch_get(self, ranges: list) -> dict:
+        return await self.client.request(
+            "GET", f"/spreadsheets/{self.id}/values:batchGet", params={"ranges": ranges}
+        )
+
+class AsyncWorksheet:
+    """Worksheet handle for AsyncSheetsClient."""
+
+    def __init__(self, spreadsheet: AsyncSpreadsheet, properties: dict):
+        self.spreadsheet = spreadsheet
+        self.id = properties.get("sheetId")
+        self.title = properties["title"]
+
+    async def append_rows(self, values: list, value_input_option: str = "RAW") -> dict:
+        path = f"/spreadsheets/{self.spreadsheet.id}/values/{quote(_a1_range(self.title), safe='')}:append"
+        return await self.spreadsheet.client.request(
+            "POST",
+            path,
+            params={"valueInputOption": value_input_option, "insertDataOption": "INSERT_ROWS"},
+            json={"values": values},
+        )
+
+    async def update(self, values: list, range_name: str, value_input_option: str = "RAW") -> dict:
+        path = f"/spreadsheets/{self.spreadsheet.id}/values/{quote(_a1_range(self.title, range_name), safe='')}"
+        return await self.spreadsheet.client.request(
+            "PUT", path, params={"valueInputOption": value_input_option}, json={"values": values}
+        )
+
+    async def get_all_values(self) -> list:
+        result = await self.spreadsheet.values_batch_get([_a1_range(self.title)])
+        value_ranges = result.get("valueRanges", [])
+        return value_ranges[0].get("values", []) if value_ranges else []
+
+async def sheets_call(func, *args, **kwargs):
+    """Run a Sheets operation: await native coroutines, push blocking gspread calls to a thread."""
+    if inspect.iscoroutinefunction(func):
+        return await func(*args, **kwargs)
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+class SheetsCircuitOpenError(Exception):
+    """Raised instead of calling Google while the Sheets circuit breaker is open."""
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate_per_minute`, holding at most `capacity` tokens."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = max(rate_per_minute, 1) / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 4)
+        self.tokens = self.capacity
+        self._updated = monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """Take one token, sleeping until one is available. Returns the time waited."""
+        waited = 0.0
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self.tokens -= 1
+        return waited
+
+    def refund(self) -> None:
+        """Give back a token that was taken but not used."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+class CircuitBreaker:
+    """
+    Classic closed/open/half-open breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens and calls are
+    rejected for `reset_timeout` seconds; then a single probe call is let through
+    (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """The probe ended without an outcome (e.g. it was cancelled); let the next call probe."""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("✅ Sheets circuit breaker closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"⚠️ Sheets circuit breaker opened for {self.reset_timeout:.0f}s after {self.failures} failure(s)")
+            self.state = self.OPEN
+            self.opened_at = monotonic()
+            self._probe_in_flight = False
+
+def _sheets_error_status(error: Exception) -> Optional[int]:
+    if isinstance(error, (gspread.exceptions.APIError, SheetsAPIError)):
+        return error.code
+    return None
+
+def _sheets_retry_after(error: Exception) -> Optional[float]:
+    if isinstance(error, SheetsAPIError):
+        return error.retry_after
+    if isinstance(error, gspread.exceptions.APIError):
+        try:
+            return float(error.response.headers.get("Retry-After", ""))
+        except (AttributeError, ValueError):
+            return None
+    return None
+
+def _is_transient_sheets_error(error: Exception) -> bool:
+    """429 quota errors, 5xx responses and network failures are worth retrying."""
+    status = _sheets_error_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, (httpx.TransportError, requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+class SheetsScheduler:
+    """
+    Gatekeeper for every Google Sheets request.
+
+    Reads and writes each draw from a token bucket sized to the per-minute project quota,
+    transient failures (429, 5xx, network) are retried with Retry-After or exponential
+    backoff with jitter, and a circuit breaker stops sending requests while Google keeps
+    failing, so the bot neither burns quota nor piles up doomed calls.
+    """
+
+    def __init__(self, read_per_minute: int, write_per_minute: int, max_retries: int, breaker: CircuitBreaker):
+        self.buckets = {"read": TokenBucket(read_per_minute), "write": TokenBucket(write_per_minute)}
+        self.max_retries = max(0, max_retries)
+        self.breaker = breaker
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.quota_wait_seconds = 0.0
+
+    async def run(self, func, *args, kind: str = "read", **kwargs):
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self.rejected += 1
+                raise SheetsCircuitOpenError("Google Sheets circuit breaker is open")
+
+            try:
+                self.quota_wait_seconds += await self.buckets[kind].acquire()
+                self.calls += 1
+                result = await sheets_call(func, *args, **kwargs)
+            except Exception as e:
+                if not _is_transient_sheets_error(e):
+                    # Client errors (bad range, missing worksheet, ...) say nothing about Google's health
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if _sheets_error_status(e) == 429:
+                    self.throttled += 1
+                if attempt >= self.max_retries or self.breaker.state == CircuitBreaker.OPEN:
+                    raise
+                delay = _sheets_retry_after(e)
+                if delay is None:
+                    delay = min(SHEETS_BACKOFF_BASE * (2 ** attempt), SHEETS_BACKOFF_MAX) * (0.5 + random.random() / 2)
+                self.retries += 1
+                logger.warning(f"Transient Sheets error ({e}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled (e.g. the write queue stopping mid-flush): no outcome to record, but a
+                # half-open probe left marked in flight would reject every call until a restart
+                self.breaker.release_probe()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> dict:
+        return {
+            "circuit_breaker": self.breaker.state,
+            "circuit_breaker_opened": self.breaker.times_opened,
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled_429": self.throttled,
+            "rejected_while_open": self.rejected,
+            "quota_wait_seconds": round(self.quota_wait_seconds, 2),
+        }
+
+sheets_scheduler = SheetsScheduler(
+    SHEETS_READ_QUOTA_PER_MINUTE,
+    SHEETS_WRITE_QUOTA_PER_MINUTE,
+    SHEETS_MAX_RETRIES,
+    CircuitBreaker(SHEETS_BREAKER_FAILURE_THRESHOLD, SHEETS_BREAKER_RESET_SECONDS),
+)
+
+def _uses_google_credentials() -> bool:
+    # Never send the bearer token over plain HTTP; such URLs are local stand-in servers.
+    return GOOGLE_SHEETS_CLIENT != "async" or SHEETS_API_BASE_URL.startswith("https://")
+
+async def _create_google_client():
+    if GOOGLE_SHEETS_CLIENT == "async":
+        return AsyncSheetsClient(await get_google_credentials() if _uses_google_credentials() else None)
+    creds = await get_google_credentials()
+    return await asyncio.to_thread(gspread.authorize, creds)
+
+async def _reset_google_client() -> None:
+    """Forget the client and every cached handle. Must be called with _google_client_lock held."""
+    global google_client
+    client, google_client = google_client, None
+    sheet_handles.invalidate()
+    if isinstance(client, AsyncSheetsClient):
+        with contextlib.suppress(Exception):
+            await client.aclose()
+
+async def close_google_sheets() -> None:
+    """Release the Sheets client's pooled connections on shutdown."""
+    async with _google_client_lock:
+        await _reset_google_client()
+
+class SheetHandleCache:
+    """
+    Cache of the Spreadsheet and Worksheet handles.
+
+    Opening the spreadsheet and looking up a worksheet are metadata round trips to Google,
+    so they are resolved once and reused until gspread reports that a handle went stale.
+    """
+
+    def __init__(self):
+        self.spreadsheet: Optional[gspread.Spreadsheet] = None
+        self.worksheets: dict[str, gspread.Worksheet] = {}
+        self.metadata_calls = 0
+        self.metadata_calls_avoided = 0
+
+    def invalidate(self, worksheet_name: Optional[str] = None) -> None:
+        """Drop one worksheet handle, or every handle when no name is given."""
+        if worksheet_name is not None:
+            self.worksheets.pop(worksheet_name, None)
+            return
+        self.spreadsheet = None
+        self.worksheets.clear()
+
+    def stats(self) -> dict:
+        return {
+            "metadata_calls": self.metadata_calls,
+            "metadata_calls_avoided": self.metadata_calls_avoided,
+            "cached_worksheets": len(self.worksheets),
+        }
+
+sheet_handles = SheetHandleCache()
+
 async def setup_google_sheets() -> Optional[gspread.Spreadsheet]:
-    """Connect to Google Sheets and return the workbook with connection pooling."""
+    """Connect to Google Sheets and return the (cached) workbook with connection pooling."""
     global google_client
     
     try:
         async with _google_client_lock:
             if google_client is None:
-                creds = await get_google_credentials()
-                google_client = await asyncio.to_thread(gspread.authorize, creds)
-                logger.info("Google Sheets client initialized")
-        
-        return await asyncio.to_thread(google_client.open_by_key, SHEET_ID)
-    except Exception as e:
-        logger.error(f"Error setting up Google Sheets: {e}")
-        async with _google_client_lock:
-            google_client = None  # Reset client on error
-        return None
-
-# Job description loading functions
-def format_job_description_for_telegram(content: str, language: str) -> str:
-    """Convert markdown job description to Telegram-friendly format with emojis."""
-    try:
-        lines = content.split('\n')
-        formatted_lines = []
-        
-        # Emoji mappings for different job types
-        job_emojis = {
-            'pl': {
-                'Pracownik działu mięsnego w supermarkecie': '🥩',
-                'Pracownik w supermarkecie': '🏪',
-                'Kasjer do supermarketu': '🛒',
-                'Brygadzista na produkcję mięsną': '👷‍♂️',
-                'Pracownik produkcji': '🏭'
-            },
-            'ua': {
-                'Працівник м\'ясного відділу в супермаркеті': '🥩',
-                'Працівник супермаркету': '🏪',
-                'Касир до супермаркету': '🛒',
-                'Бригадир на м\'ясному виробництві': '👷‍♂️',
-                'Працівник виробництва': '🏭'
-            },
-            'ru': {
-                'Работник мясного отдела в супермаркете': '🥩',
-                'Работник супермаркета': '🏪',
-                'Кассир в супермаркет': '🛒',
-                'Бригадир на мясном производстве': '👷‍♂️',
-                'Работник производства': '🏭'
-            },
-            'en': {
-                'Meat Department Worker in Supermarket': '🥩',
-                'Supermarket Worker': '🏪',
-                'Supermarket Cashier': '🛒',
-                'Foreman in Meat Production': '👷‍♂️',
-                'Production Worker': '🏭'
-            }
-        }
-        
-        # Section emoji mappings
-        section_emojis = {
-            'pl': {
-                'Co dla nas jest ważne': '⚡',
-                'Co możemy Ci zaoferować': '💰',
-                'Co możemy Tobie zaoferować': '💰',
-                'Zapraszamy do udziału w rekrutacji': '📝',
-                'Obowiązki Brygadzisty': '📋'
-            },
-            'ua': {
-                'Що для нас важливо': '⚡',
-                'Що ми можемо Вам запропонувати': '💰',
-                'Запрошуємо до участі в рекрутації': '📝',
-                'Обов\'язки Бригадира': '📋'
-            },
-            'ru': {
-                'Что для нас важно': '⚡',
-                'Что мы можем Вам предложить': '💰',
-                'Приглашаем к участию в рекрутинге': '📝',
-                'Обязанности Бригадира': '📋'
-            },
-            'en': {
-                'What is important to us': '⚡',
-                'What we can offer you': '💰',
-                'We invite you to participate in recruitment': '📝',
-                'Foreman Duties': '📋'
-            }
-        }
-        
-        for line in lines:
-            # Handle main job titles (# Title)
-            if line.startswith('# '):
-                title = line[2:].strip()
-                emoji = job_emojis.get(language, {}).get(title, '💼')
-                formatted_lines.append(f"{emoji} *{title}*")
-                formatted_lines.append("")  # Add spacing
-                
-            # Handle section headers (## Section)
-            elif line.startswith('## '):
-                section = line[3:].strip()
-                emoji = section_emojis.get(language, {}).get(section, '▫️')
-                formatted_lines.append(f"{emoji} *{section}*")
-                formatted_lines.append("")  # Add spacing
-                
-            # Handle horizontal rules (---)
-            elif line.strip() == '---':
-                formatted_lines.append("━━━━━")
-                formatted_lines.append("")  # Add spacing
-                
-            # Handle main bullet points
-            elif line.startswith('- '):
-                bullet_text = line[2:].strip()
-                formatted_lines.append(f"• {bullet_text}")
-                
-            # Handle sub-bullet points (indented)
-            elif line.startswith('  - '):
-                sub_bullet_text = line[4:].strip()
-                formatted_lines.append(f"    ▪️ {sub_bullet_text}")
-                
-            # Handle regular lines
-            elif line.strip():
-                formatted_lines.append(line)
-                
-            # Handle empty lines
-            else:
-                formatted_lines.append("")
-        
-        # Join lines and clean up multiple consecutive empty lines
-        result = '\n'.join(formatted_lines)
-        
-        # Replace multiple consecutive newlines with maximum 2
-        result = re.sub(r'\n{3,}', '\n\n', result)
-        
-        # Add some final formatting touches
-        result = result.strip()
-        
-        return result
-        
-    except Exception as e:
-        logger.error(f"Error formatting job description: {e}")
-        return content  # Return original content if formatting fails
+                google_client = await _create_google_client()
+                sheet_handles.invalidate()
+                logger.info(f"Google Sheets client initialized ({GOOGLE_SHEETS_CLIENT})")
 
-async def load_job_description(job_title: str, language: str) -> Optional[str]:
-    """Load job description from markdown file based on job title and language."""
-    try:
-        # Map languages to file suffixes
-        lang_map = {
-            'pl': 'pl',
-            'ua': 'uk', 
-            'ru': 'ru',
-            'en': 'en'
-        }
-        
-        # Map job titles to markdown section headers
-        job_mapping = {
-            'pl': {
-                'Pracownik działu mięsnego w supermarkecie': 'Pracownik działu mięsnego w supermarkecie',
-                'Pracownik w supermarkecie': 'Pracownik w supermarkecie',
-                'Kasjer do supermarketu': 'Kasjer do supermarketu',
-                'Pracownik produkcji': 'Pracownik produkcji',
-                'Brygadzista na produkcję mięsną': 'Brygadzista na produkcję mięsną'
-            },
-            'ua': {
-                'Працівник м\'ясного відділу в супермаркеті': 'Працівник м\'ясного відділу в супермаркеті',
-                'Працівник супермаркету': 'Працівник супермаркету',
-                'Касир до супермаркету': 'Касир до супермаркету',
-                'Працівник виробництва': 'Працівник виробництва',
-                'Бригадир на м\'ясному виробництві': 'Бригадир на м\'ясному виробництві'
-            },
-            'ru': {
-                'Работник мясного отдела в супермаркете': 'Работник мясного отдела в супермаркете',
-                'Работник супермаркета': 'Работник супермаркета',
-                'Кассир в супермаркет': 'Кассир в супермаркет',
-                'Работник производства': 'Работник производства',
-                'Бригадир на мясном производстве': 'Бригадир на мясном производстве'
-            }
-        }
-        
-        file_suffix = lang_map.get(language, 'pl')
-        file_path = f"JobDescriptions/Job_descriptions_{file_suffix}.md"
-        
-        # Check if file exists
-        if not os.path.exists(file_path):
-            logger.error(f"Job description file not found: {file_path}")
-            return None
-        
-        # Get the section title for the job
-        section_title = job_mapping.get(language, {}).get(job_title)
-        if not section_title:
-            logger.error(f"No mapping found for job '{job_title}' in language '{language}'")
-            return None
-        
-        # Read and parse the markdown file (non-blocking)
-        def read_file():
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-        content = await asyncio.to_thread(read_file)
-        
-        # Find the section for this job
-        sections = content.split('\n# ')
-        
-        for i, section in enumerate(sections):
-            if i == 0:
-                # First section might not start with \n#
-                section_header = section.split('\n')[0].strip()
-                if section_header.startswith('# '):
-                    section_header = section_header[2:]
+            if sheet_handles.spreadsheet is None:
+                sheet_handles.spreadsheet = await sheets_scheduler.run(google_client.open_by_key, SHEET_ID)
+                sheet_handles.metadata_calls += 1
             else:
-                section_header = section.split('\n')[0].strip()
-            
-            if section_header == section_title:
-                # Found the section - clean it up and return
-                if i == 0:
-                    job_content = section
-                else:
-                    job_content = '# ' + section
-                
-                # Remove any following sections (stop at next #)
-                lines = job_content.split('\n')
-                final_lines = []
-                for j, line in enumerate(lines):
-                    if j > 0 and line.startswith('# ') and line.strip() != f'# {section_title}':
-                        break
-                    final_lines.append(line)
-                
-                job_content = '\n'.join(final_lines).strip()
-                # Format the content for Telegram display
-                return format_job_description_for_telegram(job_content, language)
-        
-        logger.error(f"Job section '{section_title}' not found in file {file_path}")
+                sheet_handles.metadata_calls_avoided += 1
+            return sheet_handles.spreadsheet
+    except SheetsCircuitOpenError:
         return None
-        
     except Exception as e:
-        logger.error(f"Error loading job description: {e}")
+        logger.error(f"Error setting up Google Sheets: {e}")
+        if not _is_transient_sheets_error(e):
+            async with _google_client_lock:
+                await _reset_google_client()  # Reset client on error
         return None
 
-# Helper functions
-def get_text(lang: str, key: str) -> str:
-    """Get translated text with fallback."""
-    return TRANSLATIONS.get(lang, TRANSLATIONS['pl']).get(key, key)
+async def get_worksheet(worksheet_name: str, create_headers: Optional[list] = None) -> Optional[gspread.Worksheet]:
+    """Return a cached Worksheet handle, resolving it (or creating it with headers) on first use."""
+    sheet = await setup_google_sheets()
+    if not sheet:
+        return None
+
+    worksheet = sheet_handles.worksheets.get(worksheet_name)
+    if worksheet is not None:
+        sheet_handles.metadata_calls_avoided += 1
+        return worksheet
 
-def create_keyboard(buttons, lang):
-    """Create keyboard with proper error handling."""
     try:
-        keyboard = []
-        for button in buttons:
-            if isinstance(button, list):
-                keyboard.append([KeyboardButton(get_text(lang, btn)) for btn in button])
+        worksheet = await sheets_scheduler.run(sheet.worksheet, worksheet_name)
+        sheet_handles.metadata_calls += 1
+    except gspread.exceptions.WorksheetNotFound:
+        if create_headers is None:
+            raise
+        worksheet = await create_worksheet(sheet, worksheet_name, create_headers)
+    sheet_handles.worksheets[worksheet_name] = worksheet
+    return worksheet
+
+async def create_worksheet(sheet, worksheet_name: str, headers: list):
+    """Create a worksheet with a header row (and refresh the summary view for partitions)."""
+    worksheet = await sheets_scheduler.run(sheet.add_worksheet, worksheet_name, 1000, len(headers), kind="write")
+    await sheets_scheduler.run(worksheet.append_rows, [headers], kind="write")
+    logger.info(f"Created worksheet '{worksheet_name}'")
+    if SHEETS_SUMMARY_VIEW and worksheet_table(worksheet_name, partitions_only=True):
+        try:
+            await refresh_summary_view(sheet, worksheet_table(worksheet_name))
+        except Exception as e:
+            logger.error(f"Could not refresh summary view after creating '{worksheet_name}': {e}")
+    return worksheet
+
+async def invalidate_sheet_handles(error: Exception, worksheet_name: Optional[str] = None) -> None:
+    """Drop cached handles that the given Sheets error shows to be stale."""
+    if isinstance(error, gspread.exceptions.WorksheetNotFound):
+        sheet_handles.invalidate(worksheet_name)
+    elif isinstance(error, gspread.exceptions.SpreadsheetNotFound):
+        sheet_handles.invalidate()
+    elif isinstance(error, (gspread.exceptions.APIError, SheetsAPIError)) and error.code in (401, 403, 404):
+        async with _google_client_lock:
+            if error.code == 404:
+                # A deleted/renamed worksheet also surfaces as 404 on its values endpoint
+                sheet_handles.invalidate(worksheet_name)
             else:
-                keyboard.append([KeyboardButton(get_text(lang, button))])
-        return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-    except Exception as e:
-        logger.error(f"Error creating keyboard: {e}")
-        # Return basic keyboard as fallback
-        return ReplyKeyboardMarkup([[KeyboardButton("Menu")]], resize_keyboard=True)
+                # Auth problems: rebuild the client and every handle on the next call
+                await _reset_google_client()
 
-async def process_form_step(
-    update: Update,
-    context: ContextTypes.DEFAULT_TYPE,
-    current_step: FormStep,
-    next_step: Optional[FormStep],
-    validation_type: str,
-    error_key: str,
-    next_prompt_key: str,
-    form_data_key: str,
-    return_state: int,
-    keyboard_options: Optional[list] = None
-) -> tuple[bool, int]:
+class SubmissionJournal:
     """
-    Process a single form step with validation and state management.
-    Returns (success, next_state) tuple.
+    Durable local write-ahead journal of submissions (SQLite in WAL mode).
+
+    Every row is appended here before it is queued for Google Sheets and marked delivered
+    once append_rows succeeds, so a submission survives Sheets outages and restarts.
+    WAL with synchronous=NORMAL batches fsyncs at checkpoints, keeping appends cheap.
+    Delivery to Sheets is at-least-once: a crash between append_rows and mark_delivered
+    replays that batch. Journals in `adopt_paths` (left behind when BOT_WORKERS changed) are
+    merged into this one when it opens, so their undelivered rows are replayed here.
     """
-    lang = context.user_data.get('language', 'pl')
-    text = update.message.text
-    form_data = context.user_data.get('form_data', {})
-    
-    if not validate_input(validation_type, text):
-        await update.message.reply_text(get_text(lang, error_key))
-        return False, return_state
-    
-    form_data[form_data_key] = sanitize_input(text)
-    context.user_data['form_data'] = form_data
-    
-    if next_step:
-        context.user_data['form_step'] = next_step.value
-        
-        if keyboard_options:
-            keyboard = keyboard_options
-        else:
-            keyboard = [[get_text(lang, 'cancel')]]
-        
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        await update.message.reply_text(
+
+    def __init__(self, path: str, adopt_paths: Optional[list] = None):
+        self.path = path
+        self.adopt_paths = adopt_paths or []
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.rows_adopted = 0
+
+    def open(self) -> None:
+        if self._conn is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS submissions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                worksheet TEXT NOT NULL,
+                row TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                delivered_at REAL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_submissions_pending ON submissions (delivered_at, id)")
+        self._conn = conn
+        logger.info(f"Submission journal opened at {self.path}")
+        for path in self.adopt_paths:
+            if os.path.abspath(path) == os.path.abspath(self.path):
+                continue
+            try:
+                self._adopt(path)
+            except Exception as e:
+                logger.error(f"Could not merge stranded submission journal {path}: {e}")
+
+    def _adopt(self, path: str) -> None:
+        """
+        Copy every entry of another journal into this one, then delete it. Delivered entries
+        come along for the duplicate index; undelivered ones are replayed by this process.
+        A crash before the delete merges the file again on the next start, which replays its
+        undelivered rows twice (the usual at-least-once).
+        """
+        with self._lock:
+            self._conn.execute("ATTACH DATABASE ? AS stranded", (path,))
+            try:
+                tables = self._conn.execute(
+                    "SELECT 1 FROM stranded.sqlite_master WHERE type = 'table' AND name = 'submissions'"
+                ).fetchone()
+                copied = pending = 0
+                if tables:
+                    pending = self._conn.execute(
+                        "SELECT COUNT(*) FROM stranded.submissions WHERE delivered_at IS NULL"
+                    ).fetchone()[0]
+                    copied = self._conn.execute(
+                        "INSERT INTO submissions (worksheet, row, created_at, delivered_at) "
+                        "SELECT worksheet, row, created_at, delivered_at FROM stranded.submissions ORDER BY id"
+                    ).rowcount
+            finally:
+                self._conn.execute("DETACH DATABASE stranded")
+        for leftover in (path, f"{path}-wal", f"{path}-shm"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(leftover)
+        self.rows_adopted += pending
+        logger.info(f"Merged stranded submission journal {path}: {copied} entries, {pending} undelivered")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def append(self, worksheet_name: str, row: list) -> int:
+        """Record a submission and return its journal entry id."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO submissions (worksheet, row, created_at) VALUES (?, ?, ?)",
+                (worksheet_name, json.dumps(row, ensure_ascii=False), time()),
+            )
+            return cursor.lastrowid
+
+    def mark_delivered(self, entry_ids: list) -> None:
+        if not entry_ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE submissions SET delivered_at = ? WHERE id = ?",
+                [(time(), entry_id) for entry_id in entry_ids],
+            )
+
+    def pending(self, limit: int, exclude: set) -> list:
+        """Return up to `limit` undelivered (id, worksheet, row) entries, oldest first."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT id, worksheet, row FROM submissions WHERE delivered_at IS NULL ORDER BY id"
+            )
+            entries = []
+            for entry_id, worksheet_name, row in cursor:
+                if entry_id in exclude:
+                    continue
+                entries.append((entry_id, worksheet_name, json.loads(row)))
+                if len(entries) >= limit:
+                    break
+            return entries
+
+    def recent(self, since: float) -> list:
+        """Return (worksheet, row) pairs journaled since the given time, delivered or not."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT worksheet, row FROM submissions WHERE created_at >= ? ORDER BY id", (since,)
+            )
+            return [(worksheet_name, json.loads(row)) for worksheet_name, row in cursor]
+
+    def undelivered_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM submissions WHERE delivered_at IS NULL").fetchone()[0]
+
+    def prune(self, retention_days: float) -> int:
+        """Delete delivered entries older than the retention period."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM submissions WHERE delivered_at IS NOT NULL AND delivered_at < ?",
+                (time() - retention_days * 86400,),
+            )
+            return cursor.rowcount
+
+submission_journal = SubmissionJournal(SUBMISSION_JOURNAL_PATH, stranded_worker_paths(SUBMISSION_JOURNAL_BASE_PATH))
+
+class SheetsWriteQueue:
+    """
+    Write-behind queue for Google Sheets rows.
+
+    Handlers record rows in the submission journal, enqueue them and return immediately;
+    a background task groups rows by worksheet and writes each group with a single
+    append_rows call once a batch fills up or the flush interval elapses, then marks the
+    journal entries delivered. The queue is bounded, and the writer stops taking new rows
+    while too many are waiting for Google, so producers feel backpressure. Rows that could
+    not be queued (and rows left over from a previous run) are replayed from the journal.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_size: int, journal: SubmissionJournal):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.1, flush_interval)
+        self.max_size = max(1, max_size)
+        self.journal = journal
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_size)
+        self._pending: dict[str, list] = defaultdict(list)
+        self._in_flight: set = set()
+        self._journal_lock = asyncio.Lock()
+        self._needs_replay = False
+        self._backpressure_logged = False
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self.rows_written = 0
+        self.rows_replayed = 0
+        self.batches_written = 0
+        self.failed_flushes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def depth(self) -> int:
+        """Number of rows accepted but not yet written to Google Sheets."""
+        return self._queue.qsize() + self._pending_count()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        await asyncio.to_thread(self.journal.open)
+        pruned = await asyncio.to_thread(self.journal.prune, SUBMISSION_JOURNAL_RETENTION_DAYS)
+        undelivered = await asyncio.to_thread(self.journal.undelivered_count)
+        if pruned:
+            logger.info(f"Pruned {pruned} delivered journal entries")
+        if undelivered:
+            logger.info(f"Resuming {undelivered} undelivered submission(s) from the journal")
+        # Resume anything left over from a previous run
+        self._needs_replay = True
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(), name="sheets-write-queue")
+        logger.info(
+            f"Sheets write queue started (batch={self.batch_size}, "
+            f"interval={self.flush_interval}s, max={self.max_size})"
+        )
+
+    async def stop(self) -> None:
+        """Stop the background writer and flush every row still waiting."""
+        if self._task:
+            # asyncio.wait_for can swallow a cancel that races with queue.get(); the flag ends the loop anyway
+            self._stopping = True
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        self._drain_queue()
+        await self._flush_all()
+        if self.depth():
+            logger.warning(f"Sheets write queue stopped with {self.depth()} undelivered rows; they stay in the journal")
+        await asyncio.to_thread(self.journal.close)
+
+    async def submit(self, worksheet_name: str, row: list) -> bool:
+        """Journal a row and queue it for the given worksheet. Returns False if it could not be accepted."""
+        if not self.running:
+            # No background writer (e.g. one-off scripts): write synchronously.
+            return await self._append_rows(worksheet_name, [row])
+
+        async with self._journal_lock:
+            entry_id = await asyncio.to_thread(self.journal.append, worksheet_name, row)
+            self._in_flight.add(entry_id)
+
+        if self._queue.full():
+            if not self._backpressure_logged:
+                self._backpressure_logged = True
+                logger.warning(f"Sheets write queue is full ({self.depth()} rows waiting); applying backpressure")
+        else:
+            self._backpressure_logged = False
+        try:
+            await asyncio.wait_for(self._queue.put((entry_id, worksheet_name, row)), SHEETS_ENQUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            # The row is safe in the journal; the writer picks it up once it catches up.
+            self._in_flight.discard(entry_id)
+            self._needs_replay = True
+            logger.warning("Sheets write queue stayed full; submission left in the journal for replay")
+        return True
+
+    def _pending_count(self) -> int:
+        return sum(len(entries) for entries in self._pending.values())
+
+    def _drain_queue(self) -> None:
+        while not self._queue.empty():
+            entry_id, worksheet_name, row = self._queue.get_nowait()
+            self._pending[worksheet_name].append((entry_id, row))
+
+    async def _replay(self) -> None:
+        """Load undelivered journal entries that are not already queued."""
+        room = self.max_size - self._pending_count()
+        # The lock keeps a concurrent submit from being both queued and replayed
+        async with self._journal_lock:
+            entries = await asyncio.to_thread(self.journal.pending, room, set(self._in_flight))
+            self._in_flight.update(entry_id for entry_id, _, _ in entries)
+        for entry_id, worksheet_name, row in entries:
+            self._pending[worksheet_name].append((entry_id, row))
+        self.rows_replayed += len(entries)
+        # More may be waiting if this replay filled all the room there was
+        self._needs_replay = len(entries) >= room
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = None
+        while not self._stopping:
+            try:
+                if self._needs_replay and self._queue.empty() and self._pending_count() < self.max_size:
+                    await self._replay()
+                    if self._pending_count() and deadline is None:
+                        deadline = loop.time()
+
+                if self._pending_count() >= self.max_size:
+                    # Google is falling behind: stop consuming so the bounded queue fills up
+                    # and producers wait; if the backlog can't be written, retry next interval.
+                    await self._flush_all()
+                    if self._pending_count() >= self.max_size:
+                        await asyncio.sleep(self.flush_interval)
+                    continue
+
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                try:
+                    entry_id, worksheet_name, row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    await self._flush_all()
+                    deadline = loop.time() + self.flush_interval if self._pending_count() or self._needs_replay else None
+                    continue
+
+                self._pending[worksheet_name].append((entry_id, row))
+                if deadline is None:
+                    deadline = loop.time() + self.flush_interval
+                if len(self._pending[worksheet_name]) >= self.batch_size:
+                    await self._flush(worksheet_name)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Unexpected error in Sheets write queue: {e}")
+                await asyncio.sleep(self.flush_interval)
+
+    async def _flush_all(self) -> None:
+        for worksheet_name in list(self._pending):
+            await self._flush(worksheet_name)
+
+    async def _flush(self, worksheet_name: str) -> None:
+        entries = self._pending.pop(worksheet_name, [])
+        if not entries:
+            return
+        if await self._append_rows(worksheet_name, [row for _, row in entries]):
+            entry_ids = [entry_id for entry_id, _ in entries]
+            await asyncio.to_thread(self.journal.mark_delivered, entry_ids)
+            self._in_flight.difference_update(entry_ids)
+            return
+        # Keep the rows (in their original order) for the next flush attempt.
+        self.failed_flushes += 1
+        self._pending[worksheet_name][:0] = entries
+
+    async def _append_rows(self, worksheet_name: str, rows: list) -> bool:
+        try:
+            table = worksheet_table(worksheet_name, partitions_only=True)
+            worksheet = await get_worksheet(worksheet_name, TABLE_COLUMNS[table] if table else None)
+            if not worksheet:
+                logger.error("Could not connect to Google Sheets")
+                return False
+
+            await sheets_scheduler.run(worksheet.append_rows, rows, kind="write")
+            self.rows_written += len(rows)
+            self.batches_written += 1
+            logger.info(f"Wrote {len(rows)} row(s) to '{worksheet_name}'")
+            return True
+        except SheetsCircuitOpenError:
+            logger.warning(f"Sheets circuit breaker is open; keeping {len(rows)} row(s) for '{worksheet_name}' for later")
+            return False
+        except Exception as e:
+            if _sheets_error_status(e) == 429:
+                logger.error(f"Sheets write quota exhausted writing {len(rows)} row(s) to '{worksheet_name}': {e}")
+            else:
+                logger.error(f"Error writing {len(rows)} row(s) to '{worksheet_name}': {e}")
+            await invalidate_sheet_handles(e, worksheet_name)
+            return False
+
+sheets_write_queue = SheetsWriteQueue(
+    SHEETS_BATCH_SIZE, SHEETS_FLUSH_INTERVAL, SHEETS_QUEUE_MAX_SIZE, submission_journal
+)
+
+# Row layouts shared by every storage backend (match scripts/setup_sheets.py headers)
+APPLICATIONS_TABLE = "applications"
+CONTACTS_TABLE = "contacts"
+TABLE_COLUMNS = {
+    APPLICATIONS_TABLE: [
+        'Timestamp', 'User ID', 'Job Position', 'Name', 'Country', 'Phone',
+        'Telegram Phone', 'Accommodation Needed', 'Current City', 'Language'
+    ],
+    CONTACTS_TABLE: [
+        'Timestamp', 'User ID', 'Name', 'Country', 'Phone',
+        'Telegram Phone', 'Accommodation Needed', 'Availability', 'Language'
+    ],
+}
+
+def table_base_worksheet(table: str) -> str:
+    return APPLICATIONS_SHEET_NAME if table == APPLICATIONS_TABLE else CONTACTS_SHEET_NAME
+
+def partition_worksheet_name(table: str, when: datetime) -> str:
+    """Monthly partition of a table, e.g. Applications_2026_10."""
+    return f"{table_base_worksheet(table)}_{when:%Y_%m}"
+
+def worksheet_table(worksheet_name: str, partitions_only: bool = False) -> Optional[str]:
+    """Map a base worksheet or one of its monthly partitions back to its table."""
+    for table in TABLE_COLUMNS:
+        base = table_base_worksheet(table)
+        if not partitions_only and worksheet_name == base:
+            return table
+        if re.fullmatch(rf"{re.escape(base)}_\d{{4}}_\d{{2}}", worksheet_name):
+            return table
+    return None
+
+def summary_view_formula(partition_names: list, columns: int) -> str:
+    """QUERY formula stacking the data rows of every partition into one view."""
+    last_column = gspread.utils.rowcol_to_a1(1, columns).rstrip('0123456789')
+    ranges = "; ".join(_a1_range(name, f"A2:{last_column}") for name in partition_names)
+    return f'=QUERY({{{ranges}}}, "select * where Col1 is not null", 0)'
+
+async def refresh_summary_view(sheet, table: str) -> None:
+    """Point the base worksheet (e.g. Applications) at every monthly partition of its table."""
+    base = table_base_worksheet(table)
+    titles = [worksheet.title for worksheet in await sheets_scheduler.run(sheet.worksheets)]
+    partitions = sorted(title for title in titles if worksheet_table(title, partitions_only=True) == table)
+    if f"{base}_archive" in titles:
+        # Rows written before partitioning was enabled
+        partitions.insert(0, f"{base}_archive")
+    if not partitions:
+        return
+    summary = await get_worksheet(base, TABLE_COLUMNS[table])
+    formula = summary_view_formula(partitions, len(TABLE_COLUMNS[table]))
+    await sheets_scheduler.run(summary.update, [[formula]], "A2", value_input_option="USER_ENTERED", kind="write")
+    logger.info(f"Summary view '{base}' now covers {len(partitions)} worksheet(s)")
+
+def build_application_row(session: UserSession) -> list:
+    """Build an Applications row from the user's conversation data."""
+    form = session.form or FormData()
+    return [
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        str(session.user_id if session.user_id is not None else 'Unknown'),
+        session.selected_job or '',
+        form.name or '',
+        form.country or '',
+        form.phone or '',
+        form.telegram_phone or '',
+        form.accommodation or '',
+        form.city or '',
+        session.lang
+    ]
+
+def build_contact_row(session: UserSession) -> list:
+    """Build a Contacts row from the user's conversation data."""
+    form = session.form or FormData()
+    return [
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        str(session.user_id if session.user_id is not None else 'Unknown'),
+        form.name or '',
+        form.country or '',
+        form.phone or '',
+        form.telegram_phone or '',
+        form.accommodation or '',
+        form.availability or '',
+        session.lang
+    ]
+
+class StorageBackend(Protocol):
+    """Where submissions are persisted. Tables are APPLICATIONS_TABLE and CONTACTS_TABLE."""
+
+    name: str
+
+    async def start(self) -> None: ...
+
+    async def save(self, table: str, row: list) -> bool: ...
+
+    async def read_rows(self, table: str) -> list: ...
+
+    async def stop(self) -> None: ...
+
+    def stats(self) -> dict: ...
+
+class SheetsStorage:
+    """Google Sheets storage: rows go through the journal and the batched write queue."""
+
+    name = "sheets"
+
+    def __init__(self, write_queue: SheetsWriteQueue):
+        self.write_queue = write_queue
+
+    def worksheet_name(self, table: str, when: Optional[datetime] = None) -> str:
+        if SHEETS_PARTITIONING == "monthly":
+            return partition_worksheet_name(table, when or datetime.now())
+        return table_base_worksheet(table)
+
+    async def start(self) -> None:
+        await self.write_queue.start()
+
+    async def save(self, table: str, row: list) -> bool:
+        return await self.write_queue.submit(self.worksheet_name(table), row)
+
+    async def read_rows(self, table: str) -> list:
+        """
+        Read every data row (headers excluded) with a single batch request.
+        With monthly partitioning only the current and previous month are read.
+        """
+        if SHEETS_PARTITIONING == "monthly":
+            now = datetime.now()
+            previous_month = now.replace(day=1) - timedelta(days=1)
+            names = [self.worksheet_name(table, previous_month), self.worksheet_name(table, now)]
+        else:
+            names = [self.worksheet_name(table)]
+
+        sheet = await setup_google_sheets()
+        if not sheet:
+            return []
+        existing = []
+        for name in names:
+            try:
+                await get_worksheet(name)
+                existing.append(name)
+            except gspread.exceptions.WorksheetNotFound:
+                continue
+        if not existing:
+            return []
+
+        result = await sheets_scheduler.run(sheet.values_batch_get, [_a1_range(name) for name in existing])
+        rows = []
+        for value_range in result.get("valueRanges", []):
+            values = value_range.get("values", [])
+            rows.extend(values[1:] if values and values[0] == TABLE_COLUMNS[table] else values)
+        return rows
+
+    async def stop(self) -> None:
+        await self.write_queue.stop()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.write_queue.running,
+            "depth": self.write_queue.depth(),
+            "rows_written": self.write_queue.rows_written,
+            "rows_replayed": self.write_queue.rows_replayed,
+            "rows_adopted": self.write_queue.journal.rows_adopted,
+            "failed_flushes": self.write_queue.failed_flushes,
+        }
+
+class SQLiteStorage:
+    """Local SQLite storage (WAL mode); each row is stored as a JSON array."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.rows_written = 0
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for table in TABLE_COLUMNS:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL)")
+        self._conn = conn
+
+    def _insert(self, table: str, row: list) -> None:
+        with self._lock:
+            self._conn.execute(f"INSERT INTO {table} (row) VALUES (?)", (json.dumps(row, ensure_ascii=False),))
+
+    def _select(self, table: str) -> list:
+        with self._lock:
+            return [json.loads(row) for (row,) in self._conn.execute(f"SELECT row FROM {table} ORDER BY id")]
+
+    async def start(self) -> None:
+        if self._conn is None:
+            await asyncio.to_thread(self._open)
+
+    async def save(self, table: str, row: list) -> bool:
+        try:
+            await asyncio.to_thread(self._insert, table, row)
+            self.rows_written += 1
+            return True
+        except Exception as e:
+            logger.error(f"Error saving row to SQLite table '{table}': {e}")
+            return False
+
+    async def read_rows(self, table: str) -> list:
+        return await asyncio.to_thread(self._select, table)
+
+    async def stop(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        return {"path": self.path, "rows_written": self.rows_written}
+
+class FileStorage:
+    """Local append-only files, one per table: CSV (with header) or JSON Lines."""
+
+    def __init__(self, directory: str, file_format: str):
+        self.directory = directory
+        self.name = file_format
+        self._lock = threading.Lock()
+        self.rows_written = 0
+
+    def path(self, table: str) -> str:
+        return os.path.join(self.directory, f"{table}.{self.name}")
+
+    def _append(self, table: str, row: list) -> None:
+        path = self.path(table)
+        with self._lock:
+            is_new = not os.path.exists(path)
+            with open(path, 'a', encoding='utf-8', newline='') as file:
+                if self.name == "csv":
+                    writer = csv.writer(file)
+                    if is_new:
+                        writer.writerow(TABLE_COLUMNS[table])
+                    writer.writerow(row)
+                else:
+                    file.write(json.dumps(dict(zip(TABLE_COLUMNS[table], row)), ensure_ascii=False) + '\n')
+
+    def _read(self, table: str) -> list:
+        path = self.path(table)
+        if not os.path.exists(path):
+            return []
+        with self._lock, open(path, 'r', encoding='utf-8', newline='') as file:
+            if self.name == "csv":
+                return list(csv.reader(file))[1:]
+            return [list(json.loads(line).values()) for line in file if line.strip()]
+
+    async def start(self) -> None:
+        await asyncio.to_thread(os.makedirs, self.directory, exist_ok=True)
+
+    async def save(self, table: str, row: list) -> bool:
+        try:
+            await asyncio.to_thread(self._append, table, row)
+            self.rows_written += 1
+            return True
+        except Exception as e:
+            logger.error(f"Error saving row to {self.path(table)}: {e}")
+            return False
+
+    async def read_rows(self, table: str) -> list:
+        return await asyncio.to_thread(self._read, table)
+
+    async def stop(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {"directory": self.directory, "rows_written": self.rows_written}
+
+class SyncedStorage:
+    """Local storage at disk speed, mirrored to Google Sheets asynchronously."""
+
+    def __init__(self, local: StorageBackend, sheets: SheetsStorage):
+        self.local = local
+        self.sheets = sheets
+        self.name = f"{local.name}+sheets"
+
+    async def start(self) -> None:
+        await self.local.start()
+        await self.sheets.start()
+
+    async def save(self, table: str, row: list) -> bool:
+        if not await self.local.save(table, row):
+            return False
+        # The row is already stored locally; a failed mirror is retried from the journal
+        if not await self.sheets.save(table, row):
+            logger.warning(f"Row saved locally but could not be queued for Google Sheets ({table})")
+        return True
+
+    async def read_rows(self, table: str) -> list:
+        return await self.local.read_rows(table)
+
+    async def stop(self) -> None:
+        await self.sheets.stop()
+        await self.local.stop()
+
+    def stats(self) -> dict:
+        return {"local": self.local.stats(), "sheets": self.sheets.stats()}
+
+def create_storage_backend() -> StorageBackend:
+    """Build the storage backend selected by STORAGE_BACKEND."""
+    sheets = SheetsStorage(sheets_write_queue)
+    if STORAGE_BACKEND == "sheets":
+        return sheets
+    if STORAGE_BACKEND == "sqlite":
+        local = SQLiteStorage(STORAGE_SQLITE_PATH)
+    elif STORAGE_BACKEND in ("csv", "jsonl"):
+        local = FileStorage(STORAGE_FILES_DIR, STORAGE_BACKEND)
+    else:
+        raise EnvironmentError(f"Unknown STORAGE_BACKEND={STORAGE_BACKEND!r} (expected sheets, sqlite, csv or jsonl)")
+    return SyncedStorage(local, sheets) if STORAGE_SYNC_TO_SHEETS else local
+
+storage = create_storage_backend()
+
+def normalize_phone(phone: str) -> str:
+    """Reduce a phone number to its last 9 digits, so +48 500 100 200 and 500100200 match."""
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-9:]
+
+def job_key(job_title: str) -> str:
+    """Language-independent key for a job title (its catalog id)."""
+    return job_catalog.job_id(job_title) or job_title
+
+class DuplicateApplicationIndex:
+    """
+    In-memory index of recent applications keyed on (normalized phone, job).
+
+    Lookups are a single dict access, so duplicates are caught before anything is
+    queued for storage. The index is warmed at startup from the local submission
+    journal and one bulk read of the Applications table.
+    """
+
+    def __init__(self, window_hours: float):
+        self.window = window_hours * 3600
+        self._seen: dict[tuple, float] = {}
+        self.duplicates_detected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def _key(self, phone: str, job_title: str) -> Optional[tuple]:
+        phone_key = normalize_phone(phone)
+        return (phone_key, job_key(job_title)) if phone_key else None
+
+    def check_and_add(self, phone: str, job_title: str, now: Optional[float] = None) -> bool:
+        """Return True if this application duplicates one inside the window, else record it."""
+        if not self.enabled:
+            return False
+        key = self._key(phone, job_title)
+        if key is None:
+            return False
+        now = time() if now is None else now
+        last_seen = self._seen.get(key)
+        if last_seen is not None and now - last_seen < self.window:
+            self.duplicates_detected += 1
+            return True
+        self._seen[key] = now
+        if len(self._seen) % 1000 == 0:
+            self.prune(now)
+        return False
+
+    def discard(self, phone: str, job_title: str) -> None:
+        """Forget an application that could not be saved, so the candidate can retry."""
+        key = self._key(phone, job_title)
+        if key is not None:
+            self._seen.pop(key, None)
+
+    async def claim(self, phone: str, job_title: str) -> bool:
+        """check_and_add() across instances: with shared state, the first instance to record it wins."""
+        if self.check_and_add(phone, job_title):
+            return True
+        key = self._key(phone, job_title)
+        if shared_state is None or key is None:
+            return False
+        if not await shared_state.claim("duplicate", "|".join(key), self.window):
+            self.duplicates_detected += 1
+            return True
+        return False
+
+    async def release(self, phone: str, job_title: str) -> None:
+        """discard() across instances."""
+        self.discard(phone, job_title)
+        key = self._key(phone, job_title)
+        if shared_state is not None and key is not None:
+            await shared_state.release("duplicate", "|".join(key))
+
+    def add_row(self, row: list) -> None:
+        """Record an Applications row (timestamp, user id, job, name, country, phone, ...)."""
+        try:
+            submitted_at = datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S').timestamp()
+            key = self._key(row[5], row[2])
+        except (IndexError, ValueError, TypeError):
+            return
+        if key is not None and submitted_at > self._seen.get(key, 0):
+            self._seen[key] = submitted_at
+
+    def prune(self, now: Optional[float] = None) -> None:
+        cutoff = (time() if now is None else now) - self.window
+        self._seen = {key: seen for key, seen in self._seen.items() if seen >= cutoff}
+
+    async def warm_up(self) -> None:
+        """Rebuild the index from the journal (disk) and one bulk read of the Applications table."""
+        if not self.enabled:
+            return
+        since = time() - self.window
+        sources = 0
+        if uses_google_sheets():
+            try:
+                await asyncio.to_thread(submission_journal.open)
+                for worksheet_name, row in await asyncio.to_thread(submission_journal.recent, since):
+                    if worksheet_table(worksheet_name) == APPLICATIONS_TABLE:
+                        self.add_row(row)
+                sources += 1
+            except Exception as e:
+                logger.warning(f"Could not warm duplicate index from the journal: {e}")
+        try:
+            for row in await storage.read_rows(APPLICATIONS_TABLE):
+                self.add_row(row)
+            sources += 1
+        except Exception as e:
+            logger.warning(f"Could not warm duplicate index from {storage.name} storage: {e}")
+        self.prune()
+        logger.info(f"Duplicate application index warmed with {len(self._seen)} recent application(s) from {sources} source(s)")
+        if shared_state is not None:
+            # Let the other instances know about the applications this one has stored
+            now = time()
+            try:
+                await shared_state.claim_many(
+                    "duplicate", [("|".join(key), seen + self.window - now) for key, seen in self._seen.items()]
+                )
+            except Exception as e:
+                logger.warning(f"Could not share the duplicate index: {e}")
+
+    def stats(self) -> dict:
+        return {"entries": len(self._seen), "duplicates_detected": self.duplicates_detected}
+
+duplicate_index = DuplicateApplicationIndex(DUPLICATE_WINDOW_HOURS)
+
+# Job catalog
+class Job(NamedTuple):
+    id: str
+    emoji: str
+    titles: dict    # language -> button title
+    sections: dict  # language -> '# heading' of the job in Job_descriptions_<lang>.md
+
+class JobCatalog:
+    """
+    Jobs from the catalog file (JobDescriptions/jobs.json), indexed once.
+
+    Every handler shares one instance: id -> Job, (language, title) -> id, title in any
+    language -> id, and the ordered title list per language. Adding a job means adding one
+    entry to the file (plus its description sections).
+    """
+
+    def __init__(self, jobs: list, section_emojis: dict, location_markers: Optional[dict] = None):
+        self.jobs = MappingProxyType({job.id: job for job in jobs})
+        self.section_emojis = MappingProxyType(section_emojis)
+        self.location_markers = MappingProxyType(location_markers or {})
+        self._by_title = {(lang, title): job.id for job in jobs for lang, title in job.titles.items()}
+        self._any_title = {}
+        for (_, title), job_id in self._by_title.items():
+            self._any_title.setdefault(title, job_id)
+        languages = {lang for job in jobs for lang in job.titles}
+        self._titles = {lang: tuple(job.titles[lang] for job in jobs if lang in job.titles) for lang in languages}
+
+    @classmethod
+    def from_file(cls, path: str) -> "JobCatalog":
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        jobs = []
+        for entry in data.get('jobs', []):
+            job_id = entry.get('id')
+            if not job_id or any(job.id == job_id for job in jobs):
+                raise ValueError(f"{path}: every job needs a unique 'id' (got {job_id!r})")
+            titles = entry.get('titles', {})
+            missing = [lang for lang in TRANSLATIONS if not titles.get(lang)]
+            if missing:
+                raise ValueError(f"{path}: job '{job_id}' has no title for {', '.join(missing)}")
+            # The description section defaults to the job title
+            sections = {**titles, **entry.get('sections', {})}
+            jobs.append(Job(job_id, entry.get('emoji', '💼'), titles, sections))
+        return cls(jobs, data.get('section_emojis', {}), data.get('location_markers', {}))
+
+    def titles(self, lang: str) -> tuple:
+        """Job titles in catalog order (falls back to Polish like get_text)."""
+        return self._titles.get(lang) or self._titles.get('pl', ())
+
+    def title(self, job_id: str, lang: str) -> Optional[str]:
+        job = self.jobs.get(job_id)
+        return job and (job.titles.get(lang) or job.titles.get('pl'))
+
+    def job_id(self, title: str, lang: Optional[str] = None) -> Optional[str]:
+        """Id of a job from its title, in the given language first and then in any language."""
+        return self._by_title.get((lang, title)) or self._any_title.get(title)
+
+    def title_emoji(self, lang: str, title: str) -> str:
+        job = self.jobs.get(self.job_id(title, lang))
+        return job.emoji if job else '💼'
+
+job_catalog = JobCatalog.from_file(JOB_CATALOG_PATH)
+
+# Job description rendering (markdown -> Telegram HTML)
+TELEGRAM_HTML_TAGS = {'b', 'strong', 'i', 'em', 'u', 'ins', 's', 'strike', 'del', 'a', 'code', 'pre', 'tg-spoiler', 'blockquote'}
+TELEGRAM_HTML_ENTITIES = {'lt', 'gt', 'amp', 'quot'}
+def _render_inline(text: str) -> str:
+    """Escape text for Telegram HTML and turn **bold** into <b>bold</b>; plain text is returned as is."""
+    if '&' in text or '<' in text or '>' in text:
+        text = html.escape(text, quote=False)
+    if '**' not in text:
+        return text
+    parts = text.split('**')
+    if len(parts) % 2 == 0:
+        # Unpaired trailing ** stays literal
+        parts[-2:] = [parts[-2] + '**' + parts[-1]]
+    parts[1::2] = [f"<b>{part}</b>" for part in parts[1::2]]
+    return ''.join(parts)
+
+def render_job_description_html(content: str, language: str, catalog: Optional[JobCatalog] = None) -> str:
+    """
+    Render a markdown job description as Telegram HTML in a single pass over its lines.
+    Blank lines are collapsed as they are emitted, so no clean-up passes are needed.
+    Title and section emoji come from the job catalog.
+    """
+    catalog = catalog or job_catalog
+    section_emojis = catalog.section_emojis.get(language, {})
+    out = []
+    for line in content.splitlines():
+        if line.startswith('- '):
+            out.append(f"• {_render_inline(line[2:].strip())}")
+        elif line.startswith('  - '):
+            out.append(f"    ▪️ {_render_inline(line[4:].strip())}")
+        elif line.startswith('# '):
+            title = line[2:].strip()
+            out.append(f"{catalog.title_emoji(language, title)} <b>{_render_inline(title)}</b>")
+            out.append('')
+        elif line.startswith('## '):
+            section = line[3:].strip()
+            out.append(f"{section_emojis.get(section, '▫️')} <b>{_render_inline(section)}</b>")
+            out.append('')
+        else:
+            stripped = line.strip()
+            if stripped == '---':
+                out.append('━━━━━')
+                out.append('')
+            elif stripped:
+                out.append(_render_inline(stripped))
+            elif out and out[-1]:
+                out.append('')
+    while out and not out[-1]:
+        out.pop()
+    return '\n'.join(out)
+
+class _TelegramHTMLValidator(HTMLParser):
+    """Check that text only uses tags and entities the Bot API accepts, properly nested."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.open_tags = []
+        self.errors = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in TELEGRAM_HTML_TAGS:
+            self.errors.append(f"unsupported tag <{tag}>")
+        self.open_tags.append(tag)
+
+    def handle_endtag(self, tag):
+        if not self.open_tags or self.open_tags.pop() != tag:
+            self.errors.append(f"unbalanced </{tag}>")
+
+    def handle_entityref(self, name):
+        if name not in TELEGRAM_HTML_ENTITIES:
+            self.errors.append(f"unsupported entity &{name};")
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+_HTML_TAG = re.compile(r'<(/?)([a-z][a-z-]*)[^>]*>')
+
+def _split_long_line(line: str, limit: int) -> list:
+    """Cut one oversized line at spaces, closing open HTML tags before each cut and reopening them after."""
+    pieces, reopen = [], ''
+    while len(reopen) + len(line) > limit:
+        room = max(1, limit - len(reopen) - 64)  # leave space for closing tags
+        cut = line.rfind(' ', 0, room)
+        if cut <= 0:
+            cut = room
+        # Never cut through a tag or an entity
+        if line.rfind('<', 0, cut) > line.rfind('>', 0, cut):
+            cut = line.rfind('<', 0, cut) or cut
+        if line.rfind('&', 0, cut) > line.rfind(';', 0, cut):
+            cut = line.rfind('&', 0, cut) or cut
+        piece = reopen + line[:cut]
+        open_tags = []
+        for match in _HTML_TAG.finditer(piece):
+            if match.group(1):
+                if open_tags and open_tags[-1][0] == match.group(2):
+                    open_tags.pop()
+            else:
+                open_tags.append((match.group(2), match.group(0)))
+        pieces.append(piece + ''.join(f"</{tag}>" for tag, _ in reversed(open_tags)))
+        reopen = ''.join(opening for _, opening in open_tags)
+        line = line[cut:].lstrip()
+    pieces.append(reopen + line)
+    return pieces
+
+def _pack(parts: list, separator: str, limit: int) -> list:
+    """Greedily join parts with separator into pieces no longer than limit."""
+    pieces, current = [], ''
+    for part in parts:
+        if current and len(current) + len(separator) + len(part) > limit:
+            pieces.append(current)
+            current = part
+        else:
+            current = f"{current}{separator}{part}" if current else part
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_telegram_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list:
+    """
+    Split a rendered message into chunks Telegram accepts. Cuts prefer section breaks (blank
+    lines), then bullet/line breaks, and only cut inside a line as a last resort. A heading is
+    never left at the end of a chunk without its content.
+    """
+    if len(text) <= limit:
+        return [text]
+
+    blocks = []
+    for block in text.split('\n\n'):
+        if len(block) <= limit:
+            blocks.append(block)
+            continue
+        lines = []
+        for line in block.split('\n'):
+            lines.extend(_split_long_line(line, limit) if len(line) > limit else [line])
+        blocks.extend(_pack(lines, '\n', limit))
+
+    chunks, current = [], []
+    for block in blocks:
+        if current and len('\n\n'.join(current + [block])) > limit:
+            carried = []
+            heading = current[-1]
+            if len(current) > 1 and '\n' not in heading and heading.endswith('</b>') \
+                    and len(heading) + 2 + len(block) <= limit:
+                carried = [current.pop()]
+            chunks.append('\n\n'.join(current))
+            current = carried
+        current.append(block)
+    chunks.append('\n\n'.join(current))
+    return chunks
+
+def validate_telegram_html(text: str) -> list:
+    """Return parse problems Telegram would reject the message for (empty if it is valid)."""
+    validator = _TelegramHTMLValidator()
+    validator.feed(text)
+    validator.close()
+    errors = validator.errors + [f"unclosed <{tag}>" for tag in validator.open_tags]
+    if not text.strip():
+        errors.append("empty message")
+    return errors
+
+# Bot language -> description file suffix (Ukrainian uses the ISO code in file names)
+JOB_DESCRIPTION_FILES = {
+    'pl': 'pl',
+    'ua': 'uk',
+    'ru': 'ru',
+    'en': 'en'
+}
+
+def split_job_sections(content: str) -> dict:
+    """Split a description file into {job title: markdown section starting with '# title'}."""
+    sections = {}
+    title, lines = None, []
+    for line in content.split('\n'):
+        if line.startswith('# '):
+            if title:
+                sections[title] = '\n'.join(lines).strip()
+            title, lines = line[2:].strip(), []
+        if title:
+            lines.append(line)
+    if title:
+        sections[title] = '\n'.join(lines).strip()
+    return sections
+
+# Location matching: Polish and Cyrillic spellings of a place reduce to the same key
+_LATIN_DIGRAPHS = (('ch', 'h'), ('cz', 'ch'), ('sz', 'sh'), ('rz', 'zh'))
+_TRANSLITERATION = str.maketrans({
+    'ą': 'on', 'ę': 'en', 'ł': 'l', 'ó': 'u', 'ś': 'sh', 'ć': 'ch', 'ń': 'n', 'ź': 'z', 'ż': 'zh', 'w': 'v',
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'ґ': 'g', 'д': 'd', 'е': 'e', 'є': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'і': 'i', 'ї': 'i', 'й': 'j', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'c', 'ч': 'ch', 'ш': 'sh',
+    'щ': 'shch', 'ъ': '', 'ь': '', 'ы': 'y', 'э': 'e', 'ю': 'u', 'я': 'a',
+})
+_NOT_CONSONANT = re.compile(r'[^bcdfghklmnpqrstvxz]+')
+_REPEATED = re.compile(r'(.)\1+')
+
+def normalize_city(name: str) -> str:
+    """
+    Spelling-insensitive key for a place name: transliterate Polish and Cyrillic to one Latin
+    form and keep the consonant skeleton, so 'Kraków', 'Краків' and 'krakow' all map to 'krkv'.
+    """
+    text = name.strip().lower()
+    for digraph, replacement in _LATIN_DIGRAPHS:
+        text = text.replace(digraph, replacement)
+    text = text.translate(_TRANSLITERATION).replace('nb', 'mb').replace('np', 'mp')
+    return _REPEATED.sub(r'\1', _NOT_CONSONANT.sub('', text))
+
+def extract_locations(section: str, markers: dict) -> list:
+    """Place names from '- **<Region> i okolice:** town, town i inne' lines of a job section."""
+    surroundings, others = markers.get('surroundings'), markers.get('others')
+    if not surroundings:
+        return []
+    places = []
+    for match in re.finditer(r'^\s*- \*\*(.+?)\*\*(.*)$', section, re.MULTILINE):
+        region = match.group(1).strip().rstrip(':').strip()
+        if not region.endswith(f" {surroundings}"):
+            continue
+        places.append(region[:-len(surroundings)].strip())
+        towns = match.group(2).strip().lstrip(':').strip()
+        if others and towns.endswith(others):
+            towns = towns[:-len(others)]
+        places.extend(town.strip() for town in towns.split(',') if town.strip())
+    return places
+
+class JobDescriptionIndex:
+    """
+    Pre-rendered job descriptions keyed by (language, job id).
+
+    The job catalog and every description file are read once; each job's section is
+    rendered to Telegram HTML, split into messages within Telegram's length limit and
+    validated, so a job click is a dict lookup. Place names listed in the descriptions go
+    into an inverted index (normalized city -> job ids) for "jobs near me". When the catalog
+    or a description file changes, everything is rebuilt off the event loop and swapped in
+    with single assignments (along with the keyboards and button router built from the
+    catalog).
+    """
+
+    def __init__(self, directory: str, catalog_path: str):
+        self.directory = directory
+        self.catalog_path = catalog_path
+        self._index: dict = {}
+        self._locations: dict = {}
+        self._mtimes: dict = {}
+        self.reloads = 0
+
+    def _paths(self) -> dict:
+        return {
+            lang: os.path.join(self.directory, f"Job_descriptions_{suffix}.md")
+            for lang, suffix in JOB_DESCRIPTION_FILES.items()
+        }
+
+    def _file_mtimes(self) -> dict:
+        mtimes = {}
+        for path in [self.catalog_path, *self._paths().values()]:
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def _build(self) -> tuple:
+        # Take mtimes first: a file edited while we read it is simply picked up next time
+        mtimes = self._file_mtimes()
+        catalog = JobCatalog.from_file(self.catalog_path)
+        index = {}
+        locations = defaultdict(set)
+        for lang, path in self._paths().items():
+            if mtimes[path] is None:
+                logger.error(f"Job description file not found: {path}")
+                continue
+            with open(path, 'r', encoding='utf-8') as file:
+                sections = split_job_sections(file.read())
+            for job in catalog.jobs.values():
+                section = sections.get(job.sections.get(lang))
+                if section is None:
+                    logger.warning(f"Job section '{job.sections.get(lang)}' not found in file {path}")
+                    continue
+                chunks = split_telegram_message(render_job_description_html(section, lang, catalog))
+                errors = [error for chunk in chunks for error in validate_telegram_html(chunk)]
+                if errors:
+                    # Never ship a message Telegram would refuse to parse; fall back to escaped text
+                    logger.error(f"Job description '{job.id}' ({lang}) does not render to valid HTML: {'; '.join(errors)}")
+                    chunks = split_telegram_message(html.escape(section))
+                index[(lang, job.id)] = tuple(chunks)
+                for place in extract_locations(section, catalog.location_markers.get(lang, {})):
+                    key = normalize_city(place)
+                    if len(key) >= 2:
+                        locations[key].add(job.id)
+        # Job ids in catalog order, so the filtered job list keeps the usual order
+        order = list(catalog.jobs)
+        locations = {key: tuple(sorted(job_ids, key=order.index)) for key, job_ids in locations.items()}
+        return catalog, index, locations, mtimes
+
+    def _install(self, catalog: JobCatalog, index: dict, locations: dict, mtimes: dict) -> None:
+        global job_catalog
+        job_catalog = catalog
+        keyboards.build()
+        router.build()
+        self._index, self._locations, self._mtimes = index, locations, mtimes
+
+    def load(self) -> None:
+        """Build the index synchronously (startup)."""
+        self._install(*self._build())
+        logger.info(f"Job description index built with {len(self._index)} description(s)")
+
+    async def reload_if_changed(self) -> bool:
+        mtimes = await asyncio.to_thread(self._file_mtimes)
+        if mtimes == self._mtimes:
+            return False
+        self._install(*await asyncio.to_thread(self._build))
+        self.reloads += 1
+        logger.info(f"Job descriptions changed on disk; index rebuilt with {len(self._index)} description(s)")
+        return True
+
+    async def watch(self, interval: float) -> None:
+        """Background task: poll file mtimes and hot-reload the index."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload_if_changed()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error reloading job descriptions: {e}")
+
+    def get(self, language: str, job_id: str) -> Optional[tuple]:
+        return self._index.get((language, job_id))
+
+    def jobs_near(self, city: str) -> tuple:
+        """Ids of jobs offered in or around a city (any spelling); falls back to single words."""
+        job_ids = self._locations.get(normalize_city(city))
+        if job_ids:
+            return job_ids
+        for word in re.split(r'[\s,-]+', city):
+            job_ids = self._locations.get(normalize_city(word))
+            if job_ids and len(word) > 2:
+                return job_ids
+        return ()
+
+    def stats(self) -> dict:
+        return {
+            "descriptions": len(self._index),
+            "multi_message": sum(1 for chunks in self._index.values() if len(chunks) > 1),
+            "locations": len(self._locations),
+            "reloads": self.reloads,
+        }
+
+job_descriptions = JobDescriptionIndex(JOB_DESCRIPTIONS_DIR, JOB_CATALOG_PATH)
+
+def get_job_description(job_id: str, language: str) -> Optional[tuple]:
+    """Return the rendered description (one or more messages) of a job in the given language."""
+    description = job_descriptions.get(language, job_id)
+    if description is None:
+        logger.error(f"No job description for '{job_id}' in language '{language}'")
+    return description
+
+# Helper functions
+def get_text(lang: str, key: str) -> str:
+    """Get translated text with fallback."""
+    return TRANSLATIONS.get(lang, TRANSLATIONS['pl']).get(key, key)
+
+def create_keyboard(buttons, lang):
+    """Create keyboard with proper error handling."""
+    try:
+        keyboard = []
+        for button in buttons:
+            if isinstance(button, list):
+                keyboard.append([KeyboardButton(get_text(lang, btn)) for btn in button])
+            else:
+                keyboard.append([KeyboardButton(get_text(lang, button))])
+        return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    except Exception as e:
+        logger.error(f"Error creating keyboard: {e}")
+        # Return basic keyboard as fallback
+        return ReplyKeyboardMarkup([[KeyboardButton("Menu")]], resize_keyboard=True)
+
+# Reply keyboards: layouts are rows of button texts for a language
+LANGUAGE_BUTTONS = {"🇵🇱 Polski": "pl", "🇺🇦 Українська": "ua", "🇷🇺 Русский": "ru"}
+
+KEYBOARD_LAYOUTS = {
+    'main_menu': lambda lang: [
+        [get_text(lang, 'check_jobs')], [get_text(lang, 'jobs_near_me')], [get_text(lang, 'job_alerts')],
+        [get_text(lang, 'contact_us')]
+    ],
+    'job_list': lambda lang: [[title] for title in job_catalog.titles(lang)] + [[get_text(lang, 'back')]],
+    'job_description': lambda lang: [[get_text(lang, 'apply_for_job')], [get_text(lang, 'back')]],
+    'contact_options': lambda lang: [
+        [get_text(lang, 'fill_form')], [get_text(lang, 'contact_info')], [get_text(lang, 'back')]
+    ],
+    'back': lambda lang: [[get_text(lang, 'back')]],
+    'cancel': lambda lang: [[get_text(lang, 'cancel')]],
+    'yes_no': lambda lang: [[get_text(lang, 'yes'), get_text(lang, 'no')], [get_text(lang, 'cancel')]],
+}
+
+class KeyboardRegistry:
+    """
+    Every reply keyboard the bot sends, built once per language.
+
+    Markups are immutable Telegram objects, so handlers share the same instances instead of
+    building button lists on every message. Call build() again after changing TRANSLATIONS;
+    the new registry replaces the old one in a single assignment.
+    """
+
+    def __init__(self):
+        self._keyboards = MappingProxyType({})
+        self._job_lists: dict = {}
+        self.language = ReplyKeyboardMarkup([[KeyboardButton(text) for text in LANGUAGE_BUTTONS]], resize_keyboard=True)
+
+    def build(self) -> None:
+        self._keyboards = MappingProxyType({
+            (lang, name): ReplyKeyboardMarkup(
+                [[KeyboardButton(text) for text in row] for row in layout(lang)], resize_keyboard=True
+            )
+            for lang in TRANSLATIONS
+            for name, layout in KEYBOARD_LAYOUTS.items()
+        })
+        self._job_lists = {}
+
+    def get(self, lang: str, name: str) -> ReplyKeyboardMarkup:
+        keyboard = self._keyboards.get((lang, name))
+        # Same fallback as get_text
+        return keyboard if keyboard is not None else self._keyboards[('pl', name)]
+
+    def job_list(self, lang: str, job_ids: tuple) -> ReplyKeyboardMarkup:
+        """Job list limited to some jobs (e.g. those near a city), built once per distinct selection."""
+        keyboard = self._job_lists.get((lang, job_ids))
+        if keyboard is None:
+            rows = [[job_catalog.title(job_id, lang)] for job_id in job_ids] + [[get_text(lang, 'back')]]
+            keyboard = self._job_lists[(lang, job_ids)] = ReplyKeyboardMarkup(rows, resize_keyboard=True)
+        return keyboard
+
+keyboards = KeyboardRegistry()
+keyboards.build()
+
+class Action(Enum):
+    """What a reply-keyboard button does; values are the TRANSLATIONS keys of the buttons."""
+    CHECK_JOBS = 'check_jobs'
+    JOBS_NEAR_ME = 'jobs_near_me'
+    JOB_ALERTS = 'job_alerts'
+    CONTACT_US = 'contact_us'
+    FILL_FORM = 'fill_form'
+    CONTACT_INFO = 'contact_info'
+    APPLY = 'apply_for_job'
+    BACK = 'back'
+    CANCEL = 'cancel'
+    YES = 'yes'
+    NO = 'no'
+    JOB = 'job'            # payload: job id from the catalog
+    LANGUAGE = 'language'  # payload: language code
+
+class ButtonRouter:
+    """
+    Reverse index from button text to (Action, payload), built from TRANSLATIONS and the job catalog.
+
+    Text is looked up in the user's language first and then in every language, so a user
+    whose keyboard is still in a previous language is routed correctly. Rebuild with build()
+    after changing TRANSLATIONS, like the keyboard registry.
+    """
+
+    def __init__(self):
+        self._by_language = MappingProxyType({})
+        self._any_language = MappingProxyType({})
+
+    def build(self) -> None:
+        by_language, any_language = {}, {}
+        for lang, texts in TRANSLATIONS.items():
+            for action in Action:
+                if action.value in texts:
+                    by_language[(lang, texts[action.value])] = (action, None)
+                    any_language.setdefault(texts[action.value], (action, None))
+        for job in job_catalog.jobs.values():
+            for lang, title in job.titles.items():
+                by_language[(lang, title)] = (Action.JOB, job.id)
+                any_language.setdefault(title, (Action.JOB, job.id))
+        for button, code in LANGUAGE_BUTTONS.items():
+            # Accept the language name with or without its flag
+            any_language[button] = any_language[button.split(' ', 1)[1]] = (Action.LANGUAGE, code)
+        self._by_language = MappingProxyType(by_language)
+        self._any_language = MappingProxyType(any_language)
+
+    def route(self, lang: str, text: Optional[str]) -> tuple:
+        """Return (Action, payload) for a button text, or (None, None) for free text."""
+        return self._by_language.get((lang, text)) or self._any_language.get(text, (None, None))
+
+router = ButtonRouter()
+router.build()
+
+async def process_form_step(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    current_step: FormStep,
+    next_step: Optional[FormStep],
+    validation_type: str,
+    error_key: str,
+    next_prompt_key: str,
+    form_data_key: str,
+    return_state: int,
+    keyboard_options: Optional[list] = None
+) -> tuple[bool, int]:
+    """
+    Process a single form step with validation and state management.
+    Returns (success, next_state) tuple.
+    """
+    lang = context.user_data.lang
+    text = update.message.text
+    
+    if not validate_input(validation_type, text):
+        await update.message.reply_text(get_text(lang, error_key))
+        return False, return_state
+    
+    setattr(context.user_data.form, form_data_key, sanitize_input(text))
+    
+    if next_step:
+        context.user_data.form_step = next_step
+        
+        if keyboard_options:
+            reply_markup = ReplyKeyboardMarkup(keyboard_options, resize_keyboard=True)
+        else:
+            reply_markup = keyboards.get(lang, 'cancel')
+        
+        await update.message.reply_text(
             get_text(lang, next_prompt_key),
             reply_markup=reply_markup
         )
@@ -652,7 +2619,7 @@ async def process_form_step(
 async def handle_error(update: Update, context: ContextTypes.DEFAULT_TYPE, error_msg: str = None) -> int:
     """Handle errors gracefully and return to main menu."""
     try:
-        lang = context.user_data.get('language', 'pl')
+        lang = context.user_data.lang
         message = error_msg or get_text(lang, 'error_occurred')
         
         await update.message.reply_text(message)
@@ -671,25 +2638,20 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         
         # Apply rate limiting
         if not await check_rate_limit(user_id):
-            return context.user_data.get('current_state', LANGUAGE_SELECTION)
+            return LANGUAGE_SELECTION
         
-        lang = context.user_data.get('language')
         username = update.effective_user.username or "Unknown"
 
-        if lang:
-            logger.info(f"User {user_id} ({username}) restarted with language '{lang}'. Returning to main menu.")
+        if context.user_data.language is not None:
+            logger.info(f"User {user_id} ({username}) restarted with language '{context.user_data.lang}'. Returning to main menu.")
             # Reset form state but keep language
-            for key in ['form_data', 'form_step', 'selected_job']:
-                context.user_data.pop(key, None)
+            context.user_data.clear_form()
             return await show_main_menu(update, context)
         
         # New user or language not set
         logger.info(f"User {user_id} ({username}) started the bot. Asking for language.")
         
-        keyboard = [
-            [KeyboardButton("🇵🇱 Polski"), KeyboardButton("🇺🇦 Українська"), KeyboardButton("🇷🇺 Русский")]
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup = keyboards.language
         
         await update.message.reply_text(
             "🌍 Wybierz język / Виберіть мову / Выберите язык",
@@ -703,25 +2665,17 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 async def language_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle language selection and show main menu."""
     try:
-        lang_map = {
-            "🇵🇱 Polski": "pl", 
-            "Polski": "pl",
-            "🇺🇦 Українська": "ua", 
-            "Українська": "ua",
-            "🇷🇺 Русский": "ru",
-            "Русский": "ru"
-        }
-        selected_lang = lang_map.get(update.message.text, "pl")
-        context.user_data['language'] = selected_lang
+        action, selected_lang = router.route(None, update.message.text)
+        if action is not Action.LANGUAGE:
+            selected_lang = "pl"
+        context.user_data.language = Language.from_code(selected_lang)
         
         user_id = update.effective_user.id
         logger.info(f"User {user_id} selected language: {selected_lang}")
+        # Job alerts follow the user's language
+        await asyncio.to_thread(subscriptions.set_language, user_id, selected_lang)
         
-        keyboard = [
-            [get_text(selected_lang, 'check_jobs')],
-            [get_text(selected_lang, 'contact_us')]
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup = keyboards.get(selected_lang, 'main_menu')
         
         welcome_text = get_text(selected_lang, 'welcome')
         await update.message.reply_text(welcome_text, reply_markup=reply_markup)
@@ -733,15 +2687,12 @@ async def language_selected(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def main_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle main menu selection."""
     try:
-        lang = context.user_data.get('language', 'pl')
-        text = update.message.text
+        lang = context.user_data.lang
+        action, _ = router.route(lang, update.message.text)
         
-        if text == get_text(lang, 'check_jobs'):
+        if action is Action.CHECK_JOBS:
             # Show job offers
-            jobs = get_text(lang, 'jobs')
-            keyboard = [[job] for job in jobs]
-            keyboard.append([get_text(lang, 'back')])
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            reply_markup = keyboards.get(lang, 'job_list')
             
             await update.message.reply_text(
                 get_text(lang, 'job_offers'),
@@ -749,14 +2700,26 @@ async def main_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
             )
             return JOB_SELECTION
         
-        elif text == get_text(lang, 'contact_us'):
+        elif action is Action.JOBS_NEAR_ME:
+            # Ask for a city, offering the one the user gave before
+            city = context.user_data.city
+            if city:
+                reply_markup = ReplyKeyboardMarkup([[city], [get_text(lang, 'back')]], resize_keyboard=True)
+            else:
+                reply_markup = keyboards.get(lang, 'back')
+            
+            await update.message.reply_text(
+                get_text(lang, 'enter_city_nearby'),
+                reply_markup=reply_markup
+            )
+            return NEARBY_JOBS
+        
+        elif action is Action.JOB_ALERTS:
+            return await toggle_job_alerts(update, context)
+        
+        elif action is Action.CONTACT_US:
             # Show contact options
-            keyboard = [
-                [get_text(lang, 'fill_form')],
-                [get_text(lang, 'contact_info')],
-                [get_text(lang, 'back')]
-            ]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            reply_markup = keyboards.get(lang, 'contact_options')
             
             await update.message.reply_text(
                 get_text(lang, 'contact_us'),
@@ -769,44 +2732,64 @@ async def main_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         logger.error(f"Error in main_menu_handler: {e}")
         return await handle_error(update, context)
 
+async def nearby_jobs_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Show the jobs offered in or around the city the user entered."""
+    try:
+        lang = context.user_data.lang
+        text = update.message.text
+        
+        if router.route(lang, text)[0] is Action.BACK:
+            return await show_main_menu(update, context)
+        
+        if not validate_input('city', text):
+            await update.message.reply_text(get_text(lang, 'invalid_input'))
+            return NEARBY_JOBS
+        
+        city = sanitize_input(text)
+        context.user_data.city = city
+        job_ids = job_descriptions.jobs_near(city)
+        if job_ids:
+            message = get_text(lang, 'jobs_near_city').format(city=city)
+            reply_markup = keyboards.job_list(lang, job_ids)
+        else:
+            message = get_text(lang, 'no_jobs_near_city').format(city=city)
+            reply_markup = keyboards.get(lang, 'job_list')
+        
+        await update.message.reply_text(message, reply_markup=reply_markup)
+        return JOB_SELECTION
+    except Exception as e:
+        logger.error(f"Error in nearby_jobs_handler: {e}")
+        return await handle_error(update, context)
+
 async def job_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle job selection and show job description."""
     try:
-        lang = context.user_data.get('language', 'pl')
-        text = update.message.text
+        lang = context.user_data.lang
+        action, job_id = router.route(lang, update.message.text)
         
-        if text == get_text(lang, 'back'):
+        if action is Action.BACK:
             return await show_main_menu(update, context)
         
-        # Check if it's a valid job
-        jobs = get_text(lang, 'jobs')
-        if text in jobs:
-            context.user_data['selected_job'] = text
+        # Check if it's a valid job (button text from any language is accepted)
+        if action is Action.JOB:
+            context.user_data.selected_job = job_catalog.title(job_id, lang)
             
             # Load job description
-            job_description = await load_job_description(text, lang)
+            job_description = get_job_description(job_id, lang)
             
             if job_description:
                 # Show job description with apply button
-                keyboard = [
-                    [get_text(lang, 'apply_for_job')],
-                    [get_text(lang, 'back')]
-                ]
-                reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+                reply_markup = keyboards.get(lang, 'job_description')
                 
-                # Try Markdown first, fallback to plain text if parsing fails
-                try:
-                    await update.message.reply_text(
-                        job_description,
-                        reply_markup=reply_markup,
-                        parse_mode='Markdown'
-                    )
-                except Exception:
-                    # Fallback to plain text if Markdown parsing fails
-                    await update.message.reply_text(
-                        job_description,
-                        reply_markup=reply_markup
-                    )
+                # Descriptions are pre-split and validated when the index is built, so neither
+                # length nor HTML parsing can fail here; the keyboard goes with the last message
+                for chunk in job_description[:-1]:
+                    await update.message.reply_text(chunk, parse_mode=ParseMode.HTML)
+                await update.message.reply_text(
+                    job_description[-1],
+                    reply_markup=reply_markup,
+                    parse_mode=ParseMode.HTML
+                )
                 return JOB_DESCRIPTION
             else:
                 # Fallback if job description not found
@@ -823,15 +2806,12 @@ async def job_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 async def job_description_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle job description actions - apply or go back."""
     try:
-        lang = context.user_data.get('language', 'pl')
-        text = update.message.text
+        lang = context.user_data.lang
+        action, _ = router.route(lang, update.message.text)
         
-        if text == get_text(lang, 'back'):
+        if action is Action.BACK:
             # Go back to job selection
-            jobs = get_text(lang, 'jobs')
-            keyboard = [[job] for job in jobs]
-            keyboard.append([get_text(lang, 'back')])
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            reply_markup = keyboards.get(lang, 'job_list')
             
             await update.message.reply_text(
                 get_text(lang, 'job_offers'),
@@ -839,14 +2819,11 @@ async def job_description_handler(update: Update, context: ContextTypes.DEFAULT_
             )
             return JOB_SELECTION
         
-        elif text == get_text(lang, 'apply_for_job'):
+        elif action is Action.APPLY:
             # Start application form
-            context.user_data['form_data'] = {}
-            context.user_data['form_step'] = FormStep.NAME.value
-            context.user_data['user_id'] = update.effective_user.id
+            context.user_data.start_form(update.effective_user.id)
             
-            keyboard = [[get_text(lang, 'cancel')]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            reply_markup = keyboards.get(lang, 'cancel')
             
             await update.message.reply_text(
                 get_text(lang, 'enter_name'),
@@ -862,79 +2839,78 @@ async def job_description_handler(update: Update, context: ContextTypes.DEFAULT_
 async def job_application_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle job application form steps with input validation."""
     try:
-        lang = context.user_data.get('language', 'pl')
+        lang = context.user_data.lang
         text = update.message.text
         
-        if text == get_text(lang, 'cancel'):
+        if router.route(lang, text)[0] is Action.CANCEL:
             return await show_main_menu(update, context)
         
-        form_step = context.user_data.get('form_step')
-        form_data = context.user_data.get('form_data', {})
+        form_step = context.user_data.form_step
+        form = context.user_data.form
         
-        if form_step == FormStep.NAME.value:
+        if form_step is FormStep.NAME:
             if not validate_input('name', text):
                 await update.message.reply_text(get_text(lang, 'invalid_name'))
                 return JOB_APPLICATION
             
-            form_data['name'] = sanitize_input(text)
-            context.user_data['form_step'] = FormStep.COUNTRY.value
+            form.name = sanitize_input(text)
+            context.user_data.form_step = FormStep.COUNTRY
             await update.message.reply_text(get_text(lang, 'enter_country'))
         
-        elif form_step == FormStep.COUNTRY.value:
+        elif form_step is FormStep.COUNTRY:
             if not validate_input('country', text):
                 await update.message.reply_text(get_text(lang, 'invalid_input'))
                 return JOB_APPLICATION
             
-            form_data['country'] = sanitize_input(text)
-            context.user_data['form_step'] = FormStep.PHONE.value
+            form.country = sanitize_input(text)
+            context.user_data.form_step = FormStep.PHONE
             await update.message.reply_text(get_text(lang, 'enter_phone'))
         
-        elif form_step == FormStep.PHONE.value:
+        elif form_step is FormStep.PHONE:
             if not validate_input('phone', text):
                 await update.message.reply_text(get_text(lang, 'invalid_phone'))
                 return JOB_APPLICATION
             
-            form_data['phone'] = sanitize_input(text)
-            context.user_data['form_step'] = FormStep.TELEGRAM_PHONE.value
+            form.phone = sanitize_input(text)
+            context.user_data.form_step = FormStep.TELEGRAM_PHONE
             await update.message.reply_text(get_text(lang, 'enter_telegram_phone'))
         
-        elif form_step == FormStep.TELEGRAM_PHONE.value:
+        elif form_step is FormStep.TELEGRAM_PHONE:
             if not validate_input('phone', text):
                 await update.message.reply_text(get_text(lang, 'invalid_phone'))
                 return JOB_APPLICATION
             
-            form_data['telegram_phone'] = sanitize_input(text)
-            context.user_data['form_step'] = FormStep.ACCOMMODATION.value
+            form.telegram_phone = sanitize_input(text)
+            context.user_data.form_step = FormStep.ACCOMMODATION
             
-            keyboard = [[get_text(lang, 'yes'), get_text(lang, 'no')], [get_text(lang, 'cancel')]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            reply_markup = keyboards.get(lang, 'yes_no')
             await update.message.reply_text(
                 get_text(lang, 'enter_accommodation'),
                 reply_markup=reply_markup
             )
         
-        elif form_step == FormStep.ACCOMMODATION.value:
+        elif form_step is FormStep.ACCOMMODATION:
             if not validate_input('accommodation', text):
                 await update.message.reply_text(get_text(lang, 'invalid_input'))
                 return JOB_APPLICATION
             
-            form_data['accommodation'] = sanitize_input(text)
-            context.user_data['form_step'] = FormStep.CITY.value
+            form.accommodation = sanitize_input(text)
+            context.user_data.form_step = FormStep.CITY
             
-            keyboard = [[get_text(lang, 'cancel')]]
-            reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            reply_markup = keyboards.get(lang, 'cancel')
             await update.message.reply_text(
                 get_text(lang, 'enter_city'),
                 reply_markup=reply_markup
             )
         
-        elif form_step == FormStep.CITY.value:
+        elif form_step is FormStep.CITY:
             if not validate_input('city', text):
                 await update.message.reply_text(get_text(lang, 'invalid_input'))
                 return JOB_APPLICATION
             
-            form_data['city'] = sanitize_input(text)
-            context.user_data['form_data'] = form_data
+            form.city = sanitize_input(text)
+            # Remembered for "jobs near me"
+            context.user_data.city = form.city
             
             # Save to Google Sheets
             success = await save_job_application(context.user_data)
@@ -952,7 +2928,6 @@ async def job_application_handler(update: Update, context: ContextTypes.DEFAULT_
             
             return await show_main_menu(update, context)
         
-        context.user_data['form_data'] = form_data
         return JOB_APPLICATION
     except Exception as e:
         logger.error(f"Error in job_application_handler: {e}")
@@ -960,19 +2935,16 @@ async def job_application_handler(update: Update, context: ContextTypes.DEFAULT_
 
 async def contact_option_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle contact options."""
-    lang = context.user_data.get('language', 'pl')
-    text = update.message.text
+    lang = context.user_data.lang
+    action, _ = router.route(lang, update.message.text)
     
-    if text == get_text(lang, 'back'):
+    if action is Action.BACK:
         return await show_main_menu(update, context)
     
-    elif text == get_text(lang, 'fill_form'):
-        context.user_data['form_data'] = {}
-        context.user_data['form_step'] = FormStep.NAME.value
-        context.user_data['user_id'] = update.effective_user.id
+    elif action is Action.FILL_FORM:
+        context.user_data.start_form(update.effective_user.id)
         
-        keyboard = [[get_text(lang, 'cancel')]]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup = keyboards.get(lang, 'cancel')
         
         await update.message.reply_text(
             get_text(lang, 'enter_name'),
@@ -980,9 +2952,8 @@ async def contact_option_handler(update: Update, context: ContextTypes.DEFAULT_T
         )
         return CONTACT_FORM
     
-    elif text == get_text(lang, 'contact_info'):
-        keyboard = [[get_text(lang, 'back')]]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    elif action is Action.CONTACT_INFO:
+        reply_markup = keyboards.get(lang, 'back')
         
         await update.message.reply_text(
             get_text(lang, 'contact_details'),
@@ -994,73 +2965,70 @@ async def contact_option_handler(update: Update, context: ContextTypes.DEFAULT_T
 
 async def contact_form_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle contact form steps."""
-    lang = context.user_data.get('language', 'pl')
+    lang = context.user_data.lang
     text = update.message.text
     
-    if text == get_text(lang, 'cancel'):
+    if router.route(lang, text)[0] is Action.CANCEL:
         return await show_main_menu(update, context)
     
-    form_step = context.user_data.get('form_step')
-    form_data = context.user_data.get('form_data', {})
+    form_step = context.user_data.form_step
+    form = context.user_data.form
     
-    if form_step == FormStep.NAME.value:
+    if form_step is FormStep.NAME:
         if not validate_input('name', text):
             await update.message.reply_text(get_text(lang, 'invalid_name'))
             return CONTACT_FORM
-        form_data['name'] = sanitize_input(text)
-        context.user_data['form_step'] = FormStep.COUNTRY.value
+        form.name = sanitize_input(text)
+        context.user_data.form_step = FormStep.COUNTRY
         await update.message.reply_text(get_text(lang, 'enter_country'))
     
-    elif form_step == FormStep.COUNTRY.value:
+    elif form_step is FormStep.COUNTRY:
         if not validate_input('country', text):
             await update.message.reply_text(get_text(lang, 'invalid_input'))
             return CONTACT_FORM
-        form_data['country'] = sanitize_input(text)
-        context.user_data['form_step'] = FormStep.PHONE.value
+        form.country = sanitize_input(text)
+        context.user_data.form_step = FormStep.PHONE
         await update.message.reply_text(get_text(lang, 'enter_phone'))
     
-    elif form_step == FormStep.PHONE.value:
+    elif form_step is FormStep.PHONE:
         if not validate_input('phone', text):
             await update.message.reply_text(get_text(lang, 'invalid_phone'))
             return CONTACT_FORM
-        form_data['phone'] = sanitize_input(text)
-        context.user_data['form_step'] = FormStep.TELEGRAM_PHONE.value
+        form.phone = sanitize_input(text)
+        context.user_data.form_step = FormStep.TELEGRAM_PHONE
         await update.message.reply_text(get_text(lang, 'enter_telegram_phone'))
     
-    elif form_step == FormStep.TELEGRAM_PHONE.value:
+    elif form_step is FormStep.TELEGRAM_PHONE:
         if not validate_input('phone', text):
             await update.message.reply_text(get_text(lang, 'invalid_phone'))
             return CONTACT_FORM
-        form_data['telegram_phone'] = sanitize_input(text)
-        context.user_data['form_step'] = FormStep.ACCOMMODATION.value
+        form.telegram_phone = sanitize_input(text)
+        context.user_data.form_step = FormStep.ACCOMMODATION
         
-        keyboard = [[get_text(lang, 'yes'), get_text(lang, 'no')], [get_text(lang, 'cancel')]]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup = keyboards.get(lang, 'yes_no')
         await update.message.reply_text(
             get_text(lang, 'enter_accommodation'),
             reply_markup=reply_markup
         )
     
-    elif form_step == FormStep.ACCOMMODATION.value:
+    elif form_step is FormStep.ACCOMMODATION:
         if not validate_input('accommodation', text):
             await update.message.reply_text(get_text(lang, 'invalid_input'))
             return CONTACT_FORM
-        form_data['accommodation'] = sanitize_input(text)
-        context.user_data['form_step'] = FormStep.AVAILABILITY.value
+        form.accommodation = sanitize_input(text)
+        context.user_data.form_step = FormStep.AVAILABILITY
         
-        keyboard = [[get_text(lang, 'cancel')]]
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup = keyboards.get(lang, 'cancel')
         await update.message.reply_text(
             get_text(lang, 'enter_availability'),
             reply_markup=reply_markup
         )
     
-    elif form_step == FormStep.AVAILABILITY.value:
+    elif form_step is FormStep.AVAILABILITY:
         if not validate_input('availability', text):
             await update.message.reply_text(get_text(lang, 'invalid_input'))
             return CONTACT_FORM
-        form_data['availability'] = sanitize_input(text)
-        context.user_data['form_data'] = form_data
+        form.availability = sanitize_input(text)
         
         # Save to Google Sheets
         success = await save_contact_form(context.user_data)
@@ -1077,18 +3045,13 @@ async def contact_form_handler(update: Update, context: ContextTypes.DEFAULT_TYP
             )
         return await show_main_menu(update, context)
     
-    context.user_data['form_data'] = form_data
     return CONTACT_FORM
 
 async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Show the main menu."""
-    lang = context.user_data.get('language', 'pl')
+    lang = context.user_data.lang
     
-    keyboard = [
-        [get_text(lang, 'check_jobs')],
-        [get_text(lang, 'contact_us')]
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    reply_markup = keyboards.get(lang, 'main_menu')
     
     await update.message.reply_text(
         get_text(lang, 'main_menu'),
@@ -1096,136 +3059,1394 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     )
     return MAIN_MENU
 
-async def save_job_application(user_data) -> bool:
-    """Save job application data to Google Sheets Applications worksheet."""
+async def save_job_application(session: UserSession) -> bool:
+    """Save job application data to the configured storage backend."""
     try:
-        sheet = await setup_google_sheets()
-        if not sheet:
-            logger.error("Could not connect to Google Sheets")
+        phone, job = session.form.phone or '', session.selected_job or ''
+        if await duplicate_index.claim(phone, job):
+            # Already applied for this job recently: acknowledge without writing another row
+            logger.info(f"Duplicate job application ignored for user {anonymize_user_id(session.user_id)}")
+            return True
+        if not await storage.save(APPLICATIONS_TABLE, build_application_row(session)):
+            await duplicate_index.release(phone, job)
             return False
-        
-        worksheet = await asyncio.to_thread(sheet.worksheet, APPLICATIONS_SHEET_NAME)
-        
-        # Prepare row data for insertion
-        form_data = user_data.get('form_data', {})
-        user_id = user_data.get('user_id', 'Unknown')
-        row = [
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            str(user_id),
-            user_data.get('selected_job', ''),
-            form_data.get('name', ''),
-            form_data.get('country', ''),
-            form_data.get('phone', ''),
-            form_data.get('telegram_phone', ''),
-            form_data.get('accommodation', ''),
-            form_data.get('city', ''),
-            user_data.get('language', 'pl')
-        ]
-        
-        await asyncio.to_thread(worksheet.append_row, row)
-        logger.info(f"Job application saved successfully for user {anonymize_user_id(user_id)}")
+        logger.info(f"Job application saved for user {anonymize_user_id(session.user_id)}")
         return True
     except Exception as e:
         logger.error(f"Error saving job application: {e}")
         return False
 
-async def save_contact_form(user_data) -> bool:
-    """Save contact form data to Google Sheets Contacts worksheet."""
-    try:
-        sheet = await setup_google_sheets()
-        if not sheet:
-            logger.error("Could not connect to Google Sheets")
-            return False
-        
-        worksheet = await asyncio.to_thread(sheet.worksheet, CONTACTS_SHEET_NAME)
-        
-        # Prepare row data for insertion
-        form_data = user_data.get('form_data', {})
-        user_id = user_data.get('user_id', 'Unknown')
-        row = [
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            str(user_id),
-            form_data.get('name', ''),
-            form_data.get('country', ''),
-            form_data.get('phone', ''),
-            form_data.get('telegram_phone', ''),
-            form_data.get('accommodation', ''),
-            form_data.get('availability', ''),
-            user_data.get('language', 'pl')
-        ]
-        
-        await asyncio.to_thread(worksheet.append_row, row)
-        logger.info(f"Contact form saved successfully for user {anonymize_user_id(user_id)}")
-        return True
-    except Exception as e:
-        logger.error(f"Error saving contact form: {e}")
-        return False
+async def save_contact_form(session: UserSession) -> bool:
+    """Save contact form data to the configured storage backend."""
+    try:
+        if not await storage.save(CONTACTS_TABLE, build_contact_row(session)):
+            return False
+        logger.info(f"Contact form saved for user {anonymize_user_id(session.user_id)}")
+        return True
+    except Exception as e:
+        logger.error(f"Error saving contact form: {e}")
+        return False
+
+async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Handle /menu command - go to main menu."""
+    lang = context.user_data.lang
+    
+    # If no language selected yet, start language selection
+    if not lang:
+        return await start(update, context)
+    
+    return await show_main_menu(update, context)
+
+async def contact_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Handle /contact command - show contact information."""
+    lang = context.user_data.lang
+    
+    # If no language selected yet, start language selection
+    if not lang:
+        return await start(update, context)
+    
+    await update.message.reply_text(get_text(lang, 'contact_details'))
+    
+    # Return to current state or main menu
+    return await show_main_menu(update, context)
+
+async def language_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Handle /language command - allow user to change language."""
+    reply_markup = keyboards.language
+    
+    await update.message.reply_text(
+        "🌍 Wybierz język / Виберіть мову / Выберите язык",
+        reply_markup=reply_markup
+    )
+    return LANGUAGE_SELECTION
+
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Cancel current operation and return to main menu."""
+    lang = context.user_data.lang
+    
+    # Clear any form data
+    context.user_data.clear_form()
+    
+    # If no language selected yet, start language selection
+    if not lang:
+        return await start(update, context)
+    
+    # Return to main menu
+    return await show_main_menu(update, context)
+
+async def toggle_job_alerts(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Subscribe to (or unsubscribe from) new job offer alerts."""
+    lang = context.user_data.lang
+    user_id = update.effective_user.id
+    
+    if await asyncio.to_thread(subscriptions.is_subscribed, user_id):
+        await asyncio.to_thread(subscriptions.unsubscribe, user_id)
+        message = get_text(lang, 'alerts_off')
+    else:
+        await asyncio.to_thread(subscriptions.subscribe, user_id, lang)
+        message = get_text(lang, 'alerts_on')
+    logger.info(f"User {anonymize_user_id(user_id)} toggled job alerts")
+    
+    await update.message.reply_text(message, reply_markup=keyboards.get(lang, 'main_menu'))
+    return MAIN_MENU
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin only: /broadcast <job_id> alerts subscribers to a job; /broadcast alone shows progress."""
+    if not context.args:
+        recent = await asyncio.to_thread(subscriptions.broadcasts, 5)
+        lines = [
+            f"#{b['id']} {b['job_id']}: {b['status']}, {b['sent']}/{b['total']} sent, "
+            f"{b['blocked']} blocked, {b['failed']} failed"
+            for b in recent
+        ]
+        subscribers = await asyncio.to_thread(subscriptions.count)
+        await update.message.reply_text("\n".join([f"🔔 {subscribers} subscribers"] + lines))
+        return
+    
+    job_id = context.args[0]
+    if job_id not in job_catalog.jobs:
+        await update.message.reply_text(f"Unknown job id. Known ids: {', '.join(job_catalog.jobs)}")
+        return
+    
+    broadcast_id, total = await broadcasts.create(context.bot, job_id)
+    await update.message.reply_text(f"📣 Broadcast #{broadcast_id} of '{job_id}' started for {total} subscribers")
+
+def update_user_key(update: object) -> Optional[int]:
+    """The user (or, failing that, chat) an update belongs to."""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates concurrently while keeping each user's updates strictly ordered.
+
+    Every update first waits for its user's lock (FIFO, so a user's messages are handled in
+    the order Telegram sent them and ConversationHandler state never races), then for one
+    of `concurrency` global slots. A user with a backlog therefore holds at most one slot.
+    The base class bounds all accepted updates, waiting or running, to `max_pending`.
+    """
+
+    def __init__(self, concurrency: int, max_pending: int):
+        super().__init__(max(max_pending, concurrency, 2))
+        self.concurrency = max(concurrency, 1)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._user_locks: dict = {}
+        self._waiting: dict = defaultdict(int)
+        self._waits = deque(maxlen=1000)
+        self.running = 0
+        self.processed = 0
+        self.max_wait = 0.0
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        queued = monotonic()
+        key = update_user_key(update)
+        if key is None:
+            lock = contextlib.nullcontext()
+        else:
+            lock = self._user_locks.setdefault(key, asyncio.Lock())
+            self._waiting[key] += 1
+        try:
+            async with lock:
+                async with self._slots:
+                    waited = monotonic() - queued
+                    self._waits.append(waited)
+                    self.max_wait = max(self.max_wait, waited)
+                    self.running += 1
+                    try:
+                        await coroutine
+                    finally:
+                        self.running -= 1
+                        self.processed += 1
+        finally:
+            if key is not None:
+                self._waiting[key] -= 1
+                if not self._waiting[key]:
+                    del self._waiting[key]
+                    del self._user_locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        return {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "pending": self.current_concurrent_updates,
+            "users_pending": len(self._user_locks),
+            "processed": self.processed,
+            "wait_ms_mean": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            "wait_ms_p95": round(waits[int((len(waits) - 1) * 0.95)] * 1000, 1) if waits else 0.0,
+            "wait_ms_max": round(self.max_wait * 1000, 1),
+        }
+
+update_processor = PerUserUpdateProcessor(UPDATE_CONCURRENCY, UPDATE_MAX_PENDING)
+
+# Deletes a lock only if it still holds the caller's token, atomically on the server
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class InMemoryRedis:
+    """
+    In-process stand-in for the Redis commands SharedState uses (GET, SET with NX/EX/PX, DEL,
+    INCRBY, PEXPIRE, PING, and EVAL of RELEASE_LOCK_SCRIPT) and their pipelines, so the shared
+    state code runs in tests and on a single instance without a server. Values are bytes, as
+    redis-py returns them.
+    """
+
+    def __init__(self):
+        self._data: dict = {}  # key -> (value, expires_at or None)
+        self._scripts = {RELEASE_LOCK_SCRIPT: self._delete_if_equal}
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode('utf-8')
+
+    def _live(self, key: str):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def _get(self, key: str) -> Optional[bytes]:
+        entry = self._live(key)
+        return entry[0] if entry else None
+
+    def _set(self, key: str, value, ex=None, px=None, nx: bool = False) -> Optional[bool]:
+        if nx and self._live(key) is not None:
+            return None
+        ttl = px / 1000 if px is not None else ex
+        self._data[key] = (self._encode(value), monotonic() + ttl if ttl is not None else None)
+        return True
+
+    def _delete(self, *keys: str) -> int:
+        return sum(1 for key in keys if self._live(key) is not None and self._data.pop(key))
+
+    def _incrby(self, key: str, amount: int) -> int:
+        entry = self._live(key)
+        value = int(entry[0]) + amount if entry else amount
+        self._data[key] = (self._encode(value), entry[1] if entry else None)
+        return value
+
+    def _pexpire(self, key: str, milliseconds: int) -> bool:
+        entry = self._live(key)
+        if entry is None:
+            return False
+        self._data[key] = (entry[0], monotonic() + milliseconds / 1000)
+        return True
+
+    def _delete_if_equal(self, key: str, value) -> int:
+        entry = self._live(key)
+        if entry is None or entry[0] != self._encode(value):
+            return 0
+        del self._data[key]
+        return 1
+
+    def _eval(self, script: str, numkeys: int, *keys_and_args):
+        if script not in self._scripts:
+            raise NotImplementedError("InMemoryRedis only runs the scripts SharedState uses")
+        # Like a Lua script on the server, nothing else runs in between
+        return self._scripts[script](*keys_and_args)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._get(key)
+
+    async def set(self, key: str, value, ex=None, px=None, nx: bool = False) -> Optional[bool]:
+        return self._set(key, value, ex, px, nx)
+
+    async def delete(self, *keys: str) -> int:
+        return self._delete(*keys)
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args):
+        return self._eval(script, numkeys, *keys_and_args)
+
+    async def ping(self) -> bool:
+        return True
+
+    async def aclose(self) -> None:
+        pass
+
+    def pipeline(self, transaction: bool = True) -> "InMemoryPipeline":
+        return InMemoryPipeline(self)
+
+class InMemoryPipeline:
+    """Queued commands of an InMemoryRedis pipeline, run by execute() like one round trip."""
+
+    def __init__(self, client: InMemoryRedis):
+        self._client = client
+        self._commands = []
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    def _queue(self, method, *args, **kwargs) -> "InMemoryPipeline":
+        self._commands.append((method, args, kwargs))
+        return self
+
+    def get(self, key):
+        return self._queue(self._client._get, key)
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        return self._queue(self._client._set, key, value, ex, px, nx)
+
+    def delete(self, *keys):
+        return self._queue(self._client._delete, *keys)
+
+    def incrby(self, key, amount):
+        return self._queue(self._client._incrby, key, amount)
+
+    def pexpire(self, key, milliseconds):
+        return self._queue(self._client._pexpire, key, milliseconds)
+
+    def eval(self, script, numkeys, *keys_and_args):
+        return self._queue(self._client._eval, script, numkeys, *keys_and_args)
+
+    async def execute(self) -> list:
+        commands, self._commands = self._commands, []
+        return [method(*args, **kwargs) for method, args, kwargs in commands]
+
+class SharedState:
+    """
+    State shared by every bot instance, in Redis or the InMemoryRedis stand-in.
+
+    User sessions (UserSession bytes plus conversation state), the /start rate limit, the
+    global send budget and the duplicate application index live under one key prefix, so
+    any instance behind the webhook can handle any update. Each operation is a single
+    pipelined round trip; per-user locks keep one user's updates in order across instances.
+    A lock holds this instance's token and is only released if it still does, so an update
+    that outlived its lock cannot free the lock another instance has taken since.
+    """
+
+    CLAIM_BATCH_SIZE = 500
+    LOCK_RETRY_DELAY = 0.05
+
+    def __init__(self, client, prefix: str, session_ttl: float, lock_seconds: float):
+        self.client = client
+        self.prefix = prefix
+        self.session_ttl = int(session_ttl)
+        self.lock_ms = int(lock_seconds * 1000)
+        self._token = secrets.token_hex(8)  # identifies this instance's locks
+        self.round_trips = 0
+        self.commands = 0
+        self.lock_waits = 0
+        self.lock_timeouts = 0
+        self.locks_lost = 0
+        self.errors = 0
+
+    def _key(self, *parts) -> str:
+        return ":".join([self.prefix, *map(str, parts)])
+
+    async def _execute(self, pipe) -> list:
+        self.round_trips += 1
+        self.commands += len(pipe)
+        return await pipe.execute()
+
+    async def ping(self) -> bool:
+        try:
+            return bool(await self.client.ping())
+        except Exception as e:
+            logger.error(f"❌ Shared state store unreachable: {e}")
+            return False
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    async def load_session(self, update: Update, session: UserSession, conversations: dict) -> bool:
+        """
+        Lock the user and load their session and conversation state (the store wins over memory).
+        Returns False if the lock could not be taken; the update must then not be handled.
+        """
+        if not (update.effective_user and update.effective_chat):
+            return True
+        user_id, key = update.effective_user.id, (update.effective_chat.id, update.effective_user.id)
+        deadline = monotonic() + self.lock_ms / 1000
+        try:
+            while True:
+                pipe = self.client.pipeline(transaction=False)
+                pipe.set(self._key("lock", user_id), self._token, px=self.lock_ms, nx=True)
+                pipe.get(self._key("session", user_id))
+                pipe.get(self._key("conversation", *key))
+                locked, stored, state = await self._execute(pipe)
+                if locked:
+                    break
+                # Another instance is handling this user's previous update; its lock expires at worst
+                if monotonic() >= deadline:
+                    self.lock_timeouts += 1
+                    logger.warning(f"⚠️ User {user_id} stayed locked by another instance; update {update.update_id} dropped")
+                    return False
+                self.lock_waits += 1
+                await asyncio.sleep(self.LOCK_RETRY_DELAY)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error loading shared session, update {update.update_id} dropped: {e}")
+            return False
+
+        if stored is not None:
+            saved = UserSession.from_bytes(stored)
+            for field in UserSession.__slots__:
+                setattr(session, field, getattr(saved, field))
+        if state is not None:
+            conversations[key] = json.loads(state)
+        else:
+            conversations.pop(key, None)
+        return True
+
+    async def save_session(self, update: Update, session: UserSession, conversations: dict) -> None:
+        """Store the user's session and conversation state and release their lock."""
+        if not (update.effective_user and update.effective_chat):
+            return
+        user_id, key = update.effective_user.id, (update.effective_chat.id, update.effective_user.id)
+        state = conversations.get(key)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(self._key("session", user_id), session.to_bytes(), ex=self.session_ttl)
+        if isinstance(state, int):
+            pipe.set(self._key("conversation", *key), json.dumps(state), ex=self.session_ttl)
+        else:
+            pipe.delete(self._key("conversation", *key))
+        pipe.eval(RELEASE_LOCK_SCRIPT, 1, self._key("lock", user_id), self._token)
+        try:
+            *_, released = await self._execute(pipe)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error saving shared session: {e}")
+            return
+        if not released:
+            # The handler outlived SHARED_LOCK_SECONDS; the lock had expired (and may be someone else's now)
+            self.locks_lost += 1
+            logger.warning(f"⚠️ Lock on user {user_id} expired before their update finished; raise SHARED_LOCK_SECONDS")
+
+    async def claim(self, name: str, key, ttl: float) -> bool:
+        """Set a marker unless it exists; True if this call set it. Store errors count as success."""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(self._key(name, key), 1, px=max(int(ttl * 1000), 1), nx=True)
+        try:
+            (claimed,) = await self._execute(pipe)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error claiming {name} in shared state: {e}")
+            return True
+        return bool(claimed)
+
+    async def claim_many(self, name: str, items: list) -> None:
+        """claim() for many (key, ttl) pairs, CLAIM_BATCH_SIZE per round trip."""
+        for start in range(0, len(items), self.CLAIM_BATCH_SIZE):
+            pipe = self.client.pipeline(transaction=False)
+            for key, ttl in items[start:start + self.CLAIM_BATCH_SIZE]:
+                pipe.set(self._key(name, key), 1, px=max(int(ttl * 1000), 1), nx=True)
+            await self._execute(pipe)
+
+    async def release(self, name: str, key) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(self._key(name, key))
+        try:
+            await self._execute(pipe)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error releasing {name} in shared state: {e}")
+
+    async def reserve(self, name: str, limit: float, count: int) -> tuple:
+        """
+        Take up to `count` of the `limit` units every instance shares in the current second.
+        Returns (second, units granted); units not used within that second are lost.
+        """
+        second = int(time())
+        pipe = self.client.pipeline(transaction=False)
+        pipe.incrby(self._key(name, second), count)
+        pipe.pexpire(self._key(name, second), 2000)
+        total, _ = await self._execute(pipe)
+        return second, max(0, min(count, int(limit) - (int(total) - count)))
+
+    def stats(self) -> dict:
+        return {
+            "backend": STATE_BACKEND,
+            "round_trips": self.round_trips,
+            "commands": self.commands,
+            "lock_waits": self.lock_waits,
+            "lock_timeouts": self.lock_timeouts,
+            "locks_lost": self.locks_lost,
+            "errors": self.errors,
+        }
+
+def create_shared_state() -> Optional[SharedState]:
+    """The shared state store selected by STATE_BACKEND, or None for process-local state."""
+    if STATE_BACKEND == "local":
+        return None
+    if STATE_BACKEND == "memory":
+        client = InMemoryRedis()
+    elif STATE_BACKEND == "redis":
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise EnvironmentError("STATE_BACKEND=redis requires the redis package (pip install redis)")
+        client = redis_asyncio.Redis.from_url(REDIS_URL)
+    else:
+        raise EnvironmentError(f"Unknown STATE_BACKEND={STATE_BACKEND!r}; use 'local', 'redis' or 'memory'")
+    return SharedState(client, REDIS_KEY_PREFIX, SHARED_SESSION_TTL_DAYS * 86400, SHARED_LOCK_SECONDS)
+
+shared_state = create_shared_state()
+
+class SQLitePersistence(BasePersistence):
+    """
+    user_data and conversation states in SQLite (WAL mode), loaded per user on first use.
+
+    Nothing is read at startup: refresh_user_data() loads a user's data the first time a
+    handler runs for them and restore_conversation() does the same for their conversation
+    state, so startup time and memory depend on the users who are active, not on all users
+    ever seen. Every update_interval seconds PTB hands over the entries its handlers touched;
+    those whose content did not change are skipped and the rest are written in one transaction.
+    user_data is a UserSession, stored in its binary form (rows saved as JSON are still read).
+    forget() releases an idle user's bookkeeping so it is loaded again when they come back.
+    """
+
+    def __init__(self, path: str, update_interval: float):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._loaded_users: set = set()
+        self._restored_conversations: set = set()
+        self._stored: dict = {}                 # entry -> hash of what the database holds
+        self._pending_users: dict = {}          # user_id -> UserSession.to_bytes(), or None to delete
+        self._pending_conversations: dict = {}  # (name, key) -> state, or None to delete
+        self._writer: Optional[asyncio.Task] = None
+        # Entries evicted from memory that PTB may still report once more, as emptied
+        self._evicted = TTLCache(SESSION_MAX_USERS, update_interval * 2 + 1)
+        self.loads = 0
+        self.rows_written = 0
+        self.unchanged_skipped = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Worker processes share the file; wait for their write locks instead of failing
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS conversations (
+                    name TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (name, key)
+                )
+                """
+            )
+            self._conn = conn
+        return self._conn
+
+    def _select(self, query: str, params: tuple) -> Optional[str | bytes]:
+        with self._lock:
+            row = self._connection().execute(query, params).fetchone()
+            return row[0] if row else None
+
+    def _write(self, users: dict, conversations: dict) -> None:
+        now = time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO user_data (user_id, data, updated_at) VALUES (?, ?, ?)",
+                    [(user_id, data, now) for user_id, data in users.items() if data is not None],
+                )
+                conn.executemany(
+                    "DELETE FROM user_data WHERE user_id = ?",
+                    [(user_id,) for user_id, data in users.items() if data is None],
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO conversations (name, key, state, updated_at) VALUES (?, ?, ?, ?)",
+                    [(name, key, json.dumps(state), now) for (name, key), state in conversations.items() if state is not None],
+                )
+                conn.executemany(
+                    "DELETE FROM conversations WHERE name = ? AND key = ?",
+                    [(name, key) for (name, key), state in conversations.items() if state is None],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self.rows_written += len(users) + len(conversations)
+
+    def _changed(self, entry: tuple, value) -> bool:
+        """Remember what is stored for an entry; False if it already holds this value."""
+        fingerprint = hash(value)
+        if self._stored.get(entry) == fingerprint:
+            self.unchanged_skipped += 1
+            return False
+        self._stored[entry] = fingerprint
+        return True
+
+    def _schedule_write(self) -> None:
+        # PTB hands over a whole interval's changes at once; one task writes them together
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_pending(), name="persistence-writer")
+
+    async def _write_pending(self) -> None:
+        await asyncio.sleep(0)
+        users, self._pending_users = self._pending_users, {}
+        conversations, self._pending_conversations = self._pending_conversations, {}
+        if not users and not conversations:
+            return
+        try:
+            await asyncio.to_thread(self._write, users, conversations)
+        except Exception as e:
+            logger.error(f"Error saving conversation state: {e}")
+            # Keep newer changes, retry with the next batch
+            for user_id, data in users.items():
+                self._pending_users.setdefault(user_id, data)
+            for entry, state in conversations.items():
+                self._pending_conversations.setdefault(entry, state)
+
+    async def _load(self, pending: dict, entry, query: str, params: tuple, encode=None) -> Optional[str | bytes]:
+        """The saved value of an entry, counting writes still on their way (an evicted user's last state)."""
+        if self._writer is not None and not self._writer.done():
+            await asyncio.shield(self._writer)
+        if entry in pending:
+            value = pending[entry]
+            return value if value is None or encode is None else encode(value)
+        return await asyncio.to_thread(self._select, query, params)
+
+    async def refresh_user_data(self, user_id: int, user_data: UserSession) -> None:
+        if user_id in self._loaded_users:
+            return
+        self._loaded_users.add(user_id)
+        stored = await self._load(
+            self._pending_users, user_id, "SELECT data FROM user_data WHERE user_id = ?", (user_id,)
+        )
+        if stored is not None:
+            self.loads += 1
+            self._stored[("user", user_id)] = hash(stored)
+            # Rows written as JSON by earlier versions are rewritten in binary on the next change
+            saved = UserSession.from_bytes(stored) if isinstance(stored, bytes) else UserSession.from_dict(json.loads(stored))
+            user_data.update_missing(saved)
+
+    async def restore_conversation(self, handler: ConversationHandler, update: Update) -> None:
+        """Load the saved state of this update's conversation into the handler, once per user."""
+        if not (update.effective_chat and update.effective_user):
+            return
+        # ConversationHandler's default key: per chat and per user
+        key = (update.effective_chat.id, update.effective_user.id)
+        entry = (handler.name, json.dumps(key))
+        if entry in self._restored_conversations:
+            return
+        self._restored_conversations.add(entry)
+        stored = await self._load(
+            self._pending_conversations, entry, "SELECT state FROM conversations WHERE name = ? AND key = ?", entry,
+            encode=json.dumps,
+        )
+        # A state set since startup wins over the saved one
+        if stored is not None and key not in handler._conversations:
+            state = json.loads(stored)
+            self._stored[("conversation",) + entry] = hash(state)
+            # Not a change, so PTB won't write it back
+            handler._conversations.update_no_track({key: state})
+
+    def forget(self, user_id: int, user_data: Optional[UserSession], name: str, key: tuple, state: Optional[object]) -> None:
+        """
+        A user's state was evicted from memory: save what PTB may not have handed over yet and
+        drop their bookkeeping, so their next update loads everything from the database again.
+        """
+        entry = (name, json.dumps(list(key)))
+        if user_data is not None:
+            serialized = user_data.to_bytes()
+            if self._changed(("user", user_id), serialized):
+                self._pending_users[user_id] = serialized
+        if state is not None and self._changed(("conversation",) + entry, state):
+            self._pending_conversations[entry] = state
+        if self._pending_users or self._pending_conversations:
+            self._schedule_write()
+
+        self._loaded_users.discard(user_id)
+        self._restored_conversations.discard(entry)
+        self._stored.pop(("user", user_id), None)
+        self._stored.pop(("conversation",) + entry, None)
+        self._evicted.set(("user", user_id), True)
+        self._evicted.set(("conversation",) + entry, True)
+
+    async def update_user_data(self, user_id: int, data: UserSession) -> None:
+        # Reading an evicted user's data recreates it empty; that is not a change
+        if self._evicted.pop(("user", user_id)) and data.is_empty():
+            return
+        serialized = data.to_bytes()
+        if self._changed(("user", user_id), serialized):
+            self._pending_users[user_id] = serialized
+            self._schedule_write()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stored.pop(("user", user_id), None)
+        self._pending_users[user_id] = None
+        self._schedule_write()
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        entry = (name, json.dumps(list(key)))
+        # Evicting a conversation looks like it ended; the saved state must stay
+        if self._evicted.pop(("conversation",) + entry) and new_state is None:
+            return
+        if self._changed(("conversation",) + entry, new_state):
+            self._pending_conversations[entry] = new_state
+            self._schedule_write()
+
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def flush(self) -> None:
+        """Write everything still pending (called by PTB when the application stops)."""
+        if self._writer:
+            await self._writer
+        await self._write_pending()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        return {
+            "users_loaded": self.loads,
+            "rows_written": self.rows_written,
+            "unchanged_skipped": self.unchanged_skipped,
+            "pending": len(self._pending_users) + len(self._pending_conversations),
+            "entries_tracked": len(self._stored),
+        }
+
+    # Chat data, bot data and callback data are not used by this bot
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+# With shared state, sessions and conversation states are kept in the shared store instead
+persistence = (
+    SQLitePersistence(PERSISTENCE_DB_PATH, PERSISTENCE_FLUSH_INTERVAL) if BOT_PERSISTENCE and shared_state is None else None
+)
+
+class SessionRegistry:
+    """
+    Keeps the in-memory state of recently active users only: their user_data and conversation state.
+
+    Every update refreshes its user's entry. Users idle for `ttl` seconds, or the least recently
+    active ones beyond `max_users`, are evicted from the Application. With persistence their
+    state is saved first and loaded again on their next update, so eviction only frees memory;
+    without it an evicted user starts over, as after a restart.
+    """
+
+    def __init__(self, max_users: int, ttl: float):
+        self._active = TTLCache(max_users, ttl, on_evict=self._evict)  # user_id -> chat_id
+        self.application: Optional[Application] = None
+        self.conversation_handler: Optional[ConversationHandler] = None
+
+    def attach(self, application: Application, conversation_handler: ConversationHandler) -> None:
+        self.application = application
+        self.conversation_handler = conversation_handler
 
-async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Handle /menu command - go to main menu."""
-    lang = context.user_data.get('language', 'pl')
-    
-    # If no language selected yet, start language selection
-    if not lang:
-        return await start(update, context)
-    
-    return await show_main_menu(update, context)
+    def touch(self, update: Update) -> None:
+        if update.effective_user:
+            self._active.set(update.effective_user.id, update.effective_chat.id if update.effective_chat else None)
 
-async def contact_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Handle /contact command - show contact information."""
-    lang = context.user_data.get('language', 'pl')
-    
-    # If no language selected yet, start language selection
-    if not lang:
-        return await start(update, context)
-    
-    await update.message.reply_text(get_text(lang, 'contact_details'))
-    
-    # Return to current state or main menu
-    return await show_main_menu(update, context)
+    def _evict(self, user_id: int, chat_id: Optional[int]) -> None:
+        if self.application is None:
+            return
+        key = (chat_id, user_id)
+        # Not drop_user_data(): that would delete the persisted copy too
+        user_data = self.application._user_data.pop(user_id, None)
+        conversations = self.conversation_handler._conversations
+        # Popping from TrackingDict.data bypasses change tracking, so no deletion is persisted
+        state = getattr(conversations, "data", conversations).pop(key, None) if chat_id is not None else None
+        if persistence:
+            persistence.forget(user_id, user_data, self.conversation_handler.name, key, state)
 
-async def language_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Handle /language command - allow user to change language."""
-    keyboard = [
-        [KeyboardButton("🇵🇱 Polski"), KeyboardButton("🇺🇦 Українська"), KeyboardButton("🇷🇺 Русский")]
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-    
-    await update.message.reply_text(
-        "🌍 Wybierz język / Виберіть мову / Выберите язык",
-        reply_markup=reply_markup
-    )
-    return LANGUAGE_SELECTION
+    def sweep(self) -> int:
+        """Evict idle users; returns how many."""
+        evicted = self._active.sweep()
+        if self.application is not None and len(self.application._user_data) > len(self._active):
+            # Empty leftovers PTB created while saving users that had just been evicted
+            user_data = self.application._user_data
+            for user_id in [user_id for user_id, data in user_data.items() if data.is_empty() and user_id not in self._active]:
+                del user_data[user_id]
+        return evicted
 
-async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Cancel current operation and return to main menu."""
-    lang = context.user_data.get('language', 'pl')
-    
-    # Clear any form data
-    context.user_data.pop('form_data', None)
-    context.user_data.pop('form_step', None)
-    context.user_data.pop('selected_job', None)
-    
-    # If no language selected yet, start language selection
-    if not lang:
-        return await start(update, context)
-    
-    # Return to main menu
-    return await show_main_menu(update, context)
+    def stats(self) -> dict:
+        stats = self._active.stats()
+        if self.application is not None:
+            stats["user_data_entries"] = len(self.application._user_data)
+            stats["conversation_entries"] = len(self.conversation_handler._conversations)
+        return stats
+
+sessions = SessionRegistry(SESSION_MAX_USERS, SESSION_TTL_SECONDS)
+
+async def sweep_ephemeral_state(interval: float) -> None:
+    """Expire idle sessions, rate limit entries and send buckets in the background."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            evicted = sessions.sweep()
+            _user_last_action.sweep()
+            send_scheduler.sweep()
+            if evicted:
+                logger.info(f"🧹 Evicted {evicted} idle user sessions")
+        except Exception as e:
+            logger.error(f"Error sweeping idle user state: {e}")
+
+def memory_stats() -> dict:
+    """Resident memory of this process (Linux) and the size of every per-user store."""
+    try:
+        with open("/proc/self/statm") as f:
+            rss_mb = round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1048576, 1)
+    except (OSError, ValueError):
+        rss_mb = None
+    return {
+        "rss_mb": rss_mb,
+        "sessions": sessions.stats(),
+        "rate_limit_entries": len(_user_last_action),
+    }
 
 async def health_check():
     """Health check endpoint for monitoring."""
     try:
+        details = {
+            "storage": {"backend": storage.name, **storage.stats()},
+            "duplicate_index": duplicate_index.stats(),
+            "job_descriptions": job_descriptions.stats(),
+            "updates": update_processor.stats(),
+            "persistence": persistence.stats() if persistence else "disabled",
+            "send_scheduler": send_scheduler.stats(),
+            "broadcasts": broadcasts.stats(),
+            "memory": memory_stats(),
+            "shared_state": shared_state.stats() if shared_state else "local",
+            "bot_mode": BOT_MODE,
+            "timestamp": datetime.now().isoformat(),
+        }
+        if webhook_server:
+            details["webhook"] = webhook_server.stats()
+        if worker_pool:
+            details["workers"] = worker_pool.stats()
+        if not uses_google_sheets():
+            return {"status": "healthy", "google_sheets": "disabled", **details}
+
         # Test Google Sheets connection
         sheet = await setup_google_sheets()
-        if sheet:
-            return {"status": "healthy", "google_sheets": "connected", "timestamp": datetime.now().isoformat()}
+        details.update({
+            "sheet_handles": sheet_handles.stats(),
+            "sheets_scheduler": sheets_scheduler.stats(),
+            "google_token_expires_in": _token_expires_in(),
+        })
+        if sheet and sheets_scheduler.breaker.state == CircuitBreaker.CLOSED:
+            return {"status": "healthy", "google_sheets": "connected", **details}
+        elif sheet:
+            return {"status": "degraded", "google_sheets": "circuit_open", **details}
         else:
-            return {"status": "degraded", "google_sheets": "disconnected", "timestamp": datetime.now().isoformat()}
+            return {"status": "degraded", "google_sheets": "disconnected", **details}
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         return {"status": "unhealthy", "error": str(e), "timestamp": datetime.now().isoformat()}
 
+class WebhookServer:
+    """
+    Minimal asyncio HTTP/1.1 server receiving Telegram webhook updates.
+
+    POST <WEBHOOK_PATH> requests carrying the expected secret token header are parsed into
+    Updates and put straight on the Application's update queue; GET /health serves
+    health_check(). Connections are kept alive, as Telegram reuses them.
+    """
+
+    MAX_BODY_BYTES = 1024 * 1024
+    IDLE_TIMEOUT = 75
+    REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+    def __init__(self, application, listen: str, port: int, path: str, secret_token: str):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self._secret_token = secret_token.encode()
+        self._server = None
+        self._connections = set()
+        self.updates = 0
+        self.rejected = 0
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.listen, self.port)
+        # Port 0 binds an ephemeral port; report the real one
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"🌐 Webhook server listening on {self.listen}:{self.port}{self.path}")
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    def stats(self) -> dict:
+        return {"updates": self.updates, "rejected": self.rejected, "connections": len(self._connections)}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), self.IDLE_TIMEOUT)
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                if length > self.MAX_BODY_BYTES:
+                    await self._respond(writer, 413, b"", keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self._dispatch(method, target.split("?", 1)[0], headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except Exception as e:
+            logger.error(f"Webhook connection error: {e}")
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        if path == self.path:
+            if method != "POST":
+                return 405, b""
+            token = headers.get("x-telegram-bot-api-secret-token", "").encode()
+            if not hmac.compare_digest(token, self._secret_token):
+                self.rejected += 1
+                logger.warning("⚠️ Webhook request with a wrong secret token rejected")
+                return 403, b""
+            try:
+                update = Update.de_json(json.loads(body), self.application.bot)
+            except Exception as e:
+                logger.warning(f"⚠️ Malformed webhook update: {e}")
+                return 400, b""
+            await self.application.update_queue.put(update)
+            self.updates += 1
+            return 200, b""
+
+        if path == "/health" and method == "GET":
+            result = await health_check()
+            status = 503 if result.get("status") == "unhealthy" else 200
+            return status, json.dumps(result, default=str).encode()
+
+        return 404, b""
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload: bytes, keep_alive: bool) -> None:
+        head = [
+            f"HTTP/1.1 {status} {self.REASONS.get(status, '')}",
+            f"Content-Length: {len(payload)}",
+            "Connection: keep-alive" if keep_alive else "Connection: close",
+        ]
+        if payload:
+            head.append("Content-Type: application/json")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+        await writer.drain()
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+
+class SendScheduler(BaseRateLimiter):
+    """
+    Rate limiter for every Bot API request the application makes (replies included).
+
+    Requests addressed to a chat first take a token from that chat's bucket, then wait for a
+    slot of the global bucket. Global slots are handed out by priority lane: interactive
+    replies (the default) before bulk sends (rate_limit_args=SendScheduler.BULK). A 429
+    RetryAfter pauses all sending for the time Telegram asks for, then the request is retried.
+    """
+
+    INTERACTIVE = 0
+    BULK = 1
+    MAX_TRACKED_CHATS = 10000
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int, max_retries: int):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = max(chat_burst, 1)
+        self.max_retries = max_retries
+        # One token of burst: sends are paced evenly, so no second (including the one right
+        # after a RetryAfter pause) carries more than global_rate messages
+        self._global = TokenBucket(global_rate * 60, capacity=1)
+        # A bucket left alone for chat_burst / chat_rate seconds is full again, exactly like a new one
+        self._chats = TTLCache(self.MAX_TRACKED_CHATS, self.chat_burst / max(chat_rate, 1 / 60))
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._paused_until = 0.0
+        self._pump = None
+        # With shared state: slots of the per-second budget all instances share, and their second
+        self._shared_slots = 0
+        self._shared_second = 0
+        self.sent = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    async def initialize(self) -> None:
+        if self._pump is None:
+            self._pump = asyncio.create_task(self._run(), name="send-scheduler")
+
+    async def shutdown(self) -> None:
+        if self._pump:
+            self._pump.cancel()
+            self._pump = None
+        for _, _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate * 60, capacity=self.chat_burst)
+        self._chats.set(chat_id, bucket)
+        return bucket
+
+    def sweep(self) -> int:
+        """Drop the buckets of chats that have been quiet long enough to refill completely."""
+        return self._chats.sweep()
+
+    async def _run(self) -> None:
+        """Release waiting requests, highest priority first, at the global rate."""
+        while True:
+            while not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            pause = self._paused_until - monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            # Requests cancelled while waiting (e.g. timed out) must not use up a send
+            while self._waiters and self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+            if not self._waiters:
+                continue
+            await self._global.acquire()
+            if shared_state:
+                await self._shared_slot()
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():
+                    future.set_result(None)
+                    break
+            else:
+                # Every waiter went away while the token was being taken
+                self._global.refund()
+
+    async def _shared_slot(self) -> None:
+        """Take one send from the budget every instance shares, reserving a few at a time."""
+        try:
+            while self._shared_slots == 0 or self._shared_second != int(time()):
+                self._shared_second, self._shared_slots = await shared_state.reserve(
+                    "send", SEND_GLOBAL_RATE, max(int(self.global_rate) // 10, 1)
+                )
+                if not self._shared_slots:
+                    await asyncio.sleep(self._shared_second + 1 - time())
+            self._shared_slots -= 1
+        except Exception as e:
+            # Without the store, fall back to this instance's own rate
+            logger.error(f"Error reserving shared send budget: {e}")
+
+    async def _global_slot(self, priority: int) -> None:
+        if self._pump is None:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._wakeup.set()
+        await future
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            # getMe, setWebhook, ...: not subject to message limits
+            return await callback(*args, **kwargs)
+
+        priority = rate_limit_args if rate_limit_args is not None else self.INTERACTIVE
+        for attempt in range(self.max_retries + 1):
+            started = monotonic()
+            await self._chat_bucket(chat_id).acquire()
+            await self._global_slot(priority)
+            self.wait_seconds += monotonic() - started
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.throttled += 1
+                if attempt == self.max_retries:
+                    raise
+                delay = _retry_after_seconds(e)
+                logger.warning(f"⚠️ Telegram flood control on {endpoint}: pausing sends for {delay:.0f}s")
+                self._paused_until = max(self._paused_until, monotonic() + delay)
+                await asyncio.sleep(delay)
+                continue
+            self.sent += 1
+            return result
+
+    def stats(self) -> dict:
+        lanes = [priority for priority, _, future in self._waiters if not future.done()]
+        return {
+            "sent": self.sent,
+            "throttled_429": self.throttled,
+            "waiting_interactive": lanes.count(self.INTERACTIVE),
+            "waiting_bulk": len(lanes) - lanes.count(self.INTERACTIVE),
+            "wait_seconds": round(self.wait_seconds, 2),
+            "chats_tracked": len(self._chats),
+        }
+
+# The global rate is per bot token, so worker processes share it
+send_scheduler = SendScheduler(
+    SEND_GLOBAL_RATE / max(BOT_WORKERS, 1), SEND_PER_CHAT_RATE, SEND_PER_CHAT_BURST, SEND_MAX_RETRIES
+)
+
+class SubscriptionStore:
+    """
+    Job alert subscriptions and broadcast progress (SQLite in WAL mode).
+
+    One row per subscribed user with the language alerts are sent in. Each broadcast keeps
+    a cursor (the last user id it reached) and its delivery counters, saved after every
+    batch, so a broadcast interrupted by a crash resumes where it stopped. The file is
+    shared by all worker processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Worker processes share the file; wait for their write locks instead of failing
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                    user_id INTEGER PRIMARY KEY,
+                    language TEXT NOT NULL,
+                    subscribed_at REAL NOT NULL,
+                    blocked INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    cursor INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER NOT NULL,
+                    sent INTEGER NOT NULL DEFAULT 0,
+                    blocked INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def subscribe(self, user_id: int, language: str) -> None:
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO subscriptions (user_id, language, subscribed_at) VALUES (?, ?, ?)",
+                (user_id, language, time()),
+            )
+
+    def unsubscribe(self, user_id: int) -> None:
+        with self._lock:
+            self._connection().execute("DELETE FROM subscriptions WHERE user_id = ?", (user_id,))
+
+    def is_subscribed(self, user_id: int) -> bool:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT 1 FROM subscriptions WHERE user_id = ? AND blocked = 0", (user_id,)
+            ).fetchone() is not None
+
+    def set_language(self, user_id: int, language: str) -> None:
+        with self._lock:
+            self._connection().execute(
+                "UPDATE subscriptions SET language = ? WHERE user_id = ?", (language, user_id)
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM subscriptions WHERE blocked = 0").fetchone()[0]
+
+    def batch(self, after_user_id: int, limit: int) -> list:
+        """(user_id, language) of active subscribers after the cursor, in user id order."""
+        with self._lock:
+            return self._connection().execute(
+                "SELECT user_id, language FROM subscriptions WHERE blocked = 0 AND user_id > ? ORDER BY user_id LIMIT ?",
+                (after_user_id, limit),
+            ).fetchall()
+
+    def create_broadcast(self, job_id: str, owner: str) -> tuple:
+        """Start a broadcast to every current subscriber; returns (id, total)."""
+        with self._lock:
+            conn = self._connection()
+            total = conn.execute("SELECT COUNT(*) FROM subscriptions WHERE blocked = 0").fetchone()[0]
+            cursor = conn.execute(
+                "INSERT INTO broadcasts (job_id, owner, status, total, created_at) VALUES (?, ?, 'running', ?, ?)",
+                (job_id, owner, total, time()),
+            )
+            return cursor.lastrowid, total
+
+    def save_progress(self, broadcast_id: int, cursor: int, sent: int, blocked_user_ids: list,
+                      failed: int, done: bool) -> None:
+        """Record one finished batch atomically: cursor, counters and users who blocked the bot."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "UPDATE subscriptions SET blocked = 1 WHERE user_id = ?", [(user_id,) for user_id in blocked_user_ids]
+                )
+                conn.execute(
+                    "UPDATE broadcasts SET cursor = ?, sent = sent + ?, blocked = blocked + ?, failed = failed + ?, "
+                    "status = ? WHERE id = ?",
+                    (cursor, sent, len(blocked_user_ids), failed, "done" if done else "running", broadcast_id),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def broadcasts(self, limit: int, owner: Optional[str] = None, running_only: bool = False) -> list:
+        """Most recent broadcasts first, as dicts."""
+        query = "SELECT * FROM broadcasts WHERE 1 = 1"
+        params = []
+        if owner is not None:
+            query += " AND owner = ?"
+            params.append(owner)
+        if running_only:
+            query += " AND status = 'running'"
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            cursor = self._connection().execute(query, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+subscriptions = SubscriptionStore(SUBSCRIPTIONS_DB_PATH)
+
+def job_alert_text(job_id: str, lang: str) -> str:
+    job = job_catalog.jobs.get(job_id)
+    title = f"{job.emoji} {job_catalog.title(job_id, lang)}" if job else job_id
+    return get_text(lang, 'new_job_alert').format(title=title)
+
+class BroadcastEngine:
+    """
+    Fans a job alert out to every subscriber in batches of BROADCAST_BATCH_SIZE.
+
+    Messages go out in the send scheduler's bulk lane, so they only use rate capacity that
+    interactive replies leave free. Progress is saved after each batch; after a crash, the
+    process that owned a broadcast resumes it from the saved cursor (users of the batch in
+    flight may get the alert twice). Users who blocked the bot are marked and skipped later.
+    """
+
+    def __init__(self, store: SubscriptionStore, batch_size: int, owner: str):
+        self.store = store
+        self.batch_size = max(batch_size, 1)
+        self.owner = owner
+        self._tasks: dict = {}
+        self.sent = 0
+        self.blocked = 0
+        self.failed = 0
+
+    async def start(self, bot) -> None:
+        """Resume broadcasts this process was running when it stopped."""
+        for broadcast in await asyncio.to_thread(self.store.broadcasts, 100, self.owner, True):
+            logger.info(f"📣 Resuming broadcast #{broadcast['id']} after user {broadcast['cursor']}")
+            self._launch(bot, broadcast['id'], broadcast['job_id'], broadcast['cursor'])
+
+    async def stop(self) -> None:
+        """Stop sending; progress up to the last finished batch is already saved."""
+        for task in self._tasks.values():
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    async def create(self, bot, job_id: str) -> tuple:
+        broadcast_id, total = await asyncio.to_thread(self.store.create_broadcast, job_id, self.owner)
+        logger.info(f"📣 Broadcast #{broadcast_id} of '{job_id}' started for {total} subscribers")
+        self._launch(bot, broadcast_id, job_id, 0)
+        return broadcast_id, total
+
+    def _launch(self, bot, broadcast_id: int, job_id: str, cursor: int) -> None:
+        task = asyncio.create_task(self._run(bot, broadcast_id, job_id, cursor), name=f"broadcast-{broadcast_id}")
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def _send(self, bot, user_id: int, text: str) -> str:
+        try:
+            await bot.send_message(chat_id=user_id, text=text, rate_limit_args=SendScheduler.BULK)
+            return "sent"
+        except Forbidden:
+            return "blocked"
+        except Exception as e:
+            logger.warning(f"Broadcast to {anonymize_user_id(user_id)} failed: {e}")
+            return "failed"
+
+    async def _run(self, bot, broadcast_id: int, job_id: str, cursor: int) -> None:
+        try:
+            while True:
+                batch = await asyncio.to_thread(self.store.batch, cursor, self.batch_size)
+                if not batch:
+                    await asyncio.to_thread(self.store.save_progress, broadcast_id, cursor, 0, [], 0, True)
+                    logger.info(f"✅ Broadcast #{broadcast_id} finished")
+                    return
+                texts = {lang: job_alert_text(job_id, lang) for lang in {lang for _, lang in batch}}
+                results = await asyncio.gather(*(self._send(bot, user_id, texts[lang]) for user_id, lang in batch))
+                blocked = [user_id for (user_id, _), result in zip(batch, results) if result == "blocked"]
+                sent, failed = results.count("sent"), results.count("failed")
+                cursor = batch[-1][0]
+                await asyncio.to_thread(self.store.save_progress, broadcast_id, cursor, sent, blocked, failed, False)
+                self.sent += sent
+                self.blocked += len(blocked)
+                self.failed += failed
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast #{broadcast_id} stopped: {e}")
+
+    def stats(self) -> dict:
+        return {"running": len(self._tasks), "sent": self.sent, "blocked": self.blocked, "failed": self.failed}
+
+# Single-process bots and worker 0 share owner "0"
+broadcasts = BroadcastEngine(subscriptions, BROADCAST_BATCH_SIZE, BOT_WORKER_INDEX or "0")
+
+# Set in webhook mode
+webhook_server: Optional[WebhookServer] = None
+
 async def startup_checks():
     """Perform startup checks and initialization."""
     logger.info("🚀 Starting RobotaVPolshchiBot...")
@@ -1239,20 +4460,23 @@ async def startup_checks():
         return False
     
     # Test Google Sheets connection
-    try:
-        sheet = await setup_google_sheets()
-        if sheet:
-            logger.info("✅ Google Sheets connection successful")
-        else:
-            logger.warning("⚠️ Google Sheets connection failed - bot will continue but data won't be saved")
-    except Exception as e:
-        logger.error(f"❌ Google Sheets connection error: {e}")
-        logger.warning("⚠️ Continuing without Google Sheets - data won't be saved")
+    if not uses_google_sheets():
+        logger.info(f"✅ Storing submissions locally ({storage.name}); Google Sheets disabled")
+    else:
+        try:
+            sheet = await setup_google_sheets()
+            if sheet:
+                logger.info("✅ Google Sheets connection successful")
+            else:
+                logger.warning("⚠️ Google Sheets connection failed - submissions will be journaled locally and replayed later")
+        except Exception as e:
+            logger.error(f"❌ Google Sheets connection error: {e}")
+            logger.warning("⚠️ Continuing without Google Sheets - submissions will be journaled locally and replayed later")
     
     # Test Telegram token
     try:
         from telegram import Bot
-        bot = Bot(get_bot_token())
+        bot = Bot(get_bot_token(), base_url=TELEGRAM_API_BASE_URL)
         bot_info = await bot.get_me()
         logger.info(f"✅ Telegram bot connected: @{bot_info.username}")
     except Exception as e:
@@ -1261,121 +4485,451 @@ async def startup_checks():
     
     return True
 
-async def main() -> None:
-    """Initialize and start the Telegram bot with comprehensive error handling."""
+async def start_services(tasks: list) -> bool:
+    """
+    Run the startup checks and start storage, the indexes and Google token refresh.
+    Background tasks are appended to `tasks`; returns False if the startup checks fail.
+    """
+    # Fetch the Google access token up front and keep it fresh in the background
+    if uses_google_sheets() and _uses_google_credentials():
+        try:
+            await refresh_google_token()
+        except Exception as e:
+            logger.error(f"❌ Could not obtain Google access token: {e}")
+        tasks.append(asyncio.create_task(google_token_refresher(), name="google-token-refresher"))
+
+    # Run startup checks
+    if not await startup_checks():
+        return False
+    if shared_state and not await shared_state.ping():
+        return False
+
+    # Start the storage backend (and the background Sheets writer, if used)
+    await storage.start()
+    await duplicate_index.warm_up()
+
+    # Render every job description once; job clicks are then dict lookups
+    job_descriptions.load()
+    if JOB_DESCRIPTIONS_RELOAD_INTERVAL > 0:
+        tasks.append(asyncio.create_task(
+            job_descriptions.watch(JOB_DESCRIPTIONS_RELOAD_INTERVAL), name="job-description-watcher"
+        ))
+
+    # Keep per-user memory bounded: idle sessions, rate limit entries and send buckets expire
+    tasks.append(asyncio.create_task(sweep_ephemeral_state(STATE_SWEEP_INTERVAL), name="state-sweeper"))
+    return True
+
+async def stop_services(tasks: list) -> None:
+    """Cancel background tasks and flush storage."""
+    for task in tasks:
+        task.cancel()
+
+    subscriptions.close()
+    if shared_state:
+        await shared_state.close()
+
+    # Flush submissions that are still waiting for Google Sheets
+    try:
+        await storage.stop()
+        await close_google_sheets()
+    except Exception as e:
+        logger.error(f"Error stopping storage backend: {e}")
+
+def build_application() -> Application:
+    """Create the Application with the conversation flow and error handler."""
+    builder = (
+        Application.builder()
+        .token(get_bot_token())
+        .base_url(TELEGRAM_API_BASE_URL)
+        .concurrent_updates(update_processor)
+        .rate_limiter(send_scheduler)
+        .context_types(ContextTypes(user_data=UserSession))
+    )
+    if persistence:
+        builder = builder.persistence(persistence)
+    application = builder.build()
+
+    # Configure conversation handler with all states and commands
+    conv_handler = ConversationHandler(
+        entry_points=[
+            CommandHandler('start', start),
+            CommandHandler('menu', menu_command),
+            CommandHandler('language', language_command),
+            CommandHandler('alerts', toggle_job_alerts)
+        ],
+        states={
+            LANGUAGE_SELECTION: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, language_selected),
+                CommandHandler('start', start),
+                CommandHandler('menu', menu_command),
+                CommandHandler('contact', contact_command),
+                CommandHandler('language', language_command)
+            ],
+            MAIN_MENU: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, main_menu_handler),
+                CommandHandler('start', start),
+                CommandHandler('menu', menu_command),
+                CommandHandler('contact', contact_command),
+                CommandHandler('language', language_command)
+            ],
+            JOB_SELECTION: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, job_selected),
+                CommandHandler('start', start),
+                CommandHandler('menu', menu_command),
+                CommandHandler('contact', contact_command),
+                CommandHandler('language', language_command)
+            ],
+            JOB_DESCRIPTION: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, job_description_handler),
+                CommandHandler('start', start),
+                CommandHandler('menu', menu_command),
+                CommandHandler('contact', contact_command),
+                CommandHandler('language', language_command)
+            ],
+            JOB_APPLICATION: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, job_application_handler),
+                CommandHandler('start', start),
+                CommandHandler('menu', menu_command),
+                CommandHandler('contact', contact_command),
+                CommandHandler('language', language_command)
+            ],
+            CONTACT_OPTION: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, contact_option_handler),
+                CommandHandler('start', start),
+                CommandHandler('menu', menu_command),
+                CommandHandler('contact', contact_command),
+                CommandHandler('language', language_command)
+            ],
+            CONTACT_FORM: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, contact_form_handler),
+                CommandHandler('start', start),
+                CommandHandler('menu', menu_command),
+                CommandHandler('contact', contact_command),
+                CommandHandler('language', language_command)
+            ],
+            NEARBY_JOBS: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, nearby_jobs_handler),
+                CommandHandler('start', start),
+                CommandHandler('menu', menu_command),
+                CommandHandler('contact', contact_command),
+                CommandHandler('language', language_command)
+            ],
+        },
+        fallbacks=[
+            CommandHandler('start', start),
+            CommandHandler('cancel', cancel),
+            CommandHandler('contact', contact_command),
+            CommandHandler('language', language_command),
+            CommandHandler('alerts', toggle_job_alerts)
+        ],
+        conversation_timeout=600,  # 10 minutes timeout for form sessions
+        name="main",
+        persistent=persistence is not None,
+    )
+
+    application.add_handler(conv_handler)
+
+    # Track who is active so idle users' state can be evicted; group -2 runs before everything else
+    sessions.attach(application, conv_handler)
+
+    async def track_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        sessions.touch(update)
+
+    application.add_handler(TypeHandler(Update, track_session), group=-2)
+
+    if shared_state:
+        async def load_shared_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            """Lock the user and load their state from the shared store before the conversation handler runs."""
+            if not await shared_state.load_session(update, context.user_data, conv_handler._conversations):
+                # Running without the lock could interleave with the instance holding it
+                raise ApplicationHandlerStop
+
+        async def save_shared_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            """Write the user's state back and release them for the next update, on any instance."""
+            await shared_state.save_session(update, context.user_data, conv_handler._conversations)
+
+        application.add_handler(TypeHandler(Update, load_shared_session), group=-1)
+        application.add_handler(TypeHandler(Update, save_shared_session), group=1)
+
+    if persistence:
+        async def restore_conversation_state(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            """Load the user's saved conversation state before the conversation handler sees the update."""
+            await persistence.restore_conversation(conv_handler, update)
+
+        # Group -1 runs first; creating its context also loads the user's user_data
+        application.add_handler(TypeHandler(Update, restore_conversation_state), group=-1)
+
+    # Admin broadcasts of new job offers to subscribers
+    if ADMIN_USER_IDS:
+        application.add_handler(CommandHandler('broadcast', broadcast_command, filters.User(user_id=ADMIN_USER_IDS)))
+
+    # Add error handler for uncaught exceptions
+    async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Log the error and send a telegram message to notify the developer."""
+        logger.error(f"Exception while handling an update: {context.error}")
+
+        # Flood control: another message would only extend the ban
+        if isinstance(context.error, RetryAfter):
+            return
+
+        if update and hasattr(update, 'effective_user') and update.effective_user:
+            try:
+                await context.bot.send_message(
+                    chat_id=update.effective_user.id,
+                    text="Wystąpił nieoczekiwany błąd. Spróbuj ponownie za chwilę."
+                )
+            except Exception as e:
+                logger.error(f"Failed to send error message to user: {e}")
+
+    application.add_error_handler(error_handler)
+
+    return application
+
+async def start_update_delivery(application: Application) -> None:
+    """Start receiving updates into the application's update queue (webhook or polling)."""
+    global webhook_server
+    if BOT_MODE == "webhook":
+        # Updates are pushed to the embedded server and queued straight into the application
+        webhook_server = WebhookServer(
+            application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN
+        )
+        await webhook_server.start()
+        await application.bot.set_webhook(
+            url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=True,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            secret_token=WEBHOOK_SECRET_TOKEN,
+        )
+        logger.info(f"🤖 Bot is receiving updates via webhook at {WEBHOOK_URL}{WEBHOOK_PATH}")
+    else:
+        # Defensive: ensure webhook mode isn't active (mixed mode can cause confusion).
+        try:
+            await application.bot.delete_webhook(drop_pending_updates=True)
+        except Exception as e:
+            logger.warning(f"Could not delete webhook (continuing): {e}")
+
+        logger.info("🤖 Bot is starting polling...")
+        await application.updater.start_polling(
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=True,
+            poll_interval=1.0,
+            timeout=10
+        )
+
+async def stop_application(application: Application) -> None:
+    """Stop update delivery and shut the application down."""
+    try:
+        logger.info("🔄 Shutting down bot...")
+        await broadcasts.stop()
+        # The webhook stays registered so Telegram holds updates until the next start
+        if webhook_server:
+            await webhook_server.stop()
+        if application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        logger.info("✅ Bot shutdown complete")
+    except Exception as e:
+        logger.error(f"Error during shutdown: {e}")
+
+class WorkerPool:
+    """
+    Worker processes for BOT_WORKERS > 1.
+
+    Worker `i` owns every user with user_id % workers == i and receives their updates over
+    its own multiprocessing queue, so conversation state, rate limits and duplicate checks
+    stay local to one process. Workers that exit are restarted without affecting the
+    others; like its in-memory conversation state, updates still queued for a crashed
+    worker are lost.
+    """
+
+    RESTART_DELAY = 5
+    STOP_TIMEOUT = 30
+
+    def __init__(self, workers: int):
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue() for _ in range(workers)]
+        self.processes = [None] * workers
+        self._started_at = [0.0] * workers
+        self.routed = [0] * workers
+        self.restarts = 0
+
+    def _start_worker(self, index: int) -> None:
+        # The worker re-imports this module; BOT_WORKER_INDEX gives it its own local data files
+        os.environ["BOT_WORKER_INDEX"] = str(index)
+        try:
+            process = self._context.Process(
+                target=run_worker, args=(index, self.queues[index]), name=f"bot-worker-{index}", daemon=True
+            )
+            process.start()
+        finally:
+            os.environ.pop("BOT_WORKER_INDEX", None)
+        self.processes[index] = process
+        self._started_at[index] = monotonic()
+
+    def start(self) -> None:
+        for index in range(len(self.queues)):
+            self._start_worker(index)
+        logger.info(f"👷 Started {len(self.queues)} worker processes")
+
+    def shard(self, update: object) -> int:
+        key = update_user_key(update)
+        return key % len(self.queues) if key is not None else 0
+
+    def route(self, update: Update) -> None:
+        index = self.shard(update)
+        self.queues[index].put(update.to_dict())
+        self.routed[index] += 1
+
+    async def supervise(self, interval: float = 1.0) -> None:
+        """Restart workers that exited (at most once per RESTART_DELAY seconds each)."""
+        while True:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self.processes):
+                if process.is_alive() or monotonic() - self._started_at[index] < self.RESTART_DELAY:
+                    continue
+                logger.error(f"💥 Worker {index} exited with code {process.exitcode}; restarting")
+                # A killed worker may still hold the queue's reader lock; start over with a new queue
+                self.queues[index].cancel_join_thread()
+                self.queues[index].close()
+                self.queues[index] = self._context.Queue()
+                self.restarts += 1
+                self._start_worker(index)
+
+    def stop(self) -> None:
+        """Ask every worker to finish (flushing its storage) and wait for them."""
+        for queue in self.queues:
+            queue.put(None)
+        deadline = monotonic() + self.STOP_TIMEOUT
+        for index, process in enumerate(self.processes):
+            process.join(max(deadline - monotonic(), 0))
+            if process.is_alive():
+                logger.warning(f"⚠️ Worker {index} did not stop in time; terminating")
+                process.terminate()
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self.processes),
+            "alive": sum(1 for process in self.processes if process and process.is_alive()),
+            "restarts": self.restarts,
+            "routed": list(self.routed),
+        }
+
+# Set in the dispatcher process when BOT_WORKERS > 1
+worker_pool: Optional[WorkerPool] = None
+
+def run_worker(index: int, queue) -> None:
+    """Entry point of a worker process."""
+    # Shutdown is driven by the dispatcher, not by Ctrl+C reaching the whole process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(worker_main(index, queue))
+
+async def worker_main(index: int, queue) -> None:
+    """Handle the updates the dispatcher routes to this worker until it sends None."""
+    loop = asyncio.get_running_loop()
+    parent = multiprocessing.parent_process()
     application = None
+    tasks = []
     try:
-        with single_instance_lock():
-            # Run startup checks
+        if not await start_services(tasks):
+            logger.error(f"❌ Worker {index}: startup checks failed. Exiting.")
+            return
+
+        application = build_application()
+        await application.initialize()
+        await application.start()
+        await broadcasts.start(application.bot)
+        logger.info(f"👷 Worker {index} is handling updates")
+
+        while True:
+            try:
+                data = await loop.run_in_executor(None, queue.get, True, 1.0)
+            except Empty:
+                # Don't outlive a dispatcher that was killed without stopping us
+                if parent is not None and not parent.is_alive():
+                    break
+                continue
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    except Exception as e:
+        logger.error(f"💥 Fatal error in worker {index}: {e}")
+        raise
+    finally:
+        if application:
+            await stop_application(application)
+        await stop_services(tasks)
+
+async def run_dispatcher() -> None:
+    """Receive updates in this process and hand each one to the worker owning its user."""
+    global worker_pool
+    application = None
+    supervisor = None
+    # Only one getUpdates consumer may run per token; webhook delivery has no such limit
+    instance_lock = single_instance_lock() if BOT_MODE == "polling" else contextlib.nullcontext()
+    try:
+        with instance_lock:
             if not await startup_checks():
                 logger.error("❌ Startup checks failed. Exiting.")
                 return
 
-            # Create the Application
-            application = Application.builder().token(get_bot_token()).build()
-
-            # Configure conversation handler with all states and commands
-            conv_handler = ConversationHandler(
-                entry_points=[
-                    CommandHandler('start', start),
-                    CommandHandler('menu', menu_command),
-                    CommandHandler('language', language_command)
-                ],
-                states={
-                    LANGUAGE_SELECTION: [
-                        MessageHandler(filters.TEXT & ~filters.COMMAND, language_selected),
-                        CommandHandler('start', start),
-                        CommandHandler('menu', menu_command),
-                        CommandHandler('contact', contact_command),
-                        CommandHandler('language', language_command)
-                    ],
-                    MAIN_MENU: [
-                        MessageHandler(filters.TEXT & ~filters.COMMAND, main_menu_handler),
-                        CommandHandler('start', start),
-                        CommandHandler('menu', menu_command),
-                        CommandHandler('contact', contact_command),
-                        CommandHandler('language', language_command)
-                    ],
-                    JOB_SELECTION: [
-                        MessageHandler(filters.TEXT & ~filters.COMMAND, job_selected),
-                        CommandHandler('start', start),
-                        CommandHandler('menu', menu_command),
-                        CommandHandler('contact', contact_command),
-                        CommandHandler('language', language_command)
-                    ],
-                    JOB_DESCRIPTION: [
-                        MessageHandler(filters.TEXT & ~filters.COMMAND, job_description_handler),
-                        CommandHandler('start', start),
-                        CommandHandler('menu', menu_command),
-                        CommandHandler('contact', contact_command),
-                        CommandHandler('language', language_command)
-                    ],
-                    JOB_APPLICATION: [
-                        MessageHandler(filters.TEXT & ~filters.COMMAND, job_application_handler),
-                        CommandHandler('start', start),
-                        CommandHandler('menu', menu_command),
-                        CommandHandler('contact', contact_command),
-                        CommandHandler('language', language_command)
-                    ],
-                    CONTACT_OPTION: [
-                        MessageHandler(filters.TEXT & ~filters.COMMAND, contact_option_handler),
-                        CommandHandler('start', start),
-                        CommandHandler('menu', menu_command),
-                        CommandHandler('contact', contact_command),
-                        CommandHandler('language', language_command)
-                    ],
-                    CONTACT_FORM: [
-                        MessageHandler(filters.TEXT & ~filters.COMMAND, contact_form_handler),
-                        CommandHandler('start', start),
-                        CommandHandler('menu', menu_command),
-                        CommandHandler('contact', contact_command),
-                        CommandHandler('language', language_command)
-                    ],
-                },
-                fallbacks=[
-                    CommandHandler('start', start),
-                    CommandHandler('cancel', cancel),
-                    CommandHandler('contact', contact_command),
-                    CommandHandler('language', language_command)
-                ],
-                conversation_timeout=600,  # 10 minutes timeout for form sessions
-            )
+            worker_pool = WorkerPool(BOT_WORKERS)
+            worker_pool.start()
+            supervisor = asyncio.create_task(worker_pool.supervise(), name="worker-supervisor")
 
-            application.add_handler(conv_handler)
+            # No handlers here: only the bot, the updater and the update queue are used
+            application = Application.builder().token(get_bot_token()).base_url(TELEGRAM_API_BASE_URL).build()
+            await application.initialize()
+            await start_update_delivery(application)
 
-            # Add error handler for uncaught exceptions
-            async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
-                """Log the error and send a telegram message to notify the developer."""
-                logger.error(f"Exception while handling an update: {context.error}")
+            while True:
+                worker_pool.route(await application.update_queue.get())
 
-                if update and hasattr(update, 'effective_user') and update.effective_user:
-                    try:
-                        await context.bot.send_message(
-                            chat_id=update.effective_user.id,
-                            text="Wystąpił nieoczekiwany błąd. Spróbuj ponownie za chwilę."
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to send error message to user: {e}")
+    except KeyboardInterrupt:
+        logger.info("🛑 Bot stopped by user")
+    except Exception as e:
+        logger.error(f"💥 Fatal error in dispatcher: {e}")
+        raise
+    finally:
+        if supervisor:
+            supervisor.cancel()
+        if application:
+            await stop_application(application)
+        if worker_pool:
+            await asyncio.to_thread(worker_pool.stop)
 
-            application.add_error_handler(error_handler)
+async def main() -> None:
+    """Initialize and start the Telegram bot with comprehensive error handling."""
+    if BOT_MODE not in {"polling", "webhook"}:
+        logger.error(f"❌ Unknown BOT_MODE={BOT_MODE!r}; use 'polling' or 'webhook'")
+        return
+    if BOT_MODE == "webhook" and not WEBHOOK_URL:
+        logger.error("❌ BOT_MODE=webhook requires WEBHOOK_URL (the public HTTPS address of this bot)")
+        return
+    if shared_state and BOT_MODE == "webhook" and not os.getenv("WEBHOOK_SECRET_TOKEN"):
+        logger.warning("⚠️ Set WEBHOOK_SECRET_TOKEN when several instances share state: each one registers the webhook")
+    if BOT_WORKERS > 1:
+        return await run_dispatcher()
 
-            # Defensive: ensure webhook mode isn't active (mixed mode can cause confusion).
-            try:
-                await application.bot.delete_webhook(drop_pending_updates=True)
-            except Exception as e:
-                logger.warning(f"Could not delete webhook (continuing): {e}")
+    application = None
+    tasks = []
+    # Only one getUpdates consumer may run per token; webhook delivery has no such limit
+    instance_lock = single_instance_lock() if BOT_MODE == "polling" else contextlib.nullcontext()
+    try:
+        with instance_lock:
+            if not await start_services(tasks):
+                logger.error("❌ Startup checks failed. Exiting.")
+                return
 
-            logger.info("🤖 Bot is starting polling...")
+            application = build_application()
 
             # Initialize and start the application manually for proper async handling
             await application.initialize()
             await application.start()
-            await application.updater.start_polling(
-                allowed_updates=Update.ALL_TYPES,
-                drop_pending_updates=True,
-                poll_interval=1.0,
-                timeout=10
-            )
+            await broadcasts.start(application.bot)
+            await start_update_delivery(application)
 
             # Keep the bot running until interrupted
             await asyncio.Future()
@@ -1388,14 +4942,8 @@ async def main() -> None:
     finally:
         # Ensure proper cleanup
         if application:
-            try:
-                logger.info("🔄 Shutting down bot...")
-                await application.updater.stop()
-                await application.stop()
-                await application.shutdown()
-                logger.info("✅ Bot shutdown complete")
-            except Exception as e:
-                logger.error(f"Error during shutdown: {e}")
+            await stop_application(application)
+        await stop_services(tasks)
 
 if __name__ == '__main__':
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
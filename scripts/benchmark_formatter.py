@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the job description renderer.
+Renders every job section of every JobDescriptions/*.md file with the single-pass
+HTML renderer from bot.py and with a copy of the legacy Markdown formatter it
+replaced, and reports the time per description and per full rebuild.
+
+Usage:
+    python scripts/benchmark_formatter.py [iterations]
+"""
+
+import logging
+import os
+import re
+import sys
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SCRIPTS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+# bot.py validates its environment at import time; nothing is contacted here
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("STORAGE_SYNC_TO_SHEETS", "0")
+
+import bot  # noqa: E402
+
+logging.getLogger("bot").setLevel(logging.ERROR)
+
+
+def legacy_format_job_description(content: str, language: str) -> str:
+    """The formatter bot.py used before the HTML renderer (legacy Markdown output), kept verbatim."""
+    try:
+        lines = content.split('\n')
+        formatted_lines = []
+        
+        # Emoji mappings for different job types
+        job_emojis = {
+            'pl': {
+                'Pracownik działu mięsnego w supermarkecie': '🥩',
+                'Pracownik w supermarkecie': '🏪',
+                'Kasjer do supermarketu': '🛒',
+                'Brygadzista na produkcję mięsną': '👷‍♂️',
+                'Pracownik produkcji': '🏭'
+            },
+            'ua': {
+                'Працівник м\'ясного відділу в супермаркеті': '🥩',
+                'Працівник супермаркету': '🏪',
+                'Касир до супермаркету': '🛒',
+                'Бригадир на м\'ясному виробництві': '👷‍♂️',
+                'Працівник виробництва': '🏭'
+            },
+            'ru': {
+                'Работник мясного отдела в супермаркете': '🥩',
+                'Работник супермаркета': '🏪',
+                'Кассир в супермаркет': '🛒',
+                'Бригадир на мясном производстве': '👷‍♂️',
+                'Работник производства': '🏭'
+            },
+            'en': {
+                'Meat Department Worker in Supermarket': '🥩',
+                'Supermarket Worker': '🏪',
+                'Supermarket Cashier': '🛒',
+                'Foreman in Meat Production': '👷‍♂️',
+                'Production Worker': '🏭'
+            }
+        }
+        
+        # Section emoji mappings
+        section_emojis = {
+            'pl': {
+                'Co dla nas jest ważne': '⚡',
+                'Co możemy Ci zaoferować': '💰',
+                'Co możemy Tobie zaoferować': '💰',
+                'Zapraszamy do udziału w rekrutacji': '📝',
+                'Obowiązki Brygadzisty': '📋'
+            },
+            'ua': {
+                'Що для нас важливо': '⚡',
+                'Що ми можемо Вам запропонувати': '💰',
+                'Запрошуємо до участі в рекрутації': '📝',
+                'Обов\'язки Бригадира': '📋'
+            },
+            'ru': {
+                'Что для нас важно': '⚡',
+                'Что мы можем Вам предложить': '💰',
+                'Приглашаем к участию в рекрутинге': '📝',
+                'Обязанности Бригадира': '📋'
+            },
+            'en': {
+                'What is important to us': '⚡',
+                'What we can offer you': '💰',
+                'We invite you to participate in recruitment': '📝',
+                'Foreman Duties': '📋'
+            }
+        }
+        
+        for line in lines:
+            # Handle main job titles (# Title)
+            if line.startswith('# '):
+                title = line[2:].strip()
+                emoji = job_emojis.get(language, {}).get(title, '💼')
+                formatted_lines.append(f"{emoji} *{title}*")
+                formatted_lines.append("")  # Add spacing
+                
+            # Handle section headers (## Section)
+            elif line.startswith('## '):
+                section = line[3:].strip()
+                emoji = section_emojis.get(language, {}).get(section, '▫️')
+                formatted_lines.append(f"{emoji} *{section}*")
+                formatted_lines.append("")  # Add spacing
+                
+            # Handle horizontal rules (---)
+            elif line.strip() == '---':
+                formatted_lines.append("━━━━━")
+                formatted_lines.append("")  # Add spacing
+                
+            # Handle main bullet points
+            elif line.startswith('- '):
+                bullet_text = line[2:].strip()
+                formatted_lines.append(f"• {bullet_text}")
+                
+            # Handle sub-bullet points (indented)
+            elif line.startswith('  - '):
+                sub_bullet_text = line[4:].strip()
+                formatted_lines.append(f"    ▪️ {sub_bullet_text}")
+                
+            # Handle regular lines
+            elif line.strip():
+                formatted_lines.append(line)
+                
+            # Handle empty lines
+            else:
+                formatted_lines.append("")
+        
+        # Join lines and clean up multiple consecutive empty lines
+        result = '\n'.join(formatted_lines)
+        
+        # Replace multiple consecutive newlines with maximum 2
+        result = re.sub(r'\n{3,}', '\n\n', result)
+        
+        # Add some final formatting touches
+        result = result.strip()
+        
+        return result
+        
+    except Exception:
+        return content  # Return original content if formatting fails
+
+
+def load_sections() -> list:
+    """(language, markdown section) for every job in every description file."""
+    sections = []
+    for lang, suffix in bot.JOB_DESCRIPTION_FILES.items():
+        path = os.path.join(REPO_DIR, bot.JOB_DESCRIPTIONS_DIR, f"Job_descriptions_{suffix}.md")
+        with open(path, 'r', encoding='utf-8') as file:
+            content = file.read()
+        sections.extend((lang, section) for section in bot.split_job_sections(content).values())
+    return sections
+
+
+def bench(render, sections: list, iterations: int) -> float:
+    """Seconds per rendered description."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for lang, section in sections:
+            render(section, lang)
+    return (time.perf_counter() - started) / (iterations * len(sections))
+
+
+def main(iterations: int) -> None:
+    sections = load_sections()
+    invalid = [
+        lang for lang, section in sections
+        if bot.validate_telegram_html(bot.render_job_description_html(section, lang))
+    ]
+    print(f"📊 {len(sections)} descriptions x {iterations} iterations ({len(invalid)} fail HTML validation)\n")
+    print(f"{'renderer':<16} {'us/description':>15} {'ms/full rebuild':>16}")
+    results = {}
+    for name, render in (("legacy markdown", legacy_format_job_description),
+                         ("html single-pass", bot.render_job_description_html)):
+        per_description = bench(render, sections, iterations)
+        results[name] = per_description
+        print(f"{name:<16} {per_description * 1e6:>15.1f} {per_description * len(sections) * 1e3:>16.2f}")
+    print(f"\nspeed-up: {results['legacy markdown'] / results['html single-pass']:.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Allocation benchmark for reply keyboards.
+Replays the keyboards a typical conversation sends (menu, job list, job
+description, form prompts) and measures, with tracemalloc, how many memory
+blocks each keyboard costs when it is rebuilt per message (as handlers used to
+do) versus looked up in the prebuilt registry from bot.py.
+
+Usage:
+    python scripts/benchmark_keyboards.py [messages]
+"""
+
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPTS_DIR))
+
+# bot.py validates its environment at import time; nothing is contacted here
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("STORAGE_SYNC_TO_SHEETS", "0")
+
+import bot  # noqa: E402
+from telegram import ReplyKeyboardMarkup  # noqa: E402
+
+logging.getLogger("bot").setLevel(logging.ERROR)
+
+# Keyboards in the order a candidate sees them while applying for a job
+CONVERSATION = ['main_menu', 'job_list', 'job_description', 'cancel', 'yes_no', 'cancel', 'main_menu']
+LANGUAGES = list(bot.TRANSLATIONS)
+
+
+def rebuild(lang: str, name: str) -> ReplyKeyboardMarkup:
+    """What handlers did before the registry: build the rows and the markup for every message."""
+    get_text = bot.get_text
+    if name == 'main_menu':
+        keyboard = [[get_text(lang, 'check_jobs')], [get_text(lang, 'contact_us')]]
+    elif name == 'job_list':
+        keyboard = [[job] for job in bot.job_catalog.titles(lang)]
+        keyboard.append([get_text(lang, 'back')])
+    elif name == 'job_description':
+        keyboard = [[get_text(lang, 'apply_for_job')], [get_text(lang, 'back')]]
+    elif name == 'yes_no':
+        keyboard = [[get_text(lang, 'yes'), get_text(lang, 'no')], [get_text(lang, 'cancel')]]
+    else:
+        keyboard = [[get_text(lang, name)]]
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+
+def measure(get_keyboard, messages: int) -> tuple:
+    """(allocated blocks per message, microseconds per message); markups are kept alive to count them."""
+    plan = [(LANGUAGES[i % len(LANGUAGES)], CONVERSATION[i % len(CONVERSATION)]) for i in range(messages)]
+    sent = [None] * messages
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i, (lang, name) in enumerate(plan):
+        sent[i] = get_keyboard(lang, name)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+
+    started = time.perf_counter()
+    for lang, name in plan:
+        get_keyboard(lang, name)
+    elapsed = time.perf_counter() - started
+    return blocks / messages, elapsed / messages * 1e6
+
+
+def main(messages: int) -> None:
+    print(f"📊 {messages} keyboards across {len(LANGUAGES)} languages\n")
+    print(f"{'keyboards':<10} {'blocks/message':>15} {'us/message':>11}")
+    for label, get_keyboard in (("rebuilt", rebuild), ("registry", bot.keyboards.get)):
+        blocks, micros = measure(get_keyboard, messages)
+        print(f"{label:<10} {blocks:>15.1f} {micros:>11.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for per-user session state.
+Builds the same simulated users twice, once as the dict-of-dicts user_data the bot used to
+keep and once as UserSession records, and reports the bytes each active session holds
+(measured with tracemalloc, answers included) and the size of its persisted form.
+
+Usage:
+    python scripts/benchmark_sessions.py [users]
+"""
+
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# bot.py validates its environment at import time
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+os.environ.setdefault("GOOGLE_SHEET_ID", "benchmark")
+os.environ.setdefault("GOOGLE_CREDENTIALS_BASE64", "benchmark")
+
+import bot  # noqa: E402
+
+STEPS = list(bot.FormStep)[:6]  # the job application form
+
+
+def answers(index: int) -> dict:
+    """Form answers of simulated user `index`; users are spread over every step of the form."""
+    values = {
+        'name': f'Jan Kowalski {index}',
+        'country': 'Ukraina',
+        'phone': f'+48 500 {index % 1000:03d} {index % 997:03d}',
+        'telegram_phone': f'+48 600 {index % 1000:03d} {index % 991:03d}',
+        'accommodation': 'Tak',
+        'city': 'Warszawa',
+    }
+    return dict(list(values.items())[:index % len(STEPS)])
+
+
+def dict_session(index: int) -> dict:
+    """user_data as the handlers used to keep it."""
+    return {
+        'user_id': 100000 + index,
+        'language': ('pl', 'ua', 'ru')[index % 3],
+        'selected_job': 'Pracownik produkcji',
+        'form_step': STEPS[index % len(STEPS)].name.lower(),
+        'form_data': answers(index),
+    }
+
+
+def slotted_session(index: int) -> "bot.UserSession":
+    session = bot.UserSession()
+    session.start_form(100000 + index)
+    session.language = bot.Language(index % 3)
+    session.selected_job = 'Pracownik produkcji'
+    session.form_step = STEPS[index % len(STEPS)]
+    session.form = bot.FormData(**answers(index))
+    return session
+
+
+def measure(factory, users: int) -> tuple:
+    """Build `users` sessions; returns them and the bytes allocated per session."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = [factory(index) for index in range(users)]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # The list holding the sessions is not part of them
+    return sessions, (allocated - sys.getsizeof(sessions)) / users
+
+
+def timed(function, items: list) -> tuple:
+    started = time.perf_counter()
+    results = [function(item) for item in items]
+    return results, (time.perf_counter() - started) / len(items) * 1e6
+
+
+def main(users: int) -> None:
+    print(f"📊 {users} simulated active users\n")
+    dicts, dict_bytes = measure(dict_session, users)
+    slotted, slotted_bytes = measure(slotted_session, users)
+
+    json_records, json_us = timed(lambda data: json.dumps(data, ensure_ascii=False, sort_keys=True), dicts)
+    binary_records, binary_us = timed(bot.UserSession.to_bytes, slotted)
+    _, json_load_us = timed(json.loads, json_records)
+    _, binary_load_us = timed(bot.UserSession.from_bytes, binary_records)
+    json_size = sum(len(record.encode('utf-8')) for record in json_records) / users
+    binary_size = sum(len(record) for record in binary_records) / users
+
+    assert all(
+        bot.build_application_row(bot.UserSession.from_dict(data))[1:]
+        == bot.build_application_row(bot.UserSession.from_bytes(record))[1:]
+        for data, record in zip(dicts[:1000], binary_records)
+    ), "binary records must round-trip"
+
+    print(f"{'':<16} {'in memory':>12} {'persisted':>12} {'save µs':>9} {'load µs':>9}")
+    print(f"{'dict user_data':<16} {dict_bytes:>10.0f} B {json_size:>10.0f} B {json_us:>9.2f} {json_load_us:>9.2f}")
+    print(f"{'UserSession':<16} {slotted_bytes:>10.0f} B {binary_size:>10.0f} B {binary_us:>9.2f} {binary_load_us:>9.2f}")
+    print(f"\nper {users} users: {dict_bytes * users / 1048576:.1f} MiB -> {slotted_bytes * users / 1048576:.1f} MiB in memory")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
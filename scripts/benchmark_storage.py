@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the submission storage backends.
+Runs the same synthetic workload (concurrent job applications) against the
+SQLite, CSV, JSONL and Google Sheets backends. The Sheets backend talks to the
+in-memory stand-in from fake_sheets_server.py, so no credentials are needed and
+the numbers show the bot-side overhead (journal, batching, HTTP), not Google's.
+
+Usage:
+    python scripts/benchmark_storage.py [rows] [concurrency]
+"""
+
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, os.path.dirname(SCRIPTS_DIR))
+
+import fake_sheets_server  # noqa: E402
+
+FAKE_PORT = 8766
+
+# bot.py validates its environment at import time; point it at the stand-in server
+# and lift the quota so the benchmark measures the pipeline, not the rate limiter.
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+os.environ.setdefault("GOOGLE_SHEET_ID", "benchmark")
+os.environ.setdefault("GOOGLE_CREDENTIALS_BASE64", "benchmark")
+os.environ["GOOGLE_SHEETS_CLIENT"] = "async"
+os.environ["SHEETS_API_BASE_URL"] = f"http://127.0.0.1:{FAKE_PORT}/v4"
+os.environ["SHEETS_WRITE_QUOTA_PER_MINUTE"] = "1000000"
+os.environ["SHEETS_READ_QUOTA_PER_MINUTE"] = "1000000"
+
+import bot  # noqa: E402
+
+# Per-batch INFO logs and expected backpressure warnings would drown the results
+logging.getLogger("bot").setLevel(logging.ERROR)
+
+
+def synthetic_user_data(index: int) -> "bot.UserSession":
+    """A completed job application as it sits in context.user_data."""
+    session = bot.UserSession()
+    session.start_form(100000 + index)
+    session.language = bot.Language(index % 3)
+    session.selected_job = 'Pracownik produkcji'
+    session.form = bot.FormData(
+        name=f'Jan Kowalski {index}',
+        country='Ukraina',
+        phone=f'+48 500 {index % 1000:03d} 000',
+        telegram_phone=f'+48 600 {index % 1000:03d} 000',
+        accommodation='Tak',
+        city='Warszawa',
+    )
+    return session
+
+
+async def run_workload(backend, rows: int, concurrency: int) -> dict:
+    """Save `rows` applications from `concurrency` concurrent users; return timings."""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def submit(index: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            ok = await backend.save(bot.APPLICATIONS_TABLE, bot.build_application_row(synthetic_user_data(index)))
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                raise RuntimeError(f"{backend.name}: save failed")
+
+    await backend.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(submit(i) for i in range(rows)))
+    accepted = time.perf_counter() - started
+    await backend.stop()
+    durable = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "accepted_rows_per_s": rows / accepted,
+        "durable_rows_per_s": rows / durable,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def make_backends(directory: str) -> list:
+    sheets_queue = bot.SheetsWriteQueue(
+        bot.SHEETS_BATCH_SIZE,
+        bot.SHEETS_FLUSH_INTERVAL,
+        bot.SHEETS_QUEUE_MAX_SIZE,
+        bot.SubmissionJournal(os.path.join(directory, "journal.sqlite3")),
+    )
+    return [
+        bot.SQLiteStorage(os.path.join(directory, "store.sqlite3")),
+        bot.FileStorage(os.path.join(directory, "csv"), "csv"),
+        bot.FileStorage(os.path.join(directory, "jsonl"), "jsonl"),
+        bot.SheetsStorage(sheets_queue),
+    ]
+
+
+async def main(rows: int, concurrency: int) -> None:
+    server = fake_sheets_server.create_server(FAKE_PORT)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            print(f"📊 {rows} applications, {concurrency} concurrent users\n")
+            print(f"{'backend':<8} {'accepted/s':>12} {'durable/s':>12} {'mean ms':>9} {'p95 ms':>9}")
+            for backend in make_backends(directory):
+                result = await run_workload(backend, rows, concurrency)
+                print(
+                    f"{backend.name:<8} {result['accepted_rows_per_s']:>12.0f} {result['durable_rows_per_s']:>12.0f} "
+                    f"{result['mean_ms']:>9.2f} {result['p95_ms']:>9.2f}"
+                )
+            print("\naccepted/s: rows acknowledged to users; durable/s: rows written to the final store")
+    finally:
+        await bot.close_google_sheets()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    asyncio.run(main(rows, concurrency))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Self-check for the per-user locks of the shared state (STATE_BACKEND=redis/memory).
+Runs two SharedState instances against one InMemoryRedis, as two bot instances behind one
+webhook would share Redis, and checks that a user's lock only ever is released by the
+instance holding it and that no instance handles an update it could not lock.
+
+Usage:
+    python scripts/check_shared_state.py
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# bot.py validates its environment at import time
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "check")
+os.environ.setdefault("GOOGLE_SHEET_ID", "check")
+os.environ.setdefault("GOOGLE_CREDENTIALS_BASE64", "check")
+
+from telegram import Chat, Message, Update, User  # noqa: E402
+
+import bot  # noqa: E402
+
+USER_ID = 424242
+LOCK_KEY = f"check:lock:{USER_ID}"
+
+
+def make_update(update_id: int) -> Update:
+    user = User(USER_ID, "Check", False)
+    return Update(update_id, message=Message(update_id, datetime.now(), Chat(USER_ID, "private"), from_user=user))
+
+
+def make_instance(client: bot.InMemoryRedis, lock_seconds: float) -> bot.SharedState:
+    return bot.SharedState(client, "check", 3600, lock_seconds)
+
+
+class BrokenRedis(bot.InMemoryRedis):
+    def pipeline(self, transaction: bool = True):
+        raise ConnectionError("store unreachable")
+
+
+async def release_only_own_lock() -> None:
+    client = bot.InMemoryRedis()
+    first, second = make_instance(client, 5), make_instance(client, 5)
+    assert await first.load_session(make_update(1), bot.UserSession(), {})
+    # The second instance never took the lock, so saving there must leave it alone
+    await second.save_session(make_update(2), bot.UserSession(), {})
+    assert await client.get(LOCK_KEY) == first._token.encode(), "another instance's lock was released"
+    await first.save_session(make_update(1), bot.UserSession(), {})
+    assert await client.get(LOCK_KEY) is None, "the holder could not release its own lock"
+    print("✅ an instance releases only the lock it holds")
+
+
+async def late_save_keeps_new_lock() -> None:
+    client = bot.InMemoryRedis()
+    slow, other = make_instance(client, 0.1), make_instance(client, 5)
+    assert await slow.load_session(make_update(1), bot.UserSession(), {})
+    await asyncio.sleep(0.15)  # the handler outlives its lock
+    assert await other.load_session(make_update(2), bot.UserSession(), {})
+    await slow.save_session(make_update(1), bot.UserSession(), {})
+    assert await client.get(LOCK_KEY) == other._token.encode(), "an expired holder released the new lock"
+    assert slow.locks_lost == 1
+    print("✅ an update that outlived its lock does not free the next holder's lock")
+
+
+async def no_update_runs_unlocked() -> None:
+    client = bot.InMemoryRedis()
+    holder, waiter = make_instance(client, 5), make_instance(client, 0.2)
+    session = bot.UserSession()
+    session.language = bot.Language.UA
+    assert await holder.load_session(make_update(1), session, {})
+    await holder.save_session(make_update(1), session, {})
+    assert await holder.load_session(make_update(2), bot.UserSession(), {})
+
+    loaded = bot.UserSession()
+    assert not await waiter.load_session(make_update(3), loaded, {}), "the update ran without the lock"
+    assert waiter.lock_timeouts == 1 and loaded.language != bot.Language.UA
+    assert not await make_instance(BrokenRedis(), 5).load_session(make_update(4), bot.UserSession(), {})
+
+    await holder.save_session(make_update(2), session, {})
+    assert await waiter.load_session(make_update(5), loaded, {}) and loaded.language == bot.Language.UA
+    print("✅ an update is dropped, not run unlocked, when its user's lock cannot be taken")
+
+
+async def main() -> None:
+    await release_only_own_lock()
+    await late_save_keeps_new_lock()
+    await no_update_runs_unlocked()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Telegram Bot API.
+Implements the methods the bot uses at startup and for replies (getMe, setWebhook,
+deleteWebhook, getWebhookInfo, sendMessage) in memory, and delivers test updates to
+the registered webhook with its secret token, so webhook mode can be exercised end
+to end without a real bot token or a public HTTPS address.
+
+Extra endpoints for tests:
+    POST /_fake/updates    body is an Update (JSON); forwarded to the webhook,
+                           replies with the webhook's HTTP status
+    GET  /_fake/messages   messages sent by the bot so far
+    POST /_fake/flood      {"count": n, "retry_after": s}: answer the next n
+                           sendMessage calls with 429 Too Many Requests
+    POST /_fake/block      {"chat_ids": [...]}: these users have blocked the bot
+                           (sendMessage answers 403 Forbidden)
+
+Usage:
+    python scripts/fake_bot_api.py [port]
+    # then run the bot with TELEGRAM_API_BASE_URL=http://127.0.0.1:<port>/bot
+    #                       BOT_MODE=webhook WEBHOOK_URL=http://127.0.0.1:8080
+"""
+
+import json
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PORT = 8081
+
+METHOD_PATH = re.compile(r"^/bot([^/]+)/(\w+)$")
+
+
+class FakeBotState:
+    """Registered webhook and everything the bot has sent."""
+
+    def __init__(self):
+        self.webhook_url = ""
+        self.secret_token = ""
+        self.messages = []
+        self.flood_count = 0
+        self.flood_retry_after = 1
+        self.blocked_chats = set()
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def deliver(self, update: dict) -> int:
+        """POST an update to the registered webhook; return the HTTP status."""
+        with self.lock:
+            url, secret_token = self.webhook_url, self.secret_token
+        if not url:
+            return 409
+        request = urllib.request.Request(
+            url,
+            data=json.dumps(update).encode("utf-8"),
+            headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret_token},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class FakeBotHandler(BaseHTTPRequestHandler):
+    """Request handler; keep-alive is enabled so pooled connections are reused."""
+
+    protocol_version = "HTTP/1.1"
+    state: FakeBotState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _ok(self, result) -> None:
+        self._send_json(200, {"ok": True, "result": result})
+
+    def _error(self, status: int, description: str) -> None:
+        self._send_json(status, {"ok": False, "error_code": status, "description": description})
+
+    def _parameters(self) -> dict:
+        """Bot API parameters; the bot sends form fields with JSON-encoded values, tests send JSON."""
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(body or "{}")
+        parameters = {}
+        for name, values in parse_qs(body).items():
+            try:
+                parameters[name] = json.loads(values[0])
+            except ValueError:
+                parameters[name] = values[0]
+        return parameters
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/_fake/messages":
+            with self.state.lock:
+                return self._send_json(200, list(self.state.messages))
+        self._error(404, "Not Found")
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        parameters = self._parameters()
+        with self.state.lock:
+            self.state.requests += 1
+
+        if path == "/_fake/updates":
+            return self._send_json(200, {"status": self.state.deliver(parameters)})
+        if path == "/_fake/flood":
+            with self.state.lock:
+                self.state.flood_count = int(parameters.get("count", 1))
+                self.state.flood_retry_after = int(parameters.get("retry_after", 1))
+            return self._send_json(200, {"ok": True})
+        if path == "/_fake/block":
+            with self.state.lock:
+                self.state.blocked_chats.update(int(chat_id) for chat_id in parameters.get("chat_ids", []))
+            return self._send_json(200, {"ok": True})
+
+        match = METHOD_PATH.match(path)
+        if not match:
+            return self._error(404, "Not Found")
+        method = match.group(2)
+
+        with self.state.lock:
+            if method == "getMe":
+                return self._ok({"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"})
+            if method == "setWebhook":
+                self.state.webhook_url = parameters.get("url", "")
+                self.state.secret_token = parameters.get("secret_token", "")
+                return self._ok(True)
+            if method == "deleteWebhook":
+                self.state.webhook_url = self.state.secret_token = ""
+                return self._ok(True)
+            if method == "getWebhookInfo":
+                return self._ok({"url": self.state.webhook_url, "has_custom_certificate": False,
+                                 "pending_update_count": 0})
+            if method == "sendMessage" and self.state.flood_count > 0:
+                self.state.flood_count -= 1
+                retry_after = self.state.flood_retry_after
+                return self._send_json(429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                })
+            if method == "sendMessage" and int(parameters["chat_id"]) in self.state.blocked_chats:
+                return self._error(403, "Forbidden: bot was blocked by the user")
+            if method == "sendMessage":
+                message = {
+                    "message_id": len(self.state.messages) + 1,
+                    "date": int(time.time()),
+                    "chat": {"id": int(parameters["chat_id"]), "type": "private"},
+                    "text": parameters.get("text", ""),
+                }
+                self.state.messages.append({**message, "reply_markup": parameters.get("reply_markup")})
+                return self._ok(message)
+        self._error(404, f"Method {method} is not supported by the fake Bot API")
+
+
+def create_server(port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """Create (but do not start) a fake Bot API server bound to 127.0.0.1."""
+    handler = type("BoundFakeBotHandler", (FakeBotHandler,), {"state": FakeBotState()})
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    server = create_server(port)
+    print(f"🧪 Fake Bot API listening on http://127.0.0.1:{port}/bot")
+    print(f"   Point the bot at it with TELEGRAM_API_BASE_URL=http://127.0.0.1:{port}/bot")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Fake Bot API stopped")
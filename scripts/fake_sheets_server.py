@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Google Sheets v4 API.
+Implements the endpoints the bot uses (spreadsheet metadata, addSheet
+batchUpdate, values append/update/batchGet) in memory, so the async Sheets client can be exercised
+without Google credentials or network access.
+
+Usage:
+    python scripts/fake_sheets_server.py [port] [worksheet ...]
+"""
+
+import json
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+DEFAULT_PORT = 8765
+DEFAULT_WORKSHEETS = ["Applications", "Contacts"]
+
+SPREADSHEET_PATH = re.compile(r"^/v4/spreadsheets/([^/:]+)$")
+APPEND_PATH = re.compile(r"^/v4/spreadsheets/([^/]+)/values/(.+):append$")
+BATCH_GET_PATH = re.compile(r"^/v4/spreadsheets/([^/]+)/values:batchGet$")
+BATCH_UPDATE_PATH = re.compile(r"^/v4/spreadsheets/([^/:]+):batchUpdate$")
+VALUES_PATH = re.compile(r"^/v4/spreadsheets/([^/]+)/values/([^:]+)$")
+
+
+def _worksheet_title(a1_range: str) -> str:
+    """Extract the worksheet title from an A1 range such as 'Applications'!A1:J."""
+    title = a1_range.split("!", 1)[0]
+    if title.startswith("'") and title.endswith("'"):
+        title = title[1:-1].replace("''", "'")
+    return title
+
+
+class FakeSheetsState:
+    """In-memory spreadsheets: {spreadsheet_id: {worksheet_title: [rows]}}."""
+
+    def __init__(self, worksheets):
+        self.worksheets = list(worksheets)
+        self.spreadsheets = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def spreadsheet(self, spreadsheet_id: str) -> dict:
+        if spreadsheet_id not in self.spreadsheets:
+            self.spreadsheets[spreadsheet_id] = {title: [] for title in self.worksheets}
+        return self.spreadsheets[spreadsheet_id]
+
+
+class FakeSheetsHandler(BaseHTTPRequestHandler):
+    """Request handler; keep-alive is enabled so pooled connections are reused."""
+
+    protocol_version = "HTTP/1.1"
+    state: FakeSheetsState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str) -> None:
+        self._send_json(status, {"error": {"code": status, "message": message}})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        with self.state.lock:
+            self.state.requests += 1
+            match = SPREADSHEET_PATH.match(url.path)
+            if match:
+                spreadsheet = self.state.spreadsheet(match.group(1))
+                sheets = [
+                    {"properties": {"sheetId": index, "title": title}}
+                    for index, title in enumerate(spreadsheet)
+                ]
+                return self._send_json(200, {
+                    "spreadsheetId": match.group(1),
+                    "properties": {"title": "Fake spreadsheet"},
+                    "sheets": sheets,
+                })
+
+            match = BATCH_GET_PATH.match(url.path)
+            if match:
+                spreadsheet = self.state.spreadsheet(match.group(1))
+                value_ranges = []
+                for a1_range in parse_qs(url.query).get("ranges", []):
+                    title = _worksheet_title(a1_range)
+                    if title not in spreadsheet:
+                        return self._send_error(400, f"Unable to parse range: {a1_range}")
+                    value_ranges.append({"range": a1_range, "values": [list(row) for row in spreadsheet[title]]})
+                return self._send_json(200, {"spreadsheetId": match.group(1), "valueRanges": value_ranges})
+
+        self._send_error(404, "Not found")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        with self.state.lock:
+            self.state.requests += 1
+            match = APPEND_PATH.match(url.path)
+            if match:
+                spreadsheet = self.state.spreadsheet(match.group(1))
+                title = _worksheet_title(unquote(match.group(2)))
+                if title not in spreadsheet:
+                    return self._send_error(400, f"Unable to parse range: {title}")
+                rows = payload.get("values", [])
+                spreadsheet[title].extend(rows)
+                return self._send_json(200, {
+                    "spreadsheetId": match.group(1),
+                    "updates": {"updatedRows": len(rows)},
+                })
+
+            match = BATCH_UPDATE_PATH.match(url.path)
+            if match:
+                spreadsheet = self.state.spreadsheet(match.group(1))
+                replies = []
+                for request in payload.get("requests", []):
+                    if "addSheet" not in request:
+                        return self._send_error(400, "Only addSheet requests are supported")
+                    properties = dict(request["addSheet"].get("properties", {}))
+                    if properties.get("title") in spreadsheet:
+                        return self._send_error(400, f"A sheet with the name \"{properties['title']}\" already exists")
+                    properties["sheetId"] = len(spreadsheet)
+                    spreadsheet[properties["title"]] = []
+                    replies.append({"addSheet": {"properties": properties}})
+                return self._send_json(200, {"spreadsheetId": match.group(1), "replies": replies})
+
+        self._send_error(404, "Not found")
+
+    def do_PUT(self):
+        """Values update; only ranges starting in column A are supported."""
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        with self.state.lock:
+            self.state.requests += 1
+            match = VALUES_PATH.match(url.path)
+            if match:
+                spreadsheet = self.state.spreadsheet(match.group(1))
+                a1_range = unquote(match.group(2))
+                title = _worksheet_title(a1_range)
+                start = re.match(r"A(\d+)", a1_range.split("!", 1)[1] if "!" in a1_range else "A1")
+                if title not in spreadsheet or not start:
+                    return self._send_error(400, f"Unable to parse range: {a1_range}")
+                rows = spreadsheet[title]
+                first = int(start.group(1)) - 1
+                values = payload.get("values", [])
+                rows.extend([] for _ in range(first + len(values) - len(rows)))
+                rows[first:first + len(values)] = [list(row) for row in values]
+                return self._send_json(200, {"spreadsheetId": match.group(1), "updatedRows": len(values)})
+
+        self._send_error(404, "Not found")
+
+
+def create_server(port: int = DEFAULT_PORT, worksheets=DEFAULT_WORKSHEETS) -> ThreadingHTTPServer:
+    """Create (but do not start) a fake Sheets server bound to 127.0.0.1."""
+    handler = type("BoundFakeSheetsHandler", (FakeSheetsHandler,), {"state": FakeSheetsState(worksheets)})
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    worksheets = sys.argv[2:] or DEFAULT_WORKSHEETS
+    server = create_server(port, worksheets)
+    print(f"🧪 Fake Sheets API listening on http://127.0.0.1:{port}/v4 (worksheets: {', '.join(worksheets)})")
+    print(f"   Point the bot at it with SHEETS_API_BASE_URL=http://127.0.0.1:{port}/v4")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Fake Sheets API stopped")
@@ -2,11 +2,18 @@
 """
 Setup script to initialize Google Sheets with proper headers.
 Run this once before starting the bot to create required worksheets.
+
+With SHEETS_PARTITIONING=monthly, `--partitions N` also pre-creates the monthly
+worksheets (e.g. Applications_2026_10) for the current and next N-1 months, and
+`--summary` turns the base worksheets into QUERY views over every partition.
 """
 
+import argparse
 import os
+import re
 import json
 import base64
+from datetime import datetime
 from dotenv import load_dotenv
 import gspread
 from google.oauth2.service_account import Credentials
@@ -35,7 +42,44 @@ def get_google_credentials():
     except Exception as e:
         raise Exception(f"Failed to load Google credentials: {e}")
 
-def setup_google_sheets():
+def upcoming_months(count):
+    """(year, month) for the current month and the next count-1 months."""
+    today = datetime.now()
+    months = []
+    for offset in range(count):
+        index = today.year * 12 + today.month - 1 + offset
+        months.append((index // 12, index % 12 + 1))
+    return months
+
+def setup_partitions(sheet, base_name, headers, months):
+    """Create monthly partitions of a worksheet with the header row."""
+    existing = {worksheet.title for worksheet in sheet.worksheets()}
+    for year, month in months:
+        name = f"{base_name}_{year}_{month:02d}"
+        if name in existing:
+            print(f"Found existing '{name}' sheet")
+            continue
+        partition = sheet.add_worksheet(title=name, rows=1000, cols=len(headers))
+        partition.append_row(headers)
+        print(f"Created '{name}' sheet")
+
+def setup_summary_view(sheet, base_name, headers):
+    """Write a QUERY formula into the base worksheet stacking every monthly partition."""
+    titles = [worksheet.title for worksheet in sheet.worksheets()]
+    partitions = sorted(title for title in titles if re.fullmatch(rf"{re.escape(base_name)}_\d{{4}}_\d{{2}}", title))
+    if f"{base_name}_archive" in titles:
+        partitions.insert(0, f"{base_name}_archive")
+    if not partitions:
+        print(f"No partitions of '{base_name}' yet; skipping summary view")
+        return
+    last_column = gspread.utils.rowcol_to_a1(1, len(headers)).rstrip('0123456789')
+    ranges = "; ".join(f"'{name}'!A2:{last_column}" for name in partitions)
+    base_sheet = sheet.worksheet(base_name)
+    base_sheet.update([[f'=QUERY({{{ranges}}}, "select * where Col1 is not null", 0)']], "A2",
+                      value_input_option="USER_ENTERED")
+    print(f"Summary view '{base_name}' covers {len(partitions)} sheet(s)")
+
+def setup_google_sheets(partitions=0, summary=False):
     """Initialize Google Sheets with proper headers for Applications and Contacts."""
     try:
         # Connect to Google Sheets
@@ -109,6 +153,14 @@ def setup_google_sheets():
         except:
             contacts_sheet.insert_row(contacts_headers, 1)
             print(f"Added headers to '{CONTACTS_SHEET_NAME}' sheet")
+
+        # Monthly partitions (SHEETS_PARTITIONING=monthly)
+        for base_name, headers in ((APPLICATIONS_SHEET_NAME, applications_headers),
+                                   (CONTACTS_SHEET_NAME, contacts_headers)):
+            if partitions:
+                setup_partitions(sheet, base_name, headers, upcoming_months(partitions))
+            if summary:
+                setup_summary_view(sheet, base_name, headers)
         
         print("\n✅ Google Sheets setup completed successfully!")
         print(f"📊 Sheet URL: https://docs.google.com/spreadsheets/d/{SHEET_ID}")
@@ -120,5 +172,12 @@ def setup_google_sheets():
     return True
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--partitions", type=int, default=0, metavar="N",
+                        help="pre-create monthly partitions for the current and next N-1 months")
+    parser.add_argument("--summary", action="store_true",
+                        help="write QUERY summary views over the partitions into the base sheets")
+    args = parser.parse_args()
+
     print("🚀 Setting up Google Sheets for Telegram Bot...")
-    setup_google_sheets() 
\ No newline at end of file
+    setup_google_sheets(args.partitions, args.summary) 
\ No newline at end of file